@@ -6,7 +6,13 @@
  *  - La app escribe en `notifications` -> sendImmediateNotification envía.
  *  - La app agenda en `scheduled_notifications` ->
  *    processScheduledNotifications (cada minuto) envía los vencidos.
- *  - cleanupOldNotifications borra los enviados hace más de 30 días.
+ *  - Al enviarse, cada doc recibe `expireAt` (sentAt + 30 días) para que la
+ *    política TTL de Firestore lo borre. Si el envío falla, el doc queda
+ *    pendiente y recibe expireAt = scheduledFor/createdAt + 90 días, la
+ *    misma retención que aplica scripts/notifications_retention.py
+ *    (--pending-days) a los no enviados. cleanupOldNotifications queda como
+ *    red de seguridad para docs sin expireAt (ver el script para el
+ *    backfill).
  */
 
 import {onDocumentCreated} from "firebase-functions/v2/firestore";
@@ -14,6 +20,32 @@ import {onSchedule} from "firebase-functions/v2/scheduler";
 import * as admin from "firebase-admin";
 import {logger} from "firebase-functions";
 
+const RETENTION_DAYS = 30;
+// Igual que --pending-days de scripts/notifications_retention.py
+const PENDING_RETENTION_DAYS = 90;
+
+/** Fecha de expiración TTL para un doc que se acaba de enviar. */
+function expireAt(): admin.firestore.Timestamp {
+  return admin.firestore.Timestamp.fromMillis(
+    Date.now() + RETENTION_DAYS * 24 * 60 * 60 * 1000,
+  );
+}
+
+/**
+ * Fecha de expiración TTL para un doc cuyo envío falló: `base`
+ * (scheduledFor o createdAt) + PENDING_RETENTION_DAYS; ahora si no hay.
+ */
+function pendingExpireAt(
+  base?: admin.firestore.Timestamp | null,
+): admin.firestore.Timestamp {
+  const from = base instanceof admin.firestore.Timestamp ?
+    base.toMillis() :
+    Date.now();
+  return admin.firestore.Timestamp.fromMillis(
+    from + PENDING_RETENTION_DAYS * 24 * 60 * 60 * 1000,
+  );
+}
+
 // ============================================================================
 // 1. Notificaciones inmediatas: se dispara al crear un doc en `notifications`
 // ============================================================================
@@ -39,6 +71,7 @@ export const sendImmediateNotification = onDocumentCreated(
           sent: false,
           error: "Sin fcmToken",
           errorAt: admin.firestore.FieldValue.serverTimestamp(),
+          expireAt: pendingExpireAt(notification.createdAt),
         });
         return null;
       }
@@ -73,6 +106,7 @@ export const sendImmediateNotification = onDocumentCreated(
       await snapshot.ref.update({
         sent: true,
         sentAt: admin.firestore.FieldValue.serverTimestamp(),
+        expireAt: expireAt(),
         response: response,
       });
       return {success: true, messageId: response};
@@ -83,6 +117,7 @@ export const sendImmediateNotification = onDocumentCreated(
         sent: false,
         error: msg,
         errorAt: admin.firestore.FieldValue.serverTimestamp(),
+        expireAt: pendingExpireAt(notification.createdAt),
       });
       return {success: false, error: msg};
     }
@@ -135,6 +170,7 @@ export const processScheduledNotifications = onSchedule(
               "FCM token no disponible" :
               "Usuario no encontrado",
             errorAt: admin.firestore.FieldValue.serverTimestamp(),
+            expireAt: pendingExpireAt(reminder.scheduledFor),
           });
           continue;
         }
@@ -179,6 +215,7 @@ export const processScheduledNotifications = onSchedule(
               doc.ref.update({
                 sent: true,
                 sentAt: admin.firestore.FieldValue.serverTimestamp(),
+                expireAt: expireAt(),
                 response: response,
               }),
             )
@@ -187,6 +224,7 @@ export const processScheduledNotifications = onSchedule(
                 sent: false,
                 error: error.message,
                 errorAt: admin.firestore.FieldValue.serverTimestamp(),
+                expireAt: pendingExpireAt(reminder.scheduledFor),
               }),
             ),
         );
@@ -211,7 +249,7 @@ export const cleanupOldNotifications = onSchedule(
   async () => {
     try {
       const thirtyDaysAgo = admin.firestore.Timestamp.fromMillis(
-        Date.now() - 30 * 24 * 60 * 60 * 1000,
+        Date.now() - RETENTION_DAYS * 24 * 60 * 60 * 1000,
       );
 
       const [notifications, reminders] = await Promise.all([
@@ -1,131 +1,170 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Script para agregar el campo 'searchKey' a todos los usuarios existentes
-searchKey = email en minúsculas para facilitar búsquedas
+Script para agregar los campos de búsqueda a todos los usuarios existentes
+
+  - searchKey    = email en minúsculas (búsqueda exacta en Firebase Console)
+  - searchTokens = prefijos normalizados (sin tildes, minúsculas) de cada
+                   palabra del nombre y del email, para buscar con una sola
+                   query indexada:
+                     users.where('searchTokens', 'array_contains', 'fel')
+
+Lee los usuarios en páginas con proyección (solo email/name/campos de
+búsqueda) y escribe con BulkWriter únicamente los docs que cambian.
+Después de cada página guarda un checkpoint con el último ID procesado, así
+una corrida interrumpida se retoma con --resume sin repetir lo ya hecho.
 
 Uso:
   python scripts/add_searchkey_to_users.py [ruta_al_service_account.json]
+  python scripts/add_searchkey_to_users.py --resume
+  python scripts/add_searchkey_to_users.py --dry-run
 """
 
-import sys
-import io
+import argparse
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import re
+import sys
+import unicodedata
+
+from firebase_common import bulk_writer, fix_windows_encoding, init_firestore, iter_pages
+
+CHECKPOINT_FILE = '.searchkey_checkpoint'
+
+MIN_PREFIX = 2
+MAX_PREFIX = 15
+MAX_TOKENS = 100
+
+PROJECTION = ['email', 'name', 'searchKey', 'searchTokens']
+
+fix_windows_encoding()
+
+
+def normalize(text):
+    """Minúsculas y sin tildes ('José Peña' -> 'jose pena')."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def prefixes(word):
+    return [word[:i] for i in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1)]
+
+
+def build_search_tokens(name, email):
+    """Prefijos de cada palabra del nombre y de las partes del email."""
+    email = normalize(email)
+    local_part = email.split('@', 1)[0]
+    words = re.split(r'[^a-z0-9]+', normalize(name)) + re.split(r'[._+\-]+', local_part)
+    words.append(local_part)
+
+    tokens = set()
+    for word in words:
+        if len(word) >= MIN_PREFIX:
+            tokens.update(prefixes(word))
+    if email:
+        tokens.add(email)
+    return sorted(tokens)[:MAX_TOKENS]
+
+
+def read_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE, encoding='utf-8') as f:
+            return f.read().strip() or None
+    return None
+
+
+def write_checkpoint(doc_id):
+    with open(CHECKPOINT_FILE, 'w', encoding='utf-8') as f:
+        f.write(doc_id)
 
-# Fix encoding for Windows
-if sys.platform == 'win32':
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 def main():
+    parser = argparse.ArgumentParser(description='Backfill de searchKey/searchTokens en users')
+    parser.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+    parser.add_argument('--resume', action='store_true',
+                        help=f'Retomar desde el último checkpoint ({CHECKPOINT_FILE})')
+    parser.add_argument('--dry-run', action='store_true', help='Solo contar, sin escribir')
+    parser.add_argument('--page-size', type=int, default=500)
+    args = parser.parse_args()
+
     print("=" * 60)
-    print("AGREGAR SEARCHKEY A USUARIOS EXISTENTES")
+    print("AGREGAR SEARCHKEY / SEARCHTOKENS A USUARIOS EXISTENTES")
     print("=" * 60)
-    print("\nEste script agregará el campo 'searchKey' a todos los usuarios")
-    print("searchKey = email en minúsculas (para búsquedas fáciles)\n")
-
-    # Determinar ruta del service account
-    service_account_path = None
-
-    if len(sys.argv) > 1:
-        service_account_path = sys.argv[1]
-        print(f'Usando service account desde argumento: {service_account_path}')
-    elif 'FIREBASE_SERVICE_ACCOUNT' in os.environ:
-        service_account_path = os.environ['FIREBASE_SERVICE_ACCOUNT']
-        print(f'Usando service account desde variable de entorno: {service_account_path}')
-    else:
-        service_account_path = 'scripts/firebase-service-account.json'
-        print(f'Usando service account por defecto: {service_account_path}')
-
-    # Verificar que el archivo existe
-    if not os.path.exists(service_account_path):
-        print(f'\n❌ ERROR: No se encontró el archivo: {service_account_path}')
-        print('\nUso:')
-        print('  python scripts/add_searchkey_to_users.py [ruta_al_service_account.json]')
-        print('  O configura la variable de entorno FIREBASE_SERVICE_ACCOUNT')
-        sys.exit(1)
-
-    # Inicializar Firebase Admin SDK
-    try:
-        cred = credentials.Certificate(service_account_path)
-        firebase_admin.initialize_app(cred)
-        print("✅ Firebase inicializado correctamente\n")
-    except Exception as e:
-        print(f"❌ ERROR al inicializar Firebase: {e}")
-        sys.exit(1)
-
-    db = firestore.client()
-
-    # Obtener todos los usuarios
-    print("[1/2] Obteniendo todos los usuarios...")
-    users_ref = db.collection('users')
-    all_users = users_ref.get()
-
-    print(f"✅ Total de usuarios encontrados: {len(all_users)}\n")
-
-    if len(all_users) == 0:
-        print("ℹ️  No hay usuarios para actualizar")
-        return
-
-    # Actualizar cada usuario
-    print("[2/2] Actualizando usuarios...\n")
-    updated_count = 0
-    already_have_count = 0
-    error_count = 0
-
-    for user_doc in all_users:
-        user_data = user_doc.to_dict()
-        user_id = user_doc.id
-        user_email = user_data.get('email', '')
-        user_role = user_data.get('role', 'student')
-
-        # Verificar si ya tiene searchKey
-        if 'searchKey' in user_data:
-            print(f"  ⏭️  {user_email} - Ya tiene searchKey: '{user_data['searchKey']}'")
-            already_have_count += 1
-            continue
-
-        if not user_email:
-            print(f"  ⚠️  Usuario {user_id} - No tiene email, saltando")
-            error_count += 1
-            continue
-
-        try:
-            # Agregar searchKey
-            search_key = user_email.lower()
-            db.collection('users').document(user_id).update({
-                'searchKey': search_key
-            })
-
-            role_emoji = '👑' if user_role == 'admin' else '👤'
-            print(f"  ✅ {role_emoji} {user_email} -> searchKey: '{search_key}'")
-            updated_count += 1
-
-        except Exception as e:
-            print(f"  ❌ Error actualizando {user_email}: {e}")
-            error_count += 1
-
-    # Resumen final
-    print("\n" + "=" * 60)
-    print("✅ ACTUALIZACIÓN COMPLETADA")
+    print("\nsearchKey    = email en minúsculas (búsqueda exacta)")
+    print("searchTokens = prefijos de nombre y email (array-contains)\n")
+
+    db = init_firestore(args.service_account)
+
+    start_after = read_checkpoint() if args.resume else None
+    if start_after:
+        print(f"↪️  Retomando después del usuario {start_after}\n")
+
+    print("[1/2] Recorriendo usuarios por páginas...")
+    writer = None if args.dry_run else bulk_writer(db)
+    scanned = updated = up_to_date = no_email = 0
+
+    query = db.collection('users').select(PROJECTION)
+    for page in iter_pages(query, page_size=args.page_size, start_after_id=start_after):
+        for user_doc in page:
+            user_data = user_doc.to_dict() or {}
+            scanned += 1
+
+            email = user_data.get('email', '')
+            if not email:
+                no_email += 1
+                continue
+
+            update = {}
+            search_key = email.lower()
+            if user_data.get('searchKey') != search_key:
+                update['searchKey'] = search_key
+            tokens = build_search_tokens(user_data.get('name', ''), email)
+            if user_data.get('searchTokens') != tokens:
+                update['searchTokens'] = tokens
+
+            if not update:
+                up_to_date += 1
+                continue
+            updated += 1
+            if writer:
+                writer.update(user_doc.reference, update)
+
+        # Checkpoint solo cuando las escrituras de la página ya están confirmadas
+        if writer:
+            writer.flush()
+            write_checkpoint(page[-1].id)
+        print(f"  ✅ {scanned} revisados, {updated} a actualizar (último: {page[-1].id})")
+
+    failed = 0
+    if writer:
+        writer.close()
+        failed = len(writer.failures)
+        for failure in writer.failures:
+            print(f"  ❌ Error actualizando {failure.operation.reference.id}: {failure.message}")
+
+    print("\n[2/2] Resumen")
+    print("=" * 60)
+    print("✅ ACTUALIZACIÓN COMPLETADA" if not args.dry_run else "Dry-run terminado (sin cambios)")
     print("=" * 60)
-    print(f"Usuarios actualizados: {updated_count}")
-    print(f"Usuarios que ya tenían searchKey: {already_have_count}")
-    print(f"Errores: {error_count}")
-    print(f"Total procesado: {len(all_users)}")
+    print(f"Usuarios actualizados: {updated - failed}")
+    print(f"Usuarios ya al día: {up_to_date}")
+    print(f"Usuarios sin email (omitidos): {no_email}")
+    print(f"Errores: {failed}")
+    print(f"Total procesado: {scanned}")
     print()
 
-    # Instrucciones para usar searchKey en Firebase Console
-    print("📖 CÓMO BUSCAR USUARIOS EN FIREBASE CONSOLE:")
+    if failed:
+        sys.exit(1)
+    if writer and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+    print("📖 CÓMO BUSCAR USUARIOS:")
     print("-" * 60)
-    print("1. Ir a Firestore Database > users")
-    print("2. Hacer clic en 'Add filter'")
-    print("3. Seleccionar campo: 'searchKey'")
-    print("4. Operador: '=='")
-    print("5. Valor: el email en minúsculas (ej: 'user@example.com')")
-    print("6. Click 'Apply'")
+    print("Firebase Console: filtro 'searchKey' == email en minúsculas")
+    print("Desde la app (una query indexada, sin filtrar en el cliente):")
+    print("  users.where('searchTokens', arrayContains: 'fel').limit(20)")
+    print("  (normalizar el texto igual: minúsculas y sin tildes)")
     print()
 
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servicio de admisión de reservas (asyncio) con commits por micro-lote.
+
+En una estampida cada cliente corre su propia transacción sobre el mismo
+doc capacity_tracking/{fecha}: con N alumnos hay O(N) transacciones que
+chocan y abortan (ver booking_rush.py). Este servicio local recibe las
+reservas por HTTP y las encola por ocurrencia de clase (horario + fecha).
+Una tarea por ocurrencia junta las solicitudes que llegan dentro de
+--batch-ms (hasta --max-batch) y las resuelve en UNA transacción:
+
+  1. Lee horario, override del día, contador de cupo y las reservas de esa
+     clase (para detectar duplicados), igual que BookingService.
+  2. Admite en orden de llegada contra los cupos restantes en memoria
+     (capacidad - currentBookings): booked, duplicate o full.
+  3. Escribe las reservas aceptadas y el contador con el delta del lote.
+
+Si la transacción aborta, se reintenta el lote completo y las decisiones se
+recalculan sobre los datos nuevos. Tras cada commit queda en memoria la
+vista de la ocurrencia: mientras diga "llena" (0 cupos) o "no disponible"
+(horario inexistente o deshabilitado ese día) y tenga menos de --view-ttl
+segundos, las solicitudes se rechazan sin tocar Firestore (una cancelación
+o un override hecho desde la app se ve al vencer la vista).
+
+Una ocurrencia cuya cola pasa --idle-ttl segundos vacía se descarta junto
+con su tarea: clases pasadas o IDs inventados no acumulan memoria ni tareas.
+La próxima solicitud para esa clase la vuelve a crear.
+
+Endpoints (JSON, sin autenticación: solo para pruebas locales):
+  POST /bookings   {"userId", "scheduleId", "classDate": "YYYY-MM-DD"}
+                   201 booked, 409 full/duplicate, 404 unavailable
+  GET  /stats      lotes, commits, abortos, tamaño de lote, resultados
+  GET  /health
+
+Uso:
+  firebase emulators:start --only firestore
+  python scripts/admission_service.py --port 8088
+  python scripts/booking_rush.py --clients 200 --capacity 30 --service http://127.0.0.1:8088
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http import HTTPStatus
+
+from async_firestore import AsyncPool
+from firebase_common import LOCAL_TZ, fix_windows_encoding
+from rules_benchmark import DEFAULT_EMULATOR_HOST, DEFAULT_PROJECT
+
+fix_windows_encoding()
+
+DEFAULT_PORT = 8088
+DEFAULT_BATCH_MS = 20
+DEFAULT_MAX_BATCH = 100
+DEFAULT_VIEW_TTL = 2.0
+DEFAULT_IDLE_TTL = 60.0
+
+# Código HTTP de cada resultado
+STATUS_CODES = {
+    'booked': HTTPStatus.CREATED,
+    'duplicate': HTTPStatus.CONFLICT,
+    'full': HTTPStatus.CONFLICT,
+    'unavailable': HTTPStatus.NOT_FOUND,
+    'error': HTTPStatus.SERVICE_UNAVAILABLE,
+}
+
+
+class Occurrence:
+    """Cola y vista de cupos de una clase (horario + fecha)."""
+
+    def __init__(self, schedule_id, class_date):
+        self.schedule_id = schedule_id
+        self.class_date = class_date
+        self.queue = asyncio.Queue()
+        self.view = None          # 'full' / 'unavailable' según el último commit
+        self.refreshed = 0.0
+        self.task = None
+
+
+def commit_batch(db, firestore_module, occurrence, user_ids, max_attempts, attempts):
+    """
+    Una transacción para todo el lote (llamada bloqueante, corre en un hilo).
+    Devuelve ([resultado por solicitud, en orden], cupos restantes o None si
+    la clase no está disponible).
+    """
+    schedule_id, class_date = occurrence.schedule_id, occurrence.class_date
+    date_key = class_date.strftime('%Y-%m-%d')
+    schedule_ref = db.collection('class_schedules').document(schedule_id)
+    override_ref = db.collection('schedule_overrides').document(f'{schedule_id}_{date_key}')
+    capacity_ref = schedule_ref.collection('capacity_tracking').document(date_key)
+    day_bookings = (db.collection('bookings')
+                    .where('scheduleId', '==', schedule_id)
+                    .where('classDate', '>=', class_date)
+                    .where('classDate', '<', class_date + timedelta(days=1)))
+
+    @firestore_module.transactional
+    def admit(transaction):
+        attempts.append(1)
+        schedule = schedule_ref.get(transaction=transaction)
+        override = override_ref.get(transaction=transaction)
+        if not schedule.exists or (override.exists and (override.to_dict() or {}).get('disabled')):
+            return [{'status': 'unavailable'} for _ in user_ids], None
+        schedule_data = schedule.to_dict() or {}
+        max_capacity = schedule_data.get('capacity', 30)
+        capacity = capacity_ref.get(transaction=transaction)
+        current = (capacity.to_dict() or {}).get('currentBookings', 0) if capacity.exists else 0
+        booked_users = {doc.get('userId') for doc in day_bookings.stream(transaction=transaction)
+                        if doc.get('status') == 'confirmed'}
+
+        remaining = max(0, max_capacity - current)
+        results, accepted = [], []
+        for user_id in user_ids:
+            if user_id in booked_users:
+                results.append({'status': 'duplicate'})
+            elif remaining == 0:
+                results.append({'status': 'full'})
+            else:
+                ref = db.collection('bookings').document()
+                accepted.append((ref, user_id))
+                booked_users.add(user_id)
+                remaining -= 1
+                results.append({'status': 'booked', 'bookingId': ref.id, 'seat': current + len(accepted)})
+
+        for ref, user_id in accepted:
+            transaction.set(ref, {
+                'userId': user_id,
+                'userName': user_id,
+                'scheduleId': schedule_id,
+                'scheduleTime': schedule_data.get('time', ''),
+                'scheduleType': schedule_data.get('type', ''),
+                'classDate': class_date,
+                'status': 'confirmed',
+                'createdAt': firestore_module.SERVER_TIMESTAMP,
+            })
+        if accepted:
+            transaction.set(capacity_ref, {
+                'currentBookings': current + len(accepted),
+                'maxCapacity': max_capacity,
+                'lastUpdated': firestore_module.SERVER_TIMESTAMP,
+                'scheduleId': schedule_id,
+                'classDate': class_date,
+            }, merge=True)
+        return results, remaining
+
+    return admit(db.transaction(max_attempts=max_attempts))
+
+
+class AdmissionService:
+    """Colas por ocurrencia y una tarea que las vacía por micro-lotes."""
+
+    def __init__(self, db, firestore_module, batch_ms=DEFAULT_BATCH_MS, max_batch=DEFAULT_MAX_BATCH,
+                 view_ttl=DEFAULT_VIEW_TTL, max_attempts=5, idle_ttl=DEFAULT_IDLE_TTL):
+        self.db = db
+        self.firestore = firestore_module
+        self.batch_seconds = batch_ms / 1000
+        self.max_batch = max_batch
+        self.view_ttl = view_ttl
+        self.max_attempts = max_attempts
+        self.idle_ttl = idle_ttl
+        self.pool = AsyncPool()
+        self.occurrences = {}
+        self.outcomes = Counter()
+        self.batch_sizes = Counter()
+        self.counts = Counter()    # batches, commits, transactionAttempts, fastRejected, evicted
+
+    async def submit(self, user_id, schedule_id, class_date):
+        key = (schedule_id, class_date.date())
+        occurrence = self.occurrences.get(key)
+        if occurrence is None:
+            occurrence = self.occurrences[key] = Occurrence(schedule_id, class_date)
+            occurrence.task = asyncio.create_task(self._drain(occurrence))
+        future = asyncio.get_running_loop().create_future()
+        # put_nowait no cede el control: _drain no puede descartar la ocurrencia en medio
+        occurrence.queue.put_nowait((user_id, future))
+        return await future
+
+    async def _next_batch(self, occurrence):
+        """Siguiente lote; None si la cola pasó idle_ttl segundos vacía."""
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(occurrence.queue.get(), self.idle_ttl)]
+        except asyncio.TimeoutError:
+            return None
+        deadline = loop.time() + self.batch_seconds
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(occurrence.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _drain(self, occurrence):
+        while True:
+            batch = await self._next_batch(occurrence)
+            if batch is None:
+                if not occurrence.queue.empty():
+                    continue
+                # Sin await entre la verificación y el borrado: submit no puede colarse
+                key = (occurrence.schedule_id, occurrence.class_date.date())
+                if self.occurrences.get(key) is occurrence:
+                    del self.occurrences[key]
+                self.counts['evicted'] += 1
+                return
+            self.batch_sizes[len(batch)] += 1
+            try:
+                results = await self._admit(occurrence, [user_id for user_id, _ in batch])
+            except Exception as e:
+                results = [{'status': 'error', 'error': f'{type(e).__name__}: {e}'[:200]}] * len(batch)
+            for (_, future), result in zip(batch, results):
+                self.outcomes[result['status']] += 1
+                if not future.done():
+                    future.set_result(result)
+
+    async def _admit(self, occurrence, user_ids):
+        # Clase llena o no disponible según una vista reciente: se rechaza sin transacción
+        if occurrence.view and time.monotonic() - occurrence.refreshed < self.view_ttl:
+            self.counts['fastRejected'] += len(user_ids)
+            return [{'status': occurrence.view} for _ in user_ids]
+        self.counts['batches'] += 1
+        attempts = []
+        try:
+            results, remaining = await self.pool.thread(
+                'capacity_tracking', commit_batch, self.db, self.firestore, occurrence, user_ids,
+                self.max_attempts, attempts)
+        finally:
+            self.counts['transactionAttempts'] += len(attempts)
+        if any(result['status'] == 'booked' for result in results):
+            self.counts['commits'] += 1
+        occurrence.view = 'unavailable' if remaining is None else 'full' if remaining == 0 else None
+        occurrence.refreshed = time.monotonic()
+        return results
+
+    def stats(self):
+        return {
+            'occurrences': len(self.occurrences),
+            'requests': sum(self.outcomes.values()),
+            'outcomes': dict(self.outcomes),
+            'batches': self.counts['batches'],
+            'commits': self.counts['commits'],
+            'transactionAttempts': self.counts['transactionAttempts'],
+            'aborts': self.counts['transactionAttempts'] - self.counts['batches'],
+            'fastRejected': self.counts['fastRejected'],
+            'evicted': self.counts['evicted'],
+            'batchSizes': {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            'queued': sum(o.queue.qsize() for o in self.occurrences.values()),
+        }
+
+    # ============================================
+    # HTTP
+    # ============================================
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, {'ok': True}
+        if method == 'GET' and path == '/stats':
+            return HTTPStatus.OK, self.stats()
+        if method == 'POST' and path == '/bookings':
+            try:
+                request = json.loads(body or b'{}')
+                user_id, schedule_id = request['userId'], request['scheduleId']
+                class_date = datetime.strptime(request['classDate'], '%Y-%m-%d').replace(tzinfo=LOCAL_TZ)
+            except (ValueError, KeyError, TypeError) as e:
+                return HTTPStatus.BAD_REQUEST, {'status': 'invalid', 'error': str(e)}
+            result = await self.submit(user_id, schedule_id, class_date)
+            return STATUS_CODES[result['status']], result
+        return HTTPStatus.NOT_FOUND, {'error': f'{method} {path} no existe'}
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length') or 0))
+            status, payload = await self.route(method, path.split('?', 1)[0], body)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                     f'Content-Type: application/json; charset=utf-8\r\n'
+                     f'Content-Length: {len(data)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servicio de admisión de reservas por micro-lotes')
+    parser.add_argument('--listen', default='127.0.0.1', help='Interfaz a escuchar (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Puerto HTTP (default: %(default)s)')
+    parser.add_argument('--batch-ms', type=float, default=DEFAULT_BATCH_MS,
+                        help='Ventana para juntar solicitudes de una clase (default: %(default)s ms)')
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help='Solicitudes máximas por transacción (default: %(default)s)')
+    parser.add_argument('--view-ttl', type=float, default=DEFAULT_VIEW_TTL,
+                        help='Segundos que vale la vista "llena"/"no disponible" en memoria '
+                             '(default: %(default)s)')
+    parser.add_argument('--idle-ttl', type=float, default=DEFAULT_IDLE_TTL,
+                        help='Segundos con la cola vacía antes de descartar una clase (default: %(default)s)')
+    parser.add_argument('--max-attempts', type=int, default=5, help='Intentos por transacción (default 5)')
+    parser.add_argument('--project', default=DEFAULT_PROJECT, help='Proyecto del emulador (default: %(default)s)')
+    parser.add_argument('--host', default=os.environ.get('FIRESTORE_EMULATOR_HOST', DEFAULT_EMULATOR_HOST),
+                        help='Host del emulador (default: FIRESTORE_EMULATOR_HOST o %(default)s)')
+    args = parser.parse_args()
+
+    from google.cloud import firestore as firestore_module
+
+    print("=" * 60)
+    print("SERVICIO DE ADMISIÓN DE RESERVAS")
+    print("=" * 60 + "\n")
+
+    os.environ['FIRESTORE_EMULATOR_HOST'] = args.host
+    db = firestore_module.Client(project=args.project)
+    service = AdmissionService(db, firestore_module, args.batch_ms, args.max_batch, args.view_ttl,
+                               args.max_attempts, args.idle_ttl)
+    print(f"✅ Emulador {args.host} (proyecto {args.project})")
+    print(f"✅ Lotes de hasta {args.max_batch} solicitudes o {args.batch_ms:g} ms por clase")
+    print(f"🚀 Escuchando en http://{args.listen}:{args.port} (Ctrl+C para terminar)\n")
+    try:
+        asyncio.run(service.serve(args.listen, args.port))
+    except KeyboardInterrupt:
+        print("\n" + json.dumps(service.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ejecución asíncrona (asyncio + AsyncClient) para scripts limitados por latencia.
+
+Con `firestore.client()` cada query y cada lectura puntual espera su propio
+viaje de ida y vuelta: las queries por usuario de los scripts de borrado o
+los `get()` por horario de initialize_capacity_counters.py tardan
+N × latencia. Con AsyncClient esas operaciones independientes se solapan.
+
+Para no saturar una colección (ni la cuota de Auth) la concurrencia se
+limita con un semáforo por colección: `AsyncPool` deja como máximo
+`DEFAULT_CONCURRENCY` operaciones en vuelo por colección, salvo las
+indicadas en `COLLECTION_CONCURRENCY` o en `limits`. Las llamadas
+bloqueantes (Auth, Messaging) corren en hilos con el mismo mecanismo.
+
+Uso desde un script:
+  from async_firestore import AsyncPool, async_client, run
+
+  async def borrar_bookings(adb, user_ids):
+      pool = AsyncPool()
+
+      async def de_un_usuario(user_id):
+          query = adb.collection('bookings').where('userId', '==', user_id)
+          encontrados, errores = await pool.delete_all(query)
+          return encontrados - len(errores)
+
+      return sum(await pool.gather(de_un_usuario(u) for u in user_ids))
+
+  total = run(borrar_bookings(async_client(), user_ids))
+"""
+
+import asyncio
+import inspect
+from collections import defaultdict
+
+import firebase_admin
+from google.cloud.firestore import AsyncClient
+
+DEFAULT_CONCURRENCY = 32
+
+# Topes propios (el resto de colecciones usa DEFAULT_CONCURRENCY)
+COLLECTION_CONCURRENCY = {
+    'auth': 8,         # Admin API de Auth: cuota por proyecto y llamada bloqueante
+    'messaging': 8,
+}
+
+
+def async_client(app=None):
+    """
+    AsyncClient nuevo para la app de Firebase ya inicializada. Sus canales
+    quedan ligados al event loop de `run()`: usar uno por cada `run()`.
+    """
+    app = app or firebase_admin.get_app()
+    return AsyncClient(project=app.project_id, credentials=app.credential.get_credential())
+
+
+async def resolve(value):
+    """Espera `value` si es awaitable; con un cliente síncrono (o FakeFirestore) lo devuelve tal cual."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def collection_of(target):
+    """Nombre de la colección de una referencia, colección o query (o el nombre mismo)."""
+    if isinstance(target, str):
+        return target
+    parent = getattr(target, '_parent', None)
+    if parent is not None:
+        return parent.id       # query o collection group
+    if hasattr(target, 'document'):
+        return target.id       # colección
+    return target.parent.id    # documento
+
+
+def run(coroutine):
+    """Ejecuta la corrutina principal del script."""
+    return asyncio.run(coroutine)
+
+
+class AsyncPool:
+    """Semáforo por colección para las operaciones asíncronas de un script."""
+
+    def __init__(self, limits=None, default=DEFAULT_CONCURRENCY):
+        self.limits = {**COLLECTION_CONCURRENCY, **(limits or {})}
+        self.default = default
+        self.in_flight = defaultdict(int)
+        self.peak = defaultdict(int)
+        self._semaphores = {}
+
+    def semaphore(self, collection):
+        if collection not in self._semaphores:
+            self._semaphores[collection] = asyncio.Semaphore(self.limits.get(collection, self.default))
+        return self._semaphores[collection]
+
+    async def call(self, collection, fn, *args, **kwargs):
+        """Ejecuta `fn(*args)` (corrutina o llamada síncrona) dentro del tope de `collection`."""
+        async with self.semaphore(collection):
+            self.in_flight[collection] += 1
+            self.peak[collection] = max(self.peak[collection], self.in_flight[collection])
+            try:
+                return await resolve(fn(*args, **kwargs))
+            finally:
+                self.in_flight[collection] -= 1
+
+    async def thread(self, key, fn, *args, **kwargs):
+        """Ejecuta una llamada bloqueante (p.ej. auth.delete_user) en un hilo, con el tope de `key`."""
+        return await self.call(key, asyncio.to_thread, fn, *args, **kwargs)
+
+    async def get(self, ref):
+        return await self.call(collection_of(ref), ref.get)
+
+    async def query(self, query):
+        """Resultado completo de una query (lista de snapshots)."""
+        return await self.call(collection_of(query), query.get)
+
+    async def set(self, ref, data, merge=False):
+        return await self.call(collection_of(ref), ref.set, data, merge=merge)
+
+    async def update(self, ref, data):
+        return await self.call(collection_of(ref), ref.update, data)
+
+    async def delete(self, ref):
+        return await self.call(collection_of(ref), ref.delete)
+
+    async def delete_all(self, query):
+        """Borra en paralelo los docs de una query; devuelve (encontrados, errores)."""
+        docs = await self.query(query)
+        results = await self.gather((self.delete(doc.reference) for doc in docs), return_exceptions=True)
+        return len(docs), [r for r in results if isinstance(r, Exception)]
+
+    async def gather(self, coroutines, return_exceptions=False):
+        """Lanza todas las corrutinas (los semáforos regulan cuántas avanzan) y devuelve sus resultados en orden."""
+        return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
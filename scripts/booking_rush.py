@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga de la "estampida" de reservas sobre la transacción de cupo.
+
+A las 00:00 se abren las reservas y decenas de alumnos reservan la misma
+clase de la tarde a la vez. La verificación atómica de capacidad de
+BookingService nunca se probó con ese patrón. Este script lanza --clients
+clientes simulados (un hilo y un cliente de Firestore por alumno, cada uno
+autenticado con su propio token) que esperan en una barrera y reservan la
+misma ocurrencia de clase al mismo tiempo, con la misma lógica que la app:
+
+  fuera de la transacción  query de reserva duplicada (userId+scheduleId)
+  en la transacción        get class_schedules/{id}, schedule_overrides,
+                           capacity_tracking/{fecha}; si hay cupo, set del
+                           booking y set(merge) del contador +1
+
+Al final reporta throughput, intentos/abortos de la transacción,
+latencias p50/p95/p99 y verifica contra la base si el cupo se excedió
+alguna vez (bookings confirmados o contador > capacidad) o si el contador
+quedó distinto del número real de reservas.
+
+Contra el emulador (`firebase emulators:start --only firestore`) usa las
+reglas de firestore.rules; con --fake corre en memoria sobre FakeFirestore
+(misma semántica de contención, sin red) para probar el script mismo. Con
+--service los clientes reservan por HTTP a través de admission_service.py
+(un commit por micro-lote) en vez de correr cada uno su transacción, y el
+reporte suma los lotes, commits y abortos del servicio.
+
+Uso:
+  python scripts/booking_rush.py --clients 60 --capacity 15
+  python scripts/booking_rush.py --clients 200 --capacity 30 --output rush.json
+  python scripts/booking_rush.py --fake --clients 40
+  python scripts/booking_rush.py --clients 200 --capacity 30 --service http://127.0.0.1:8088
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+from google.api_core.exceptions import PermissionDenied
+
+from firebase_common import LOCAL_TZ, fix_windows_encoding, local_date
+from rules_benchmark import (DEFAULT_EMULATOR_HOST, DEFAULT_PROJECT, UserCredentials, clear_data,
+                             load_rules, mock_id_token, percentile)
+
+fix_windows_encoding()
+
+SCHEDULE = 'RUSH1900'
+
+
+BookingResult = namedtuple('BookingResult', 'outcome attempts seat ref error')
+
+
+class ClassFull(Exception):
+    pass
+
+
+class ClassUnavailable(Exception):
+    pass
+
+
+class RushStats:
+    """Resultados de todos los clientes (se escriben desde varios hilos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+        self.attempts = Counter()      # intentos de la transacción -> reservas
+        self.latencies = []
+        self.max_seat = 0
+        self.errors = Counter()
+
+    def record(self, outcome, latency, attempts=0, seat=0, error=None):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.latencies.append(latency)
+            if attempts:
+                self.attempts[attempts] += 1
+            self.max_seat = max(self.max_seat, seat)
+            if error:
+                self.errors[error] += 1
+
+
+def book_class(db, firestore_module, user_id, schedule_id, class_date, max_attempts=5):
+    """
+    Una reserva con la lógica de BookingService.createBooking. Devuelve un
+    BookingResult; outcome es booked, duplicate, full, unavailable, denied,
+    contention (se agotaron los intentos) o error.
+    """
+    date_key = class_date.strftime('%Y-%m-%d')
+    schedule_ref = db.collection('class_schedules').document(schedule_id)
+    override_ref = db.collection('schedule_overrides').document(f'{schedule_id}_{date_key}')
+    capacity_ref = schedule_ref.collection('capacity_tracking').document(date_key)
+    booking_ref = db.collection('bookings').document()
+    attempts = 0
+
+    @firestore_module.transactional
+    def reserve(transaction):
+        nonlocal attempts
+        attempts += 1
+        schedule = schedule_ref.get(transaction=transaction)
+        if not schedule.exists:
+            raise ClassUnavailable('Horario de clase no encontrado')
+        override = override_ref.get(transaction=transaction)
+        if override.exists and (override.to_dict() or {}).get('disabled'):
+            raise ClassUnavailable('Horario suspendido')
+        schedule_data = schedule.to_dict() or {}
+        max_capacity = schedule_data.get('capacity', 30)
+        capacity = capacity_ref.get(transaction=transaction)
+        current = (capacity.to_dict() or {}).get('currentBookings', 0) if capacity.exists else 0
+        if current >= max_capacity:
+            raise ClassFull(f'{current}/{max_capacity}')
+
+        transaction.set(booking_ref, {
+            'userId': user_id,
+            'userName': user_id,
+            'scheduleId': schedule_id,
+            'scheduleTime': schedule_data.get('time', ''),
+            'scheduleType': schedule_data.get('type', ''),
+            'classDate': class_date,
+            'status': 'confirmed',
+            'createdAt': firestore_module.SERVER_TIMESTAMP,
+        })
+        transaction.set(capacity_ref, {
+            'currentBookings': current + 1,
+            'maxCapacity': max_capacity,
+            'lastUpdated': firestore_module.SERVER_TIMESTAMP,
+            'scheduleId': schedule_id,
+            'classDate': class_date,
+        }, merge=True)
+        return current + 1
+
+    try:
+        existing = (db.collection('bookings')
+                    .where('userId', '==', user_id)
+                    .where('scheduleId', '==', schedule_id)
+                    .where('status', '==', 'confirmed').get())
+        if any(doc.get('classDate').date() == class_date.date() for doc in existing):
+            return BookingResult('duplicate', attempts, 0, None, None)
+        seat = reserve(db.transaction(max_attempts=max_attempts))
+        return BookingResult('booked', attempts, seat, booking_ref, None)
+    except ClassFull:
+        return BookingResult('full', attempts, 0, None, None)
+    except ClassUnavailable:
+        return BookingResult('unavailable', attempts, 0, None, None)
+    except PermissionDenied:
+        return BookingResult('denied', attempts, 0, None, None)
+    except ValueError as e:
+        # transactional: "Failed to commit transaction in N attempts"
+        return BookingResult('contention', attempts, 0, None, str(e)[:80])
+    except Exception as e:
+        return BookingResult('error', attempts, 0, None, type(e).__name__)
+
+
+def cancel_booking(db, firestore_module, booking_ref, reason, max_attempts=5):
+    """
+    Cancelación con la lógica de BookingService.cancelBooking (status y
+    decremento del contador en la misma transacción). Devuelve el outcome:
+    cancelled, not_confirmed, missing, denied, contention o error.
+    """
+    @firestore_module.transactional
+    def cancel(transaction):
+        booking = booking_ref.get(transaction=transaction)
+        if not booking.exists:
+            return 'missing'
+        data = booking.to_dict() or {}
+        if data.get('status') != 'confirmed':
+            return 'not_confirmed'
+        capacity_ref = (db.collection('class_schedules').document(data['scheduleId'])
+                        .collection('capacity_tracking').document(local_date(data['classDate']).isoformat()))
+        capacity = capacity_ref.get(transaction=transaction)
+        transaction.update(booking_ref, {
+            'status': 'cancelled',
+            'cancelledAt': firestore_module.SERVER_TIMESTAMP,
+            'cancellationReason': reason,
+            'updatedAt': firestore_module.SERVER_TIMESTAMP,
+        })
+        if capacity.exists:
+            current = (capacity.to_dict() or {}).get('currentBookings', 0)
+            transaction.update(capacity_ref, {
+                'currentBookings': current - 1 if current > 0 else 0,
+                'lastUpdated': firestore_module.SERVER_TIMESTAMP,
+            })
+        return 'cancelled'
+
+    try:
+        return cancel(db.transaction(max_attempts=max_attempts))
+    except PermissionDenied:
+        return 'denied'
+    except ValueError:
+        return 'contention'
+    except Exception:
+        return 'error'
+
+
+def service_request(url, method, path, body=None):
+    """(código HTTP, JSON) de una llamada a admission_service.py."""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url.rstrip('/') + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def book_via_service(url, user_id, schedule_id, class_date):
+    """La misma reserva, admitida por el servicio en vez de una transacción propia."""
+    try:
+        _, payload = service_request(url, 'POST', '/bookings', {
+            'userId': user_id, 'scheduleId': schedule_id, 'classDate': class_date.strftime('%Y-%m-%d')})
+    except OSError as e:
+        return BookingResult('error', 0, 0, None, type(e).__name__)
+    return BookingResult(payload.get('status', 'error'), 0, payload.get('seat', 0), None, payload.get('error'))
+
+
+def seed(owner, capacity):
+    owner.collection('class_schedules').document(SCHEDULE).set(
+        {'time': '19:00', 'type': 'Muay Thai', 'instructor': 'Rush', 'capacity': capacity,
+         'daysOfWeek': [1, 2, 3, 4, 5, 6, 7], 'active': True})
+
+
+def verify(owner, schedule_id, class_date):
+    """(reservas confirmadas en la base, valor del contador) de una ocurrencia de clase."""
+    booked = [doc for doc in owner.collection('bookings')
+              .where('scheduleId', '==', schedule_id).where('status', '==', 'confirmed').get()
+              if doc.get('classDate').date() == class_date.date()]
+    counter = (owner.collection('class_schedules').document(schedule_id)
+               .collection('capacity_tracking').document(class_date.strftime('%Y-%m-%d')).get())
+    return len(booked), (counter.to_dict() or {}).get('currentBookings', 0) if counter.exists else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estampida de reservas sobre la transacción de cupo')
+    parser.add_argument('--clients', type=int, default=60, help='Alumnos simultáneos (default 60)')
+    parser.add_argument('--capacity', type=int, default=15, help='Cupo de la clase (default 15)')
+    parser.add_argument('--max-attempts', type=int, default=5,
+                        help='Intentos por transacción, como runTransaction (default 5)')
+    parser.add_argument('--jitter-ms', type=float, default=0,
+                        help='Retraso aleatorio máximo de cada cliente tras la barrera (default 0)')
+    parser.add_argument('--rules', default='firestore.rules', help='Reglas a cargar en el emulador')
+    parser.add_argument('--project', default=DEFAULT_PROJECT, help='Proyecto del emulador (default: %(default)s)')
+    parser.add_argument('--host', default=os.environ.get('FIRESTORE_EMULATOR_HOST', DEFAULT_EMULATOR_HOST),
+                        help='Host del emulador (default: FIRESTORE_EMULATOR_HOST o %(default)s)')
+    parser.add_argument('--fake', action='store_true', help='Correr en memoria (FakeFirestore)')
+    parser.add_argument('--service', help='URL de admission_service.py: reservar por HTTP en vez de por transacción')
+    parser.add_argument('--output', help='Guardar el resultado en JSON')
+    args = parser.parse_args()
+    if args.fake and args.service:
+        parser.error('--service necesita el emulador (el servicio corre en otro proceso)')
+
+    print("=" * 60)
+    print(f"ESTAMPIDA DE RESERVAS: {args.clients} alumnos, cupo {args.capacity}")
+    print("=" * 60 + "\n")
+
+    from google.cloud import firestore as firestore_module
+    class_date = (datetime.now(LOCAL_TZ) + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    print("[1/4] Preparando la base...")
+    if args.fake:
+        from fake_firestore import FakeFirestore
+        owner = FakeFirestore()
+        clients = [owner] * args.clients
+        print("✅ FakeFirestore en memoria\n")
+    else:
+        os.environ['FIRESTORE_EMULATOR_HOST'] = args.host
+        try:
+            load_rules(args.host, args.project, args.rules)
+            clear_data(args.host, args.project)
+        except OSError as e:
+            print(f"❌ No se pudo hablar con el emulador en {args.host}: {e}")
+            print("   Inícialo con: firebase emulators:start --only firestore")
+            sys.exit(1)
+        owner = firestore_module.Client(project=args.project)
+        if args.service:
+            clients = [None] * args.clients
+        else:
+            clients = [firestore_module.Client(project=args.project, credentials=UserCredentials(
+                mock_id_token(args.project, f'rush-{i:04d}'))) for i in range(args.clients)]
+        print(f"✅ Emulador {args.host} con {args.rules}\n")
+    seed(owner, args.capacity)
+    service_before = service_request(args.service, 'GET', '/stats')[1] if args.service else None
+
+    print(f"[2/4] {args.clients} clientes reservando {SCHEDULE} del {class_date:%Y-%m-%d} a la vez...")
+    stats = RushStats()
+    barrier = threading.Barrier(args.clients + 1)
+
+    def client(i, db):
+        barrier.wait()
+        if args.jitter_ms:
+            time.sleep(random.uniform(0, args.jitter_ms) / 1000)
+        started = time.perf_counter()
+        if args.service:
+            result = book_via_service(args.service, f'rush-{i:04d}', SCHEDULE, class_date)
+        else:
+            result = book_class(db, firestore_module, f'rush-{i:04d}', SCHEDULE, class_date, args.max_attempts)
+        stats.record(result.outcome, time.perf_counter() - started, result.attempts, result.seat, result.error)
+
+    threads = [threading.Thread(target=client, args=(i, db), daemon=True) for i, db in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    print(f"✅ Terminado en {wall:.2f}s\n")
+
+    print("[3/4] Verificando cupo contra la base...")
+    booked_in_db, counter = verify(owner, SCHEDULE, class_date)
+    exceeded = booked_in_db > args.capacity or counter > args.capacity or stats.max_seat > args.capacity
+    print(f"  Reservas confirmadas: {booked_in_db}/{args.capacity}   Contador: {counter}")
+    if exceeded:
+        print("  ❌ EL CUPO SE EXCEDIÓ")
+    if counter != booked_in_db:
+        print(f"  ❌ El contador ({counter}) no coincide con las reservas ({booked_in_db})")
+    if not exceeded and counter == booked_in_db:
+        print("  ✅ Cupo respetado y contador consistente")
+
+    print("\n[4/4] Resultado")
+    latencies_ms = [latency * 1000 for latency in stats.latencies]
+    aborts = sum((attempts - 1) * n for attempts, n in stats.attempts.items())
+    result = {
+        'clients': args.clients,
+        'capacity': args.capacity,
+        'wallSeconds': round(wall, 3),
+        'bookingsPerSecond': round(stats.outcomes['booked'] / wall, 1) if wall else None,
+        'requestsPerSecond': round(len(stats.latencies) / wall, 1) if wall else None,
+        'outcomes': dict(stats.outcomes),
+        'transactionAttempts': {str(k): v for k, v in sorted(stats.attempts.items())},
+        'aborts': aborts,
+        'latencyMs': {
+            'p50': round(percentile(latencies_ms, 0.50), 1),
+            'p95': round(percentile(latencies_ms, 0.95), 1),
+            'p99': round(percentile(latencies_ms, 0.99), 1),
+            'max': round(max(latencies_ms), 1),
+            'mean': round(statistics.fmean(latencies_ms), 1),
+        },
+        'bookedInDb': booked_in_db,
+        'counter': counter,
+        'capacityExceeded': exceeded,
+        'counterConsistent': counter == booked_in_db,
+        'errors': dict(stats.errors),
+    }
+    print("  Resultados: " + ', '.join(f'{k}: {v}' for k, v in stats.outcomes.most_common()))
+    print(f"  Throughput: {result['bookingsPerSecond']} reservas/s, {result['requestsPerSecond']} intentos de reserva/s")
+    if args.service:
+        after = service_request(args.service, 'GET', '/stats')[1]
+        result['service'] = {key: after[key] - service_before[key]
+                             for key in ('batches', 'commits', 'transactionAttempts', 'aborts', 'fastRejected')}
+        result['aborts'] = result['service']['aborts']
+        service = result['service']
+        print(f"  Servicio: {service['batches']} lotes, {service['commits']} commits, "
+              f"{service['transactionAttempts']} intentos (abortos: {service['aborts']}), "
+              f"{service['fastRejected']} rechazadas sin transacción")
+    else:
+        print("  Intentos por transacción: " +
+              ', '.join(f'{k}: {v}' for k, v in result['transactionAttempts'].items()) + f"  (abortos: {aborts})")
+    latency = result['latencyMs']
+    print(f"  Latencia ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  máx {latency['max']}")
+    for error, n in stats.errors.most_common(5):
+        print(f"  ⚠️  {n}× {error}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Resultado guardado en {args.output}")
+
+    if exceeded or counter != booked_in_db:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,10 +14,74 @@ import os
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
 
+from async_firestore import AsyncPool, async_client, run
+
 # Fix encoding for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+async def delete_user_docs(pool, adb, collection, label, users):
+    """Borra los docs de `collection` de cada usuario (todos los usuarios en paralelo)."""
+    async def of_user(user):
+        return await pool.delete_all(adb.collection(collection).where('userId', '==', user['id']))
+
+    total_deleted = 0
+    for user, (found, errors) in zip(users, await pool.gather(of_user(u) for u in users)):
+        if found > 0:
+            print(f"  🗑️  {user['email']}: {found} {label}(s)")
+        for error in errors:
+            print(f"     ⚠️  Error eliminando {label}: {error}")
+        total_deleted += found - len(errors)
+    return total_deleted
+
+
+async def delete_user(pool, adb, user):
+    """
+    Borra el usuario de Firestore (con sus contadores users/{id}/usage, que
+    no se borran solos con el doc) y de Auth; devuelve (en_firestore,
+    en_auth, mensaje).
+    """
+    try:
+        _, errors = await pool.delete_all(adb.collection('users').document(user['id']).collection('usage'))
+        if errors:
+            raise errors[0]
+        await pool.delete(adb.collection('users').document(user['id']))
+    except Exception as e:
+        return False, False, f"  ❌ Error eliminando {user['email']}: {e}"
+    try:
+        await pool.thread('auth', auth.delete_user, user['id'])
+        return True, True, f"  ✅ {user['email']} (Firestore + Auth)"
+    except auth.UserNotFoundError:
+        return True, False, f"  ⚠️  {user['email']} (Firestore OK, no existe en Auth)"
+    except Exception as e:
+        return True, False, f"  ⚠️  {user['email']} (Firestore OK, error Auth: {e})"
+
+
+async def purge_users(non_admin_users):
+    """Pasos 3 a 5, con las operaciones de todos los usuarios en paralelo (AsyncPool)."""
+    adb = async_client()
+    pool = AsyncPool()
+    totals = {}
+
+    print("\n[3/5] Eliminando bookings de usuarios no-admin...")
+    totals['bookings'] = await delete_user_docs(pool, adb, 'bookings', 'booking', non_admin_users)
+    print(f"\n✅ Total de bookings eliminadas: {totals['bookings']}\n")
+
+    # Eliminar pagos de usuarios no-admin
+    print("[4/5] Eliminando pagos de usuarios no-admin...")
+    totals['payments'] = await delete_user_docs(pool, adb, 'payments', 'pago', non_admin_users)
+    print(f"\n✅ Total de pagos eliminados: {totals['payments']}\n")
+
+    # Eliminar usuarios de Firestore y Authentication
+    print("[5/5] Eliminando usuarios...")
+    results = await pool.gather(delete_user(pool, adb, u) for u in non_admin_users)
+    for _, _, message in results:
+        print(message)
+    totals['firestore'] = sum(1 for in_firestore, _, _ in results if in_firestore)
+    totals['auth'] = sum(1 for _, in_auth, _ in results if in_auth)
+    return totals
+
+
 def main():
     print("=" * 60)
     print("LIMPIEZA DE USUARIOS NO-ADMIN")
@@ -119,82 +183,16 @@ def main():
             print("\n❌ Operación cancelada")
             sys.exit(0)
 
-    print("\n[3/5] Eliminando bookings de usuarios no-admin...")
-    total_bookings_deleted = 0
-
-    for user in non_admin_users:
-        user_id = user['id']
-        user_email = user['email']
-
-        # Buscar todas las bookings del usuario
-        bookings = db.collection('bookings').where('userId', '==', user_id).get()
-
-        if len(bookings) > 0:
-            print(f"  🗑️  {user_email}: {len(bookings)} booking(s)")
-
-            # Eliminar cada booking
-            for booking_doc in bookings:
-                booking_doc.reference.delete()
-                total_bookings_deleted += 1
-
-    print(f"\n✅ Total de bookings eliminadas: {total_bookings_deleted}\n")
-
-    # Eliminar pagos de usuarios no-admin
-    print("[4/5] Eliminando pagos de usuarios no-admin...")
-    total_payments_deleted = 0
-
-    for user in non_admin_users:
-        user_id = user['id']
-        user_email = user['email']
-
-        # Buscar todos los pagos del usuario
-        payments = db.collection('payments').where('userId', '==', user_id).get()
-
-        if len(payments) > 0:
-            print(f"  🗑️  {user_email}: {len(payments)} pago(s)")
-
-            # Eliminar cada pago
-            for payment_doc in payments:
-                payment_doc.reference.delete()
-                total_payments_deleted += 1
-
-    print(f"\n✅ Total de pagos eliminados: {total_payments_deleted}\n")
-
-    # Eliminar usuarios de Firestore y Authentication
-    print("[5/5] Eliminando usuarios...")
-    users_deleted_firestore = 0
-    users_deleted_auth = 0
-
-    for user in non_admin_users:
-        user_id = user['id']
-        user_email = user['email']
-
-        try:
-            # Eliminar de Firestore
-            db.collection('users').document(user_id).delete()
-            users_deleted_firestore += 1
-
-            # Eliminar de Firebase Authentication
-            try:
-                auth.delete_user(user_id)
-                users_deleted_auth += 1
-                print(f"  ✅ {user_email} (Firestore + Auth)")
-            except auth.UserNotFoundError:
-                print(f"  ⚠️  {user_email} (Firestore OK, no existe en Auth)")
-            except Exception as e:
-                print(f"  ⚠️  {user_email} (Firestore OK, error Auth: {e})")
-
-        except Exception as e:
-            print(f"  ❌ Error eliminando {user_email}: {e}")
+    totals = run(purge_users(non_admin_users))
 
     # Resumen final
     print("\n" + "=" * 60)
     print("✅ LIMPIEZA COMPLETADA")
     print("=" * 60)
-    print(f"Usuarios eliminados de Firestore: {users_deleted_firestore}/{len(non_admin_users)}")
-    print(f"Usuarios eliminados de Auth: {users_deleted_auth}/{len(non_admin_users)}")
-    print(f"Bookings eliminadas: {total_bookings_deleted}")
-    print(f"Pagos eliminados: {total_payments_deleted}")
+    print(f"Usuarios eliminados de Firestore: {totals['firestore']}/{len(non_admin_users)}")
+    print(f"Usuarios eliminados de Auth: {totals['auth']}/{len(non_admin_users)}")
+    print(f"Bookings eliminadas: {totals['bookings']}")
+    print(f"Pagos eliminados: {totals['payments']}")
     print(f"Usuarios ADMIN preservados: {len(admin_users)}")
     print()
 
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""Configuración de pytest para scripts/ (python -m pytest scripts)."""
+
+# Pruebas manuales contra un proyecto real: se conectan y piden datos al importarse
+collect_ignore = ['test_notifications.py', 'test_push_simple.py']
@@ -7,20 +7,108 @@ Elimina usuarios, reservas (bookings) y pagos (payments)
 MANTIENE todas las colecciones intactas, solo elimina los documentos
 
 Uso:
-  python scripts/delete_all_users_except_admin.py [--confirm] [ruta_al_service_account.json]
+  python scripts/delete_all_users_except_admin.py [--confirm] [--profile[=DIR]] [ruta_al_service_account.json]
 """
 
 import sys
-import io
 import os
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
 
-# Fix encoding for Windows
-if sys.platform == 'win32':
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+from async_firestore import AsyncPool, async_client, run
+import stage_profiler
+from firebase_common import fix_windows_encoding
+
+fix_windows_encoding()
+
+
+async def delete_user_docs(pool, adb, collection, label, users):
+    """Borra los docs de `collection` de cada usuario (todos los usuarios en paralelo)."""
+    async def of_user(user):
+        return await pool.delete_all(adb.collection(collection).where('userId', '==', user['id']))
+
+    total_deleted = 0
+    for user, (found, errors) in zip(users, await pool.gather(of_user(u) for u in users)):
+        if found > 0:
+            print(f"  🗑️  {user['email']}: {found} {label}(s)")
+        for error in errors:
+            print(f"     ⚠️  Error eliminando {label}: {error}")
+        total_deleted += found - len(errors)
+    return total_deleted
+
+
+async def delete_dashboard(pool, adb, user):
+    dashboard_ref = adb.collection('dashboards').document(user['id'])
+    try:
+        dashboard_doc = await pool.get(dashboard_ref)
+        if dashboard_doc.exists:
+            await pool.delete(dashboard_ref)
+            return 1
+    except Exception:
+        pass  # Silently continue if no dashboard exists
+    return 0
+
+
+async def delete_user(pool, adb, user):
+    """
+    Borra el usuario de Firestore (con sus contadores users/{id}/usage, que
+    no se borran solos con el doc) y de Auth; devuelve (en_firestore,
+    en_auth, mensaje).
+    """
+    label = f"{user['email']} (name: '{user['name']}')"
+    try:
+        _, errors = await pool.delete_all(adb.collection('users').document(user['id']).collection('usage'))
+        if errors:
+            raise errors[0]
+        await pool.delete(adb.collection('users').document(user['id']))
+    except Exception as e:
+        return False, False, f"  ❌ Error eliminando {user['email']}: {e}"
+    try:
+        await pool.thread('auth', auth.delete_user, user['id'])
+        return True, True, f"  ✅ {label} - Firestore + Auth"
+    except auth.UserNotFoundError:
+        return True, False, f"  ⚠️  {label} - Firestore OK, no existe en Auth"
+    except Exception as e:
+        return True, False, f"  ⚠️  {label} - Firestore OK, error Auth: {e}"
+
+
+async def purge_users(users_to_delete):
+    """
+    Pasos 3 a 5. Dentro de cada paso las queries y borrados de todos los
+    usuarios corren en paralelo con AsyncClient (acotados por AsyncPool).
+    """
+    adb = async_client()
+    pool = AsyncPool()
+    totals = {}
+
+    # Eliminar bookings de usuarios a eliminar
+    print("\n[3/5] Eliminando bookings de usuarios a eliminar...")
+    totals['bookings'] = await delete_user_docs(pool, adb, 'bookings', 'booking', users_to_delete)
+    print(f"\n✅ Total de bookings eliminadas: {totals['bookings']}\n")
+
+    # Eliminar pagos de usuarios a eliminar
+    print("[4/5] Eliminando pagos de usuarios a eliminar...")
+    totals['payments'] = await delete_user_docs(pool, adb, 'payments', 'pago', users_to_delete)
+    print(f"\n✅ Total de pagos eliminados: {totals['payments']}\n")
+
+    # Eliminar dashboards de usuarios a eliminar
+    print("   Eliminando dashboards de usuarios a eliminar...")
+    totals['dashboards'] = sum(await pool.gather(delete_dashboard(pool, adb, u) for u in users_to_delete))
+    if totals['dashboards'] > 0:
+        print(f"   ✅ Total de dashboards eliminados: {totals['dashboards']}\n")
+
+    # Eliminar usuarios de Firestore y Authentication
+    print("[5/5] Eliminando usuarios de Firestore y Authentication...")
+    results = await pool.gather(delete_user(pool, adb, u) for u in users_to_delete)
+    for _, _, message in results:
+        print(message)
+    totals['firestore'] = sum(1 for in_firestore, _, _ in results if in_firestore)
+    totals['auth'] = sum(1 for _, in_auth, _ in results if in_auth)
+    return totals
+
 
 def main():
+    stage_profiler.enable_from_argv()
     print("=" * 60)
     print("ELIMINACIÓN DE USUARIOS (EXCEPTO ADMIN)")
     print("=" * 60)
@@ -136,115 +224,18 @@ def main():
             print("\n❌ Operación cancelada")
             sys.exit(0)
 
-    # Crear lista de IDs de usuarios a eliminar
-    user_ids_to_delete = [user['id'] for user in users_to_delete]
-
-    # Eliminar bookings de usuarios a eliminar
-    print("\n[3/5] Eliminando bookings de usuarios a eliminar...")
-    total_bookings_deleted = 0
-
-    for user in users_to_delete:
-        user_id = user['id']
-        user_email = user['email']
-
-        # Buscar todas las bookings del usuario
-        bookings = db.collection('bookings').where('userId', '==', user_id).get()
-
-        if len(bookings) > 0:
-            print(f"  🗑️  {user_email}: {len(bookings)} booking(s)")
-
-            # Eliminar cada booking
-            for booking_doc in bookings:
-                try:
-                    booking_doc.reference.delete()
-                    total_bookings_deleted += 1
-                except Exception as e:
-                    print(f"     ⚠️  Error eliminando booking: {e}")
-
-    print(f"\n✅ Total de bookings eliminadas: {total_bookings_deleted}\n")
-
-    # Eliminar pagos de usuarios a eliminar
-    print("[4/5] Eliminando pagos de usuarios a eliminar...")
-    total_payments_deleted = 0
-
-    for user in users_to_delete:
-        user_id = user['id']
-        user_email = user['email']
-
-        # Buscar todos los pagos del usuario
-        payments = db.collection('payments').where('userId', '==', user_id).get()
-
-        if len(payments) > 0:
-            print(f"  🗑️  {user_email}: {len(payments)} pago(s)")
-
-            # Eliminar cada pago
-            for payment_doc in payments:
-                try:
-                    payment_doc.reference.delete()
-                    total_payments_deleted += 1
-                except Exception as e:
-                    print(f"     ⚠️  Error eliminando payment: {e}")
-
-    print(f"\n✅ Total de pagos eliminados: {total_payments_deleted}\n")
-
-    # Eliminar dashboards de usuarios a eliminar
-    print("   Eliminando dashboards de usuarios a eliminar...")
-    total_dashboards_deleted = 0
-
-    for user in users_to_delete:
-        user_id = user['id']
-
-        # Intentar eliminar dashboard del usuario
-        try:
-            dashboard_ref = db.collection('dashboards').document(user_id)
-            dashboard_doc = dashboard_ref.get()
-            if dashboard_doc.exists:
-                dashboard_ref.delete()
-                total_dashboards_deleted += 1
-        except Exception as e:
-            pass  # Silently continue if no dashboard exists
-
-    if total_dashboards_deleted > 0:
-        print(f"   ✅ Total de dashboards eliminados: {total_dashboards_deleted}\n")
-
-    # Eliminar usuarios de Firestore y Authentication
-    print("[5/5] Eliminando usuarios de Firestore y Authentication...")
-    users_deleted_firestore = 0
-    users_deleted_auth = 0
-
-    for user in users_to_delete:
-        user_id = user['id']
-        user_email = user['email']
-        user_name = user['name']
-
-        try:
-            # Eliminar de Firestore
-            db.collection('users').document(user_id).delete()
-            users_deleted_firestore += 1
-
-            # Eliminar de Firebase Authentication
-            try:
-                auth.delete_user(user_id)
-                users_deleted_auth += 1
-                print(f"  ✅ {user_email} (name: '{user_name}') - Firestore + Auth")
-            except auth.UserNotFoundError:
-                print(f"  ⚠️  {user_email} (name: '{user_name}') - Firestore OK, no existe en Auth")
-            except Exception as e:
-                print(f"  ⚠️  {user_email} (name: '{user_name}') - Firestore OK, error Auth: {e}")
-
-        except Exception as e:
-            print(f"  ❌ Error eliminando {user_email}: {e}")
+    totals = run(purge_users(users_to_delete))
 
     # Resumen final
     print("\n" + "=" * 60)
     print("✅ ELIMINACIÓN COMPLETADA")
     print("=" * 60)
-    print(f"Usuarios eliminados de Firestore: {users_deleted_firestore}/{len(users_to_delete)}")
-    print(f"Usuarios eliminados de Auth: {users_deleted_auth}/{len(users_to_delete)}")
-    print(f"Bookings eliminadas: {total_bookings_deleted}")
-    print(f"Pagos eliminados: {total_payments_deleted}")
-    if total_dashboards_deleted > 0:
-        print(f"Dashboards eliminados: {total_dashboards_deleted}")
+    print(f"Usuarios eliminados de Firestore: {totals['firestore']}/{len(users_to_delete)}")
+    print(f"Usuarios eliminados de Auth: {totals['auth']}/{len(users_to_delete)}")
+    print(f"Bookings eliminadas: {totals['bookings']}")
+    print(f"Pagos eliminados: {totals['payments']}")
+    if totals['dashboards'] > 0:
+        print(f"Dashboards eliminados: {totals['dashboards']}")
     print(f"\n✅ Usuarios PRESERVADOS: {len(users_to_preserve)}")
     for user in users_to_preserve:
         print(f"   - {user['email']} (name: '{user['name']}', role: {user['role']})")
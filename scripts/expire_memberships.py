@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Barrido diario de membresías vencidas.
+
+Hoy una membresía vencida solo se detecta cuando el alumno abre la app
+(DashboardViewModel la pasa a 'inactive') o cuando alguien corre
+check_users_status.py y lee el expirationDate. Este script hace la
+transición en bloque:
+
+  users where membershipStatus == 'active' and expirationDate <= ahora
+
+La query usa el índice compuesto (membershipStatus, expirationDate) de
+firestore.indexes.json y se recorre en páginas con cursor, así que el costo
+es proporcional a los docs que efectivamente vencen, no al total de users.
+
+Por cada usuario vencido, en la misma pasada y con el mismo BulkWriter:
+  - membershipStatus -> 'expired' (+ updatedAt)
+  - doc en `notifications` (type 'membership_expired') si tiene fcmToken;
+    sendImmediateNotification lo envía.
+
+Uso:
+  python scripts/expire_memberships.py                 # dry-run
+  python scripts/expire_memberships.py --apply
+  python scripts/expire_memberships.py --apply --no-notify
+"""
+
+import argparse
+import sys
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+
+from firebase_common import bulk_writer, fix_windows_encoding, init_firestore
+
+USER_FIELDS = ['email', 'name', 'role', 'fcmToken', 'expirationDate']
+
+fix_windows_encoding()
+
+
+def iter_expired(db, now, page_size):
+    """Páginas de usuarios activos con expirationDate <= now (índice compuesto)."""
+    query = (db.collection('users')
+             .where('membershipStatus', '==', 'active')
+             .where('expirationDate', '<=', now)
+             .order_by('expirationDate')
+             .select(USER_FIELDS)
+             .limit(page_size))
+    cursor = None
+    while True:
+        page = list((query.start_after(cursor) if cursor else query).stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+
+def expiration_notification(user_id, user):
+    return {
+        'userId': user_id,
+        'fcmToken': user['fcmToken'],
+        'title': 'Tu membresía venció',
+        'body': 'Renueva tu plan para seguir reservando clases.',
+        'data': {'type': 'membership_expired'},
+        'createdAt': firestore.SERVER_TIMESTAMP,
+        'sent': False,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Barrido de membresías vencidas')
+    parser.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+    parser.add_argument('--no-notify', action='store_true', help='No encolar notificaciones')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--apply', action='store_true', help='Aplica los cambios (default: dry-run)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BARRIDO DE MEMBRESÍAS VENCIDAS")
+    print("=" * 60)
+    now = datetime.now(timezone.utc)
+    mode = 'APLICANDO' if args.apply else 'DRY-RUN (sin cambios)'
+    print(f"\n=== {mode} ===  (ahora: {now:%d/%m/%Y %H:%M} UTC)\n")
+
+    db = init_firestore(args.service_account)
+    writer = bulk_writer(db) if args.apply else None
+    expired = notified = skipped_admins = 0
+
+    print("[1/2] Buscando membresías activas vencidas...")
+    for page in iter_expired(db, now, args.page_size):
+        for user_doc in page:
+            user = user_doc.to_dict() or {}
+            if user.get('role') == 'admin':
+                skipped_admins += 1
+                continue
+
+            expired += 1
+            will_notify = not args.no_notify and bool(user.get('fcmToken'))
+            notified += will_notify
+            expiration = user.get('expirationDate')
+            print(f"  - {expiration:%d/%m/%Y}  {user.get('email', 'sin email')}  "
+                  f"{'🔔' if will_notify else ''} [{user_doc.id}]")
+
+            if writer:
+                writer.update(user_doc.reference, {
+                    'membershipStatus': 'expired',
+                    'updatedAt': firestore.SERVER_TIMESTAMP,
+                })
+                if will_notify:
+                    writer.create(db.collection('notifications').document(),
+                                  expiration_notification(user_doc.id, user))
+
+    print(f"\n✅ Membresías vencidas: {expired}  (notificaciones: {notified})")
+    if skipped_admins:
+        print(f"⏭️  Admins omitidos: {skipped_admins}")
+
+    if not args.apply:
+        print('\nDry-run terminado. Ejecuta con --apply para aplicar.')
+        return
+
+    print("\n[2/2] Confirmando escrituras...")
+    writer.close()
+    if writer.failures:
+        for failure in writer.failures:
+            print(f"  ❌ {failure.operation.reference.path}: {failure.message}")
+        sys.exit(1)
+    print(f"✅ Listo: {expired} membresías pasadas a 'expired'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportador genérico y paralelo de una colección (NDJSON / CSV / Parquet).
+
+export_beta_signups.py lee una colección con un único cursor y la imprime;
+cualquier otra exportación terminaba siendo otro script ad-hoc. Este script:
+
+  1. Divide la colección con CollectionGroup.get_partitions en N particiones
+     (rangos de IDs que Firestore calcula del lado servidor).
+  2. Lee las particiones en paralelo con un ThreadPoolExecutor, con
+     proyección opcional de campos (--fields).
+  3. Escribe en streaming desde una cola acotada: la memoria no crece con
+     el tamaño de la colección.
+
+Como get_partitions trabaja sobre el collection group, por defecto se
+descartan las subcolecciones homónimas y solo se exporta la colección raíz
+(--all-groups para incluirlas).
+
+Formatos:
+  ndjson   una línea JSON por doc: {"__id__": ..., "__path__": ..., campos...}
+  csv      columnas __id__ + --fields. Sin --fields, la unión (ordenada) de
+           los campos de TODOS los docs: las filas se guardan en un NDJSON
+           temporal junto a la salida y el CSV se escribe al cerrar, cuando
+           ya se conocen todas las columnas (ocupa disco, no memoria)
+  parquet  requiere pyarrow (pip install pyarrow); columnas como csv. También
+           pasa por un NDJSON temporal: el tipo de cada columna sale de
+           todas las filas (ints y floats mezclados -> float64; cualquier
+           otra mezcla -> JSON string)
+
+Uso:
+  python scripts/export_collection.py bookings -o bookings.ndjson
+  python scripts/export_collection.py bookings -o bookings.csv --format csv \\
+      --fields userId,scheduleId,classDate,status
+  python scripts/export_collection.py payments -o payments.parquet --format parquet --workers 16
+"""
+
+import argparse
+import base64
+import contextlib
+import csv
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from google.cloud.firestore_v1 import DocumentReference, GeoPoint
+
+from firebase_common import fix_windows_encoding, init_firestore
+
+# Filas por lote que los lectores entregan al escritor
+ROW_BATCH = 500
+PARQUET_ROW_GROUP = 10000
+
+_DONE = object()
+
+fix_windows_encoding()
+
+
+def to_plain(value):
+    """Convierte tipos de Firestore a valores serializables en JSON."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, DocumentReference):
+        return value.path
+    if isinstance(value, GeoPoint):
+        return {'latitude': value.latitude, 'longitude': value.longitude}
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    return value
+
+
+def to_row(doc):
+    row = {'__id__': doc.id, '__path__': doc.reference.path}
+    row.update(doc.to_dict() or {})
+    return row
+
+
+# ---------------------------------------------------------------------------
+# Escritores (un solo hilo consume la cola)
+# ---------------------------------------------------------------------------
+
+class NdjsonSink:
+    def __init__(self, path, fields):
+        self.f = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        for row in rows:
+            self.f.write(json.dumps(to_plain(row), ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.f.close()
+
+
+class CsvSink:
+    """
+    Con --fields escribe en streaming. Sin --fields las columnas no se
+    conocen hasta leer el último doc: cada fila va a un NDJSON temporal y
+    close() escribe el encabezado con la unión de campos y luego las filas.
+    """
+
+    def __init__(self, path, fields):
+        self.f = open(path, 'w', newline='', encoding='utf-8')
+        self.fields = fields
+        self.writer = None
+        self.spool = None
+        self.columns = set()
+        if fields:
+            self.writer = csv.DictWriter(self.f, fieldnames=['__id__'] + fields, extrasaction='ignore')
+            self.writer.writeheader()
+        else:
+            self.spool = tempfile.TemporaryFile('w+', encoding='utf-8',
+                                                dir=os.path.dirname(os.path.abspath(path)))
+
+    def write(self, rows):
+        for row in rows:
+            cells = {k: self._cell(v) for k, v in row.items()}
+            if self.spool is None:
+                self.writer.writerow(cells)
+                continue
+            self.columns.update(k for k in row if not k.startswith('__'))
+            self.spool.write(json.dumps(cells, ensure_ascii=False) + '\n')
+
+    @staticmethod
+    def _cell(value):
+        value = to_plain(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def close(self):
+        if self.spool is not None:
+            self.writer = csv.DictWriter(self.f, fieldnames=['__id__'] + sorted(self.columns),
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+            self.spool.seek(0)
+            for line in self.spool:
+                self.writer.writerow(json.loads(line))
+            self.spool.close()
+        self.f.close()
+
+
+class ParquetSink:
+    """
+    Igual que CsvSink sin --fields: cada fila va a un NDJSON temporal y se
+    registra el tipo de cada valor por columna; close() arma el esquema con
+    TODAS las filas y escribe por row groups. Una columna es bool, int64,
+    float64 (ints y floats mezclados) o timestamp solo si todos sus valores
+    lo son; cualquier otra mezcla va como JSON string, así nada se trunca ni
+    se pierde.
+    """
+
+    def __init__(self, path, fields):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("❌ El formato parquet requiere pyarrow: pip install pyarrow")
+            sys.exit(1)
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.fields = fields
+        self.kinds = {}    # columna -> tipos vistos ('bool', 'int', 'float', 'timestamp', 'other')
+        self.spool = tempfile.TemporaryFile('w+', encoding='utf-8',
+                                            dir=os.path.dirname(os.path.abspath(path)))
+
+    @staticmethod
+    def _kind(value):
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, int):
+            return 'int'
+        if isinstance(value, float):
+            return 'float'
+        if isinstance(value, datetime):
+            return 'timestamp'
+        return 'other'
+
+    def write(self, rows):
+        for row in rows:
+            for key, value in row.items():
+                if key.startswith('__'):
+                    continue
+                kinds = self.kinds.setdefault(key, set())
+                if value is not None:
+                    kinds.add(self._kind(value))
+            self.spool.write(json.dumps(to_plain(row), ensure_ascii=False) + '\n')
+
+    def _column_type(self, kinds):
+        pa = self.pa
+        if kinds and kinds <= {'bool'}:
+            return pa.bool_()
+        if kinds and kinds <= {'int'}:
+            return pa.int64()
+        if kinds and kinds <= {'int', 'float'}:
+            return pa.float64()
+        if kinds and kinds <= {'timestamp'}:
+            return pa.timestamp('us', tz='UTC')
+        return pa.string()
+
+    def _coerce(self, value, pa_type):
+        """`value` viene del spool (to_plain): el esquema ya garantiza que encaja."""
+        pa = self.pa
+        if value is None:
+            return None
+        if pa_type == pa.string():
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        if pa_type == pa.timestamp('us', tz='UTC'):
+            return datetime.fromisoformat(value)
+        if pa_type == pa.float64():
+            return float(value)
+        return value
+
+    def _write_group(self, writer, schema, rows):
+        arrays = [
+            self.pa.array([self._coerce(r.get(field.name), field.type) for r in rows], type=field.type)
+            for field in schema
+        ]
+        writer.write_table(self.pa.Table.from_arrays(arrays, schema=schema))
+
+    def close(self):
+        pa = self.pa
+        columns = ['__id__'] + (self.fields or sorted(self.kinds))
+        schema = pa.schema([
+            (c, pa.string() if c == '__id__' else self._column_type(self.kinds.get(c, set())))
+            for c in columns
+        ])
+        writer = self.pq.ParquetWriter(self.path, schema, compression='zstd')
+        try:
+            self.spool.seek(0)
+            rows = []
+            for line in self.spool:
+                rows.append(json.loads(line))
+                if len(rows) >= PARQUET_ROW_GROUP:
+                    self._write_group(writer, schema, rows)
+                    rows = []
+            if rows:
+                self._write_group(writer, schema, rows)
+        finally:
+            writer.close()
+            self.spool.close()
+
+
+SINKS = {'ndjson': NdjsonSink, 'csv': CsvSink, 'parquet': ParquetSink}
+
+
+# ---------------------------------------------------------------------------
+# Lectura paralela
+# ---------------------------------------------------------------------------
+
+def read_partition(partition, fields, root_only, out_queue):
+    query = partition.query()
+    if fields:
+        query = query.select(fields)
+    count = 0
+    batch = []
+    for doc in query.stream():
+        if root_only and doc.reference.parent.parent is not None:
+            continue
+        batch.append(to_row(doc))
+        if len(batch) >= ROW_BATCH:
+            out_queue.put(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        out_queue.put(batch)
+        count += len(batch)
+    return count
+
+
+def drain(out_queue, sink, progress):
+    """
+    Escribe los lotes hasta _DONE. Si el sink falla (disco lleno, pyarrow)
+    guarda el error y sigue vaciando la cola: si el hilo muriera, los
+    lectores quedarían bloqueados para siempre en out_queue.put.
+    """
+    while True:
+        rows = out_queue.get()
+        if rows is _DONE:
+            return
+        if progress['error'] is not None:
+            continue
+        try:
+            sink.write(rows)
+        except Exception as e:
+            progress['error'] = e
+            continue
+        progress['written'] += len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportador paralelo de colecciones')
+    parser.add_argument('collection', help='Nombre de la colección (p.ej. bookings)')
+    parser.add_argument('-o', '--output', required=True, help='Archivo de salida')
+    parser.add_argument('--format', choices=sorted(SINKS), default='ndjson')
+    parser.add_argument('--fields', help='Campos a exportar, separados por coma (proyección)')
+    parser.add_argument('--partitions', type=int, default=32,
+                        help='Particiones pedidas a Firestore (default 32)')
+    parser.add_argument('--workers', type=int, default=8, help='Hilos lectores (default 8)')
+    parser.add_argument('--all-groups', action='store_true',
+                        help='Incluir subcolecciones con el mismo nombre')
+    parser.add_argument('--service-account', help='Ruta al service account JSON')
+    args = parser.parse_args()
+
+    fields = [f.strip() for f in args.fields.split(',')] if args.fields else None
+
+    print("=" * 60)
+    print(f"EXPORTACIÓN DE '{args.collection}' → {args.output} ({args.format})")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+    started = time.monotonic()
+
+    print(f"[1/2] Pidiendo hasta {args.partitions} particiones...")
+    partitions = list(db.collection_group(args.collection).get_partitions(args.partitions))
+    print(f"✅ {len(partitions)} particiones\n")
+
+    print(f"[2/2] Leyendo con {args.workers} hilos y escribiendo en streaming...")
+    sink = SINKS[args.format](args.output, fields)
+    out_queue = queue.Queue(maxsize=args.workers * 4)
+    progress = {'written': 0, 'error': None}
+    writer_thread = threading.Thread(target=drain, args=(out_queue, sink, progress))
+    writer_thread.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(read_partition, p, fields, not args.all_groups, out_queue)
+                       for p in partitions]
+            total = sum(f.result() for f in futures)
+    finally:
+        out_queue.put(_DONE)
+        writer_thread.join()
+        if progress['error'] is None:
+            sink.close()
+        else:
+            with contextlib.suppress(Exception):
+                sink.close()
+    if progress['error'] is not None:
+        print(f"❌ Falló la escritura de {args.output} tras {progress['written']} documentos")
+        raise progress['error']
+
+    elapsed = time.monotonic() - started
+    print(f"✅ {total} documentos exportados en {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.0f} docs/s)")
+
+
+if __name__ == '__main__':
+    main()
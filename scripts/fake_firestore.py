@@ -0,0 +1,1024 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Firestore falso en memoria para probar y medir scripts sin proyecto real.
+
+Probar un script hoy significa un proyecto real o esperar a que arranque el
+emulador. Este módulo implementa, en el mismo proceso, el subconjunto del
+cliente que usan los scripts:
+
+  - client.collection / document / collection_group / get_all / batch /
+    transaction / bulk_writer / write_option
+  - Referencias de colección y documento (get, set con merge, update con
+    field paths, create, delete, add, subcolecciones, list_documents)
+  - Queries: where (incluido FieldFilter/And/Or), order_by, limit,
+    limit_to_last, offset, select, start_at/start_after/end_at/end_before
+    (con snapshot o dict, también por __name__) y count/sum/avg
+  - SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion, ArrayRemove,
+    Maximum y Minimum
+  - Precondiciones (update_time y exists) con los mismos errores de
+    google.api_core.exceptions que el backend real
+  - Transacciones optimistas: si un doc leído cambió antes del commit se
+    lanza Aborted, así que @firestore.transactional reintenta como en
+    producción
+
+Los snapshots son DocumentSnapshot reales y los timestamps
+DatetimeWithNanoseconds en UTC, como los entrega el cliente.
+
+Estado:
+  db.snapshot_state() / db.restore_state(estado)   copia y vuelta atrás
+  db.load({'users/abc': {...}})                    sembrar datos
+  db.load_snapshot('snapshots/antes')              sembrar desde firestore_snapshot.py
+  db.dump()                                        {path: datos}
+  db.stats                                         lecturas/escrituras/borrados
+
+Uso:
+  from fake_firestore import FakeFirestore, use_fake_firestore
+  import usage_counters
+
+  db = FakeFirestore()
+  db.load({'bookings/b1': {'userId': 'u1', 'status': 'confirmed', 'classDate': fecha}})
+  usage_counters.rebuild(db)
+  assert db.document('users/u1/usage/2026-10').get().get('total') == 1
+
+  with use_fake_firestore(db):      # para scripts que llaman init_firestore()
+      expire_memberships.main()
+"""
+
+import contextlib
+import copy
+import functools
+import itertools
+import os
+import random
+import string
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from google.api_core import exceptions
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import DocumentSnapshot, GeoPoint, transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+from google.cloud.firestore_v1.base_client import BaseClient
+from google.cloud.firestore_v1.base_query import And, FieldFilter, Or
+from google.cloud.firestore_v1.bulk_writer import (BulkWriteFailure, BulkWriterCreateOperation,
+                                                   BulkWriterDeleteOperation, BulkWriterSetOperation,
+                                                   BulkWriterUpdateOperation)
+from google.cloud.firestore_v1.field_path import FieldPath, split_field_path
+
+DOCUMENT_ID = FieldPath.document_id()
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+MAX_BATCH_WRITES = 500
+MAX_BULK_ATTEMPTS = 10
+
+# Códigos gRPC de las excepciones que puede lanzar un commit
+_ERROR_CODES = {
+    exceptions.InvalidArgument: 3,
+    exceptions.NotFound: 5,
+    exceptions.AlreadyExists: 6,
+    exceptions.PermissionDenied: 7,
+    exceptions.FailedPrecondition: 9,
+    exceptions.Aborted: 10,
+    exceptions.ResourceExhausted: 8,
+    exceptions.DeadlineExceeded: 4,
+    exceptions.ServiceUnavailable: 14,
+}
+
+_INEQUALITY_OPS = {'<', '<=', '>', '>=', '!=', 'not-in'}
+
+
+# ---------------------------------------------------------------------------
+# Valores: orden de tipos de Firestore y field paths
+# ---------------------------------------------------------------------------
+
+def _field_parts(field_path):
+    if isinstance(field_path, FieldPath):
+        return list(field_path.parts)
+    return [p.strip('`') for p in split_field_path(field_path)]
+
+
+def _get_field(data, parts):
+    value = data
+    for part in parts:
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data, parts, value):
+    for part in parts[:-1]:
+        if not isinstance(data.get(part), dict):
+            data[part] = {}
+        data = data[part]
+    data[parts[-1]] = value
+
+
+def _delete_field(data, parts):
+    for part in parts[:-1]:
+        data = data.get(part)
+        if not isinstance(data, dict):
+            return
+    data.pop(parts[-1], None)
+
+
+class _Missing:
+    def __repr__(self):
+        return '<missing>'
+
+
+_MISSING = _Missing()
+
+
+def sort_key(value):
+    """Clave de orden entre tipos distintos según las reglas de Firestore."""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, _as_utc(value))
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, FakeDocumentReference):
+        return (6, tuple(value.path.split('/')))
+    if isinstance(value, GeoPoint):
+        return (7, (value.latitude, value.longitude))
+    if isinstance(value, list):
+        return (8, tuple(sort_key(v) for v in value))
+    if isinstance(value, dict):
+        return (9, tuple((k, sort_key(v)) for k, v in sorted(value.items())))
+    raise TypeError(f'Tipo no soportado por Firestore: {type(value).__name__}')
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _to_stored(value):
+    """Normaliza un valor como lo guardaría Firestore."""
+    if isinstance(value, datetime):
+        value = _as_utc(value)
+        if isinstance(value, DatetimeWithNanoseconds):
+            return value
+        return DatetimeWithNanoseconds(value.year, value.month, value.day, value.hour,
+                                       value.minute, value.second, value.microsecond,
+                                       tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {k: _to_stored(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_stored(v) for v in value]
+    return value
+
+
+def _equal(a, b):
+    return sort_key(a) == sort_key(b)
+
+
+def _compare(value, op, target):
+    if op == '==':
+        return _equal(value, target)
+    if op == '!=':
+        return value is not None and not _equal(value, target)
+    if op == 'in':
+        return any(_equal(value, t) for t in target)
+    if op == 'not-in':
+        return value is not None and not any(_equal(value, t) for t in target)
+    if op == 'array-contains':
+        return isinstance(value, list) and any(_equal(v, target) for v in value)
+    if op == 'array-contains-any':
+        return isinstance(value, list) and any(_equal(v, t) for v in value for t in target)
+    left, right = sort_key(value), sort_key(target)
+    if left[0] != right[0]:
+        # Firestore solo compara valores del mismo tipo
+        return False
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[op]
+
+
+def _precondition_time(option):
+    value = option._last_update_time
+    if isinstance(value, datetime):
+        value = DatetimeWithNanoseconds.from_rfc3339(_to_stored(value).rfc3339()).timestamp_pb()
+    return (value.seconds, value.nanos)
+
+
+# ---------------------------------------------------------------------------
+# Referencias
+# ---------------------------------------------------------------------------
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f'<FakeDocumentReference {self.path}>'
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self._client, f'{self.path}/{collection_id}')
+
+    def collections(self):
+        return [FakeCollectionReference(self._client, path)
+                for path in self._client._subcollections(self.path)]
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        if transaction is not None:
+            return next(transaction.get(self))
+        return self._client._snapshot(self.path, field_paths)
+
+    def create(self, document_data):
+        return self._client._commit([('create', self.path, document_data, None)])[0]
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self.path, document_data, merge)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._client._commit([('update', self.path, field_updates, option)])[0]
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self.path, None, option)])[0].update_time
+
+
+class FakeQuery:
+    ASCENDING = ASCENDING
+    DESCENDING = DESCENDING
+
+    def __init__(self, client, collection_path, all_descendants=False):
+        self._client = client
+        self._collection_path = collection_path
+        self._all_descendants = all_descendants
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._limit_to_last = False
+        self._offset = 0
+        self._projection = None
+        self._start = None   # (valores, antes_incluido)
+        self._end = None
+
+    @property
+    def _parent(self):
+        return FakeCollectionReference(self._client, self._collection_path)
+
+    def _copy(self, **changes):
+        query = copy.copy(self)
+        query.__class__ = FakeCollectionGroup if self._all_descendants else FakeQuery
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    # --- Construcción ---------------------------------------------------
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is None:
+            filter = FieldFilter(field_path, op_string, value)
+        return self._copy(_filters=self._filters + [filter])
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(_orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(_limit=count, _limit_to_last=False)
+
+    def limit_to_last(self, count):
+        return self._copy(_limit=count, _limit_to_last=True)
+
+    def offset(self, num_to_skip):
+        return self._copy(_offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy(_projection=list(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(_start=(document_fields_or_snapshot, True))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(_start=(document_fields_or_snapshot, False))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy(_end=(document_fields_or_snapshot, True))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(_end=(document_fields_or_snapshot, False))
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).avg(field_ref, alias)
+
+    # --- Ejecución ------------------------------------------------------
+
+    def _matches(self, path, data, filter):
+        if isinstance(filter, (And, Or)):
+            results = (self._matches(path, data, f) for f in filter.filters)
+            return all(results) if isinstance(filter, And) else any(results)
+        if filter.field_path in (DOCUMENT_ID, '__name__'):
+            value = FakeDocumentReference(self._client, path)
+            target = filter.value
+            if isinstance(target, (list, tuple)):
+                target = [self._name_value(t) for t in target]
+            else:
+                target = self._name_value(target)
+            return _compare(value, filter.op_string, target)
+        value = _get_field(data, _field_parts(filter.field_path))
+        if value is _MISSING:
+            return False
+        return _compare(value, filter.op_string, filter.value)
+
+    def _name_value(self, value):
+        if isinstance(value, FakeDocumentReference):
+            return value
+        if isinstance(value, str) and '/' not in value:
+            value = f'{self._collection_path}/{value}'
+        return FakeDocumentReference(self._client, value)
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not orders:
+            for f in self._filters:
+                if isinstance(f, FieldFilter) and f.op_string in _INEQUALITY_OPS:
+                    orders.append((f.field_path, ASCENDING))
+                    break
+        if not any(field in (DOCUMENT_ID, '__name__') for field, _ in orders):
+            direction = orders[-1][1] if orders else ASCENDING
+            orders.append((DOCUMENT_ID, direction))
+        return orders
+
+    def _order_values(self, path, data, orders):
+        values = []
+        for field, _ in orders:
+            if field in (DOCUMENT_ID, '__name__'):
+                values.append(FakeDocumentReference(self._client, path))
+            else:
+                values.append(_get_field(data, _field_parts(field)))
+        return values
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, DocumentSnapshot):
+            return self._order_values(cursor.reference.path, cursor._data, orders)
+        if isinstance(cursor, dict):
+            values = []
+            for field, _ in orders:
+                key = '__name__' if field == DOCUMENT_ID else field
+                if key not in cursor:
+                    break
+                value = cursor[key]
+                values.append(self._name_value(value) if key == '__name__' else value)
+            return values
+        return list(cursor)
+
+    @staticmethod
+    def _position(values, cursor_values, orders):
+        """<0, 0 o >0 según el doc quede antes, en o después del cursor."""
+        for value, target, (_, direction) in zip(values, cursor_values, orders):
+            left, right = sort_key(value), sort_key(target)
+            if left != right:
+                result = -1 if left < right else 1
+                return -result if direction == DESCENDING else result
+        return 0
+
+    def _run(self):
+        orders = self._effective_orders()
+        rows = []
+        for path, record in self._client._documents(self._collection_path, self._all_descendants):
+            data = record['data']
+            if not all(self._matches(path, data, f) for f in self._filters):
+                continue
+            values = self._order_values(path, data, orders)
+            if any(v is _MISSING for v in values):
+                continue  # Firestore excluye los docs sin el campo de orden
+            rows.append((values, path, record))
+
+        def compare(a, b):
+            return self._position(a[0], b[0], orders)
+
+        rows.sort(key=functools.cmp_to_key(compare))
+
+        if self._start:
+            cursor, inclusive = self._start
+            target = self._cursor_values(cursor, orders)
+            rows = [r for r in rows
+                    if (self._position(r[0], target, orders) >= 0 if inclusive
+                        else self._position(r[0], target, orders) > 0)]
+        if self._end:
+            cursor, inclusive = self._end
+            target = self._cursor_values(cursor, orders)
+            rows = [r for r in rows
+                    if (self._position(r[0], target, orders) <= 0 if inclusive
+                        else self._position(r[0], target, orders) < 0)]
+
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[-self._limit:] if self._limit_to_last else rows[:self._limit]
+        return [(path, record) for _, path, record in rows]
+
+    def stream(self, transaction=None, **kwargs):
+        if transaction is not None:
+            yield from transaction.get(self)
+            return
+        with self._client._lock:
+            rows = self._run()
+            self._client.stats['queries'] += 1
+            self._client.stats['reads'] += max(len(rows), 1)
+            snapshots = [self._client._make_snapshot(path, record, self._projection)
+                         for path, record in rows]
+        yield from snapshots
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream(transaction=transaction))
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def __repr__(self):
+        return f'<FakeCollectionReference {self.path}>'
+
+    @property
+    def parent(self):
+        if '/' not in self.path:
+            return None
+        return FakeDocumentReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = ''.join(random.choices(string.ascii_letters + string.digits, k=20))
+        return FakeDocumentReference(self._client, f'{self.path}/{document_id}')
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        result = ref.create(document_data)
+        return result.update_time, ref
+
+    def list_documents(self, page_size=None):
+        with self._client._lock:
+            ids = list(self._client._collections.get(self.path, {}))
+        return [self.document(i) for i in ids]
+
+
+class FakeCollectionGroup(FakeQuery):
+    def __init__(self, client, collection_id):
+        super().__init__(client, collection_id, all_descendants=True)
+
+    def get_partitions(self, partition_count, **kwargs):
+        yield _FakePartition(self)
+
+
+class _FakePartition:
+    def __init__(self, query):
+        self._query = query
+        self.start_at = None
+        self.end_at = None
+
+    def query(self):
+        return self._query
+
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self._nested_query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(('count', None, alias))
+        return self
+
+    def sum(self, field_ref, alias=None):
+        self._aggregations.append(('sum', field_ref, alias))
+        return self
+
+    def avg(self, field_ref, alias=None):
+        self._aggregations.append(('avg', field_ref, alias))
+        return self
+
+    def get(self, transaction=None, **kwargs):
+        client = self._nested_query._client
+        with client._lock:
+            rows = self._nested_query._run()
+            # Firestore cobra 1 lectura por cada 1000 entradas de índice
+            client.stats['reads'] += max(1, -(-len(rows) // 1000))
+        results = []
+        for index, (kind, field, alias) in enumerate(self._aggregations, start=1):
+            alias = alias or f'field_{index}'
+            if kind == 'count':
+                value = len(rows)
+            else:
+                numbers = [v for v in (_get_field(r['data'], _field_parts(field)) for _, r in rows)
+                           if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == 'sum':
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(AggregationResult(alias, value, client._now()))
+        return [results]
+
+    def stream(self, transaction=None, **kwargs):
+        yield from self.get(transaction)
+
+
+# ---------------------------------------------------------------------------
+# Escrituras: batch, transacción y BulkWriter
+# ---------------------------------------------------------------------------
+
+class _WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+        self.write_results = None
+        self.commit_time = None
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference.path, document_data, None))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference.path, document_data, merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference.path, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference.path, None, option))
+
+    def commit(self, **kwargs):
+        writes, self._writes = self._writes, []
+        self.write_results = self._client._commit(writes)
+        self.commit_time = self.write_results[0].update_time if self.write_results else None
+        return self.write_results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Compatible con @firestore.transactional (mismos métodos internos)."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._read_versions = {}
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+    def _begin(self, retry_id=None):
+        self._id = next(self._ids)
+
+    def _clean_up(self):
+        self._writes = []
+        self._read_versions = {}
+        self._id = None
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _record_read(self, snapshot):
+        self._read_versions.setdefault(snapshot.reference.path, snapshot.update_time)
+
+    def get(self, ref_or_query, **kwargs):
+        if self._writes:
+            raise ValueError('Firestore transactions require all reads to be executed '
+                             'before all writes.')
+        if isinstance(ref_or_query, FakeDocumentReference):
+            snapshot = ref_or_query.get()
+            self._record_read(snapshot)
+            return iter([snapshot])
+        snapshots = ref_or_query.get()
+        for snapshot in snapshots:
+            self._record_read(snapshot)
+        return iter(snapshots)
+
+    def get_all(self, references, **kwargs):
+        for ref in references:
+            yield from self.get(ref)
+
+    def _commit(self):
+        if not self.in_progress:
+            raise ValueError('Transaction not in progress, cannot be used in API requests.')
+        writes, versions = self._writes, self._read_versions
+        try:
+            self.write_results = self._client._commit(writes, read_versions=versions)
+        finally:
+            self._clean_up()
+        return self.write_results
+
+    def commit(self, **kwargs):
+        if not self.in_progress:
+            self._begin()
+        return self._commit()
+
+
+class FakeBulkWriter:
+    """Aplica cada operación por separado (como BulkWriter, sin atomicidad)."""
+
+    def __init__(self, client, options=None):
+        self._client = client
+        self._options = options
+        self._operations = []
+        self._rate_limiter = None
+        self._error_callback = lambda failure, writer: False
+        self._success_callback = lambda reference, result, writer: None
+
+    def on_write_error(self, callback):
+        self._error_callback = callback
+
+    def on_write_result(self, callback):
+        self._success_callback = callback
+
+    def on_batch_result(self, callback):
+        pass
+
+    def create(self, reference, document_data, attempts=0):
+        self._operations.append(BulkWriterCreateOperation(reference, document_data, attempts))
+
+    def set(self, reference, document_data, merge=False, attempts=0):
+        self._operations.append(BulkWriterSetOperation(reference, document_data, merge, attempts))
+
+    def update(self, reference, field_updates, option=None, attempts=0):
+        self._operations.append(BulkWriterUpdateOperation(reference, field_updates, option, attempts))
+
+    def delete(self, reference, option=None, attempts=0):
+        self._operations.append(BulkWriterDeleteOperation(reference, option, attempts))
+
+    @staticmethod
+    def _as_write(operation):
+        path = operation.reference.path
+        if isinstance(operation, BulkWriterCreateOperation):
+            return ('create', path, operation.document_data, None)
+        if isinstance(operation, BulkWriterSetOperation):
+            return ('set', path, operation.document_data, operation.merge)
+        if isinstance(operation, BulkWriterUpdateOperation):
+            return ('update', path, operation.field_updates, operation.option)
+        return ('delete', path, None, operation.option)
+
+    def flush(self):
+        operations, self._operations = self._operations, []
+        for operation in operations:
+            while True:
+                try:
+                    result = self._client._commit([self._as_write(operation)])[0]
+                except tuple(_ERROR_CODES) as exc:
+                    operation.attempts += 1
+                    code = next(c for cls, c in _ERROR_CODES.items() if isinstance(exc, cls))
+                    failure = BulkWriteFailure(operation, code, exc.message)
+                    if operation.attempts < MAX_BULK_ATTEMPTS and self._error_callback(failure, self):
+                        continue
+                    break
+                self._success_callback(operation.reference, result, self)
+                break
+
+    def close(self):
+        self.flush()
+
+
+# ---------------------------------------------------------------------------
+# Cliente
+# ---------------------------------------------------------------------------
+
+class FakeFirestore:
+    """Cliente de Firestore en memoria. `clock` permite fijar la hora en pruebas."""
+
+    write_option = staticmethod(BaseClient.write_option)
+
+    def __init__(self, project='fake-project', clock=None):
+        self.project = project
+        self._clock = clock or (lambda: datetime.now(timezone.utc))
+        self._lock = threading.RLock()
+        self._collections = {}   # path de colección -> {id: {'data', 'create_time', 'update_time'}}
+        self._last_commit = None
+        self._injected = []
+        self.stats = Counter()
+
+    # --- API del cliente --------------------------------------------------
+
+    def collection(self, *path):
+        return FakeCollectionReference(self, '/'.join(path))
+
+    def collection_group(self, collection_id):
+        return FakeCollectionGroup(self, collection_id)
+
+    def document(self, *path):
+        return FakeDocumentReference(self, '/'.join(path))
+
+    def collections(self):
+        return [FakeCollectionReference(self, path) for path in self._subcollections('')]
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        if transaction is not None:
+            yield from transaction.get_all(references)
+            return
+        for ref in references:
+            yield ref.get(field_paths)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return FakeTransaction(self, max_attempts, read_only)
+
+    def bulk_writer(self, options=None):
+        return FakeBulkWriter(self, options)
+
+    def close(self):
+        pass
+
+    # --- Estado -----------------------------------------------------------
+
+    def load(self, documents):
+        """Siembra docs {path: datos} (sentinels y transforms se aplican; no cuenta en stats)."""
+        stats = Counter(self.stats)
+        self._commit([('set', path, data, False) for path, data in documents.items()],
+                     check_limit=False)
+        self.stats = stats
+
+    def load_snapshot(self, directory):
+        """Siembra desde un snapshot de firestore_snapshot.py."""
+        from firestore_snapshot import decode_value, iter_snapshot_file, snapshot_entries
+        documents = {}
+        for entry in snapshot_entries(directory):
+            for record in iter_snapshot_file(os.path.join(directory, entry['file'])):
+                documents[record['path']] = decode_value(record['data'], self)
+        self.load(documents)
+
+    def dump(self):
+        with self._lock:
+            return {f'{collection}/{doc_id}': copy.deepcopy(record['data'])
+                    for collection, docs in sorted(self._collections.items())
+                    for doc_id, record in sorted(docs.items())}
+
+    def snapshot_state(self):
+        with self._lock:
+            return copy.deepcopy((self._collections, self._last_commit))
+
+    def restore_state(self, state):
+        with self._lock:
+            self._collections, self._last_commit = copy.deepcopy(state)
+
+    def inject_error(self, path_prefix, exception, times=1):
+        """Hace fallar las próximas `times` escrituras bajo `path_prefix`."""
+        with self._lock:
+            self._injected.append([path_prefix, exception, times])
+
+    # --- Internos ---------------------------------------------------------
+
+    def _now(self):
+        return _to_stored(self._clock())
+
+    def _commit_time(self):
+        now = self._now()
+        if self._last_commit is not None and now <= self._last_commit:
+            now = _to_stored(self._last_commit + timedelta(microseconds=1))
+        self._last_commit = now
+        return now
+
+    def _documents(self, collection_path, all_descendants):
+        if not all_descendants:
+            docs = self._collections.get(collection_path, {})
+            return [(f'{collection_path}/{doc_id}', record) for doc_id, record in docs.items()]
+        return [(f'{path}/{doc_id}', record)
+                for path, docs in self._collections.items()
+                if path.rsplit('/', 1)[-1] == collection_path
+                for doc_id, record in docs.items()]
+
+    def _record(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def _subcollections(self, document_path):
+        prefix = f'{document_path}/' if document_path else ''
+        depth = prefix.count('/') + 1
+        return sorted({'/'.join(path.split('/')[:depth]) for path, docs in self._collections.items()
+                       if path.startswith(prefix) and docs})
+
+    def _make_snapshot(self, path, record, field_paths=None):
+        ref = FakeDocumentReference(self, path)
+        if record is None:
+            return DocumentSnapshot(ref, None, exists=False, read_time=self._now(),
+                                    create_time=None, update_time=None)
+        data = record['data']
+        if field_paths is not None:
+            projected = {}
+            for field in field_paths:
+                parts = _field_parts(field)
+                value = _get_field(data, parts)
+                if value is not _MISSING:
+                    _set_field(projected, parts, value)
+            data = projected
+        return DocumentSnapshot(ref, data, exists=True, read_time=self._now(),
+                                create_time=record['create_time'], update_time=record['update_time'])
+
+    def _snapshot(self, path, field_paths=None):
+        with self._lock:
+            self.stats['reads'] += 1
+            return self._make_snapshot(path, self._record(path), field_paths)
+
+    def _check_injected(self, path):
+        for entry in self._injected:
+            prefix, exception, times = entry
+            if times > 0 and path.startswith(prefix):
+                entry[2] -= 1
+                raise exception
+        self._injected = [e for e in self._injected if e[2] > 0]
+
+    def _apply_value(self, data, parts, value, commit_time):
+        current = _get_field(data, parts)
+        if value is transforms.DELETE_FIELD:
+            _delete_field(data, parts)
+        elif value is transforms.SERVER_TIMESTAMP:
+            _set_field(data, parts, commit_time)
+        elif isinstance(value, transforms.Increment):
+            base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+            _set_field(data, parts, base + value.value)
+        elif isinstance(value, (transforms.Maximum, transforms.Minimum)):
+            pick = max if isinstance(value, transforms.Maximum) else min
+            if isinstance(current, (int, float)) and not isinstance(current, bool):
+                _set_field(data, parts, pick(current, value.value))
+            else:
+                _set_field(data, parts, value.value)
+        elif isinstance(value, transforms.ArrayUnion):
+            items = list(current) if isinstance(current, list) else []
+            for item in _to_stored(value.values):
+                if not any(_equal(item, existing) for existing in items):
+                    items.append(item)
+            _set_field(data, parts, items)
+        elif isinstance(value, transforms.ArrayRemove):
+            items = list(current) if isinstance(current, list) else []
+            removed = _to_stored(value.values)
+            _set_field(data, parts, [i for i in items if not any(_equal(i, r) for r in removed)])
+        elif isinstance(value, dict):
+            # Mapa con sentinels anidados (p.ej. {'data': {'sentAt': SERVER_TIMESTAMP}})
+            _set_field(data, parts, {})
+            for key, inner in value.items():
+                self._apply_value(data, parts + [key], inner, commit_time)
+        else:
+            _set_field(data, parts, copy.deepcopy(_to_stored(value)))
+
+    def _merge_into(self, data, document_data, prefix, commit_time):
+        for key, value in document_data.items():
+            parts = prefix + [key]
+            if isinstance(value, dict) and value:
+                if not isinstance(_get_field(data, parts), dict):
+                    _set_field(data, parts, {})
+                self._merge_into(data, value, parts, commit_time)
+            else:
+                self._apply_value(data, parts, value, commit_time)
+
+    def _check_option(self, path, record, option):
+        if option is None:
+            return
+        if hasattr(option, '_exists'):
+            if option._exists and record is None:
+                raise exceptions.NotFound(f'No document to update: {path}')
+            if not option._exists and record is not None:
+                raise exceptions.AlreadyExists(f'Document already exists: {path}')
+            return
+        if record is None:
+            raise exceptions.NotFound(f'No document to update: {path}')
+        stored = record['update_time'].timestamp_pb()
+        if (stored.seconds, stored.nanos) != _precondition_time(option):
+            raise exceptions.FailedPrecondition(f'the stored version does not match '
+                                                f'the required base version: {path}')
+
+    def _commit(self, writes, read_versions=None, check_limit=True):
+        """Aplica `writes` de forma atómica; lanza la excepción del backend real."""
+        if check_limit and len(writes) > MAX_BATCH_WRITES:
+            raise exceptions.InvalidArgument(
+                f'maximum {MAX_BATCH_WRITES} writes allowed per request')
+        with self._lock:
+            for path, update_time in (read_versions or {}).items():
+                record = self._record(path)
+                current = record['update_time'] if record else None
+                if current != update_time:
+                    raise exceptions.Aborted(f'Transaction lock timeout / contention on {path}')
+
+            commit_time = self._commit_time()
+            staged = {}
+            results = []
+            for kind, path, data, extra in writes:
+                self._check_injected(path)
+                record = staged[path] if path in staged else self._record(path)
+                if kind == 'create':
+                    if record is not None:
+                        raise exceptions.AlreadyExists(f'Document already exists: {path}')
+                elif kind == 'update':
+                    if record is None and extra is None:
+                        raise exceptions.NotFound(f'No document to update: {path}')
+                    self._check_option(path, record, extra)
+                elif kind == 'delete':
+                    self._check_option(path, record, extra)
+
+                if kind == 'delete':
+                    staged[path] = None
+                    self.stats['deletes'] += 1
+                else:
+                    if kind == 'update':
+                        new_data = copy.deepcopy(record['data'])
+                        for field, value in data.items():
+                            self._apply_value(new_data, _field_parts(field), value, commit_time)
+                    elif kind == 'set' and extra and record is not None:
+                        new_data = copy.deepcopy(record['data'])
+                        if isinstance(extra, list):
+                            for field in extra:
+                                parts = _field_parts(field)
+                                value = _get_field(data, parts)
+                                if value is _MISSING:
+                                    _delete_field(new_data, parts)
+                                else:
+                                    self._apply_value(new_data, parts, value, commit_time)
+                        else:
+                            self._merge_into(new_data, data, [], commit_time)
+                    else:
+                        new_data = {}
+                        self._merge_into(new_data, data, [], commit_time)
+                    staged[path] = {
+                        'data': new_data,
+                        'create_time': record['create_time'] if record else commit_time,
+                        'update_time': commit_time,
+                    }
+                    self.stats['writes'] += 1
+                results.append(_WriteResult(commit_time))
+
+            for path, record in staged.items():
+                collection, doc_id = path.rsplit('/', 1)
+                if record is None:
+                    self._collections.get(collection, {}).pop(doc_id, None)
+                else:
+                    self._collections.setdefault(collection, {})[doc_id] = record
+            return results
+
+
+@contextlib.contextmanager
+def use_fake_firestore(db):
+    """
+    Hace que init_firestore() y firestore.client() devuelvan `db`, también
+    en los módulos que ya hicieron `from firebase_common import init_firestore`.
+    """
+    import firebase_common
+    from firebase_admin import firestore
+    original_init, original_client = firebase_common.init_firestore, firestore.client
+
+    def fake_init(*args, **kwargs):
+        return db
+
+    patched = []
+    for module in list(sys.modules.values()):
+        if getattr(module, 'init_firestore', None) is original_init:
+            module.init_firestore = fake_init
+            patched.append(module)
+    firestore.client = lambda *args, **kwargs: db
+    try:
+        yield db
+    finally:
+        for module in patched:
+            module.init_firestore = original_init
+        firestore.client = original_client
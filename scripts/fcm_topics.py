@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Suscripciones FCM por topic y envíos broadcast.
+
+Hoy un aviso a todos los admins (send_test_to_admins) escribe un doc de
+`notifications` por destinatario, y un anuncio a todo el gimnasio requeriría
+un envío por alumno. Con topics el broadcast es un único `messaging.send`.
+
+Topics que mantiene este script:
+  - admins             usuarios con role == 'admin'
+  - active_members     alumnos con membershipStatus == 'active'
+  - schedule_<id>      alumnos con reservas confirmadas futuras en ese horario
+
+`sync` calcula los topics que le corresponden a cada fcmToken y los compara
+con lo que quedó registrado en el usuario (campos `fcmTopics` y
+`fcmTopicsToken`). Solo se suscribe/desuscribe la diferencia, agrupada por
+topic en lotes de 1000 tokens (límite de la API). Si el token cambió o se
+borró (logout, cambio de equipo), el token registrado se desuscribe de todos
+sus topics y el nuevo se suscribe completo: el equipo viejo de un admin
+degradado no sigue recibiendo los avisos de admins. Si esa desuscripción
+falla, el registro no se toca y la próxima corrida la reintenta.
+
+Uso:
+  python scripts/fcm_topics.py sync                      # dry-run
+  python scripts/fcm_topics.py sync --apply
+  python scripts/fcm_topics.py send --topic active_members --title "Aviso" --body "Mañana cerrado"
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from firebase_admin import firestore, messaging
+
+from firebase_common import bulk_writer, chunked, fix_windows_encoding, init_firestore, iter_docs
+
+ADMINS_TOPIC = 'admins'
+ACTIVE_MEMBERS_TOPIC = 'active_members'
+SCHEDULE_TOPIC_PREFIX = 'schedule_'
+
+# Límite de tokens por llamada a subscribe_to_topic / unsubscribe_from_topic
+TOPIC_BATCH_SIZE = 1000
+
+USER_FIELDS = ['fcmToken', 'role', 'membershipStatus', 'fcmTopics', 'fcmTopicsToken']
+
+# Errores que indican que el token ya no sirve (no se registra la suscripción).
+# ErrorInfo.reason trae el código crudo de la API de Instance ID.
+DEAD_TOKEN_REASONS = {'NOT_FOUND', 'INVALID_ARGUMENT'}
+
+fix_windows_encoding()
+
+
+def schedule_topic(schedule_id):
+    return f'{SCHEDULE_TOPIC_PREFIX}{schedule_id}'
+
+
+def load_future_attendance(db):
+    """userId -> set(scheduleId) con reservas confirmadas desde hoy."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    attendance = defaultdict(set)
+    query = (db.collection('bookings')
+             .where('classDate', '>=', today)
+             .select(['userId', 'scheduleId', 'status']))
+    for doc in query.stream():
+        b = doc.to_dict() or {}
+        if b.get('status') == 'confirmed' and b.get('userId') and b.get('scheduleId'):
+            attendance[b['userId']].add(b['scheduleId'])
+    return attendance
+
+
+def desired_topics(user, schedule_ids):
+    topics = set()
+    if user.get('role') == 'admin':
+        topics.add(ADMINS_TOPIC)
+    elif user.get('membershipStatus') == 'active':
+        topics.add(ACTIVE_MEMBERS_TOPIC)
+    topics.update(schedule_topic(sid) for sid in schedule_ids)
+    return topics
+
+
+def plan_sync(db):
+    """
+    Devuelve (subscribe, unsubscribe, user_states, replaced):
+      subscribe/unsubscribe: topic -> [(token, userId)]
+      user_states:           userId -> (token, topics) a registrar si cambió
+      replaced:              userIds cuyo token registrado se desuscribe
+                             porque cambió o se borró
+    """
+    attendance = load_future_attendance(db)
+    subscribe = defaultdict(list)
+    unsubscribe = defaultdict(list)
+    user_states = {}
+    replaced = set()
+
+    for doc in iter_docs(db.collection('users').select(USER_FIELDS)):
+        user = doc.to_dict() or {}
+        token = user.get('fcmToken')
+        old_token = user.get('fcmTopicsToken')
+        current = set(user.get('fcmTopics') or [])
+        same_token = token and token == old_token
+
+        if old_token and not same_token and current:
+            # El token registrado sigue suscrito aunque la app ya no lo use
+            for topic in current:
+                unsubscribe[topic].append((old_token, doc.id))
+            replaced.add(doc.id)
+
+        if not token:
+            # Sin token no hay nada que suscribir; solo limpiar el registro
+            if current or old_token:
+                user_states[doc.id] = (None, set())
+            continue
+
+        wanted = desired_topics(user, attendance.get(doc.id, ()))
+        if same_token:
+            added, removed = wanted - current, current - wanted
+        else:
+            added, removed = wanted, set()
+
+        for topic in added:
+            subscribe[topic].append((token, doc.id))
+        for topic in removed:
+            unsubscribe[topic].append((token, doc.id))
+        if added or removed or not same_token:
+            user_states[doc.id] = (token, wanted)
+
+    return subscribe, unsubscribe, user_states, replaced
+
+
+def apply_topic_changes(changes, action):
+    """
+    Ejecuta subscribe/unsubscribe en lotes de 1000 tokens por topic.
+    Devuelve (ok, failed, dead_user_ids, {userId: topics que fallaron}).
+    Un token muerto no recibe nada: no cuenta como topic fallido.
+    """
+    call = messaging.subscribe_to_topic if action == 'subscribe' else messaging.unsubscribe_from_topic
+    ok = failed = 0
+    dead_users = set()
+    failed_topics = defaultdict(set)
+    for topic, entries in sorted(changes.items()):
+        for batch in chunked(entries, TOPIC_BATCH_SIZE):
+            response = call([token for token, _ in batch], topic)
+            ok += response.success_count
+            failed += response.failure_count
+            for error in response.errors:
+                user_id = batch[error.index][1]
+                if error.reason in DEAD_TOKEN_REASONS:
+                    dead_users.add(user_id)
+                else:
+                    failed_topics[user_id].add(topic)
+        print(f"  {'➕' if action == 'subscribe' else '➖'} {topic}: {len(entries)} token(s)")
+    return ok, failed, dead_users, failed_topics
+
+
+def sync(db, apply_changes):
+    print("[1/3] Calculando topics deseados (users + bookings futuras)...")
+    subscribe, unsubscribe, user_states, replaced = plan_sync(db)
+    n_sub = sum(len(v) for v in subscribe.values())
+    n_unsub = sum(len(v) for v in unsubscribe.values())
+    print(f"✅ Suscripciones nuevas: {n_sub} en {len(subscribe)} topic(s)")
+    print(f"✅ Desuscripciones: {n_unsub} en {len(unsubscribe)} topic(s)")
+    print(f"✅ Tokens cambiados o borrados (se desuscribe el viejo): {len(replaced)}")
+    print(f"✅ Usuarios con registro a actualizar: {len(user_states)}\n")
+
+    if not apply_changes:
+        for topic, entries in sorted(subscribe.items()):
+            print(f"  + {topic}: {len(entries)}")
+        for topic, entries in sorted(unsubscribe.items()):
+            print(f"  - {topic}: {len(entries)}")
+        print('\nDry-run terminado. Ejecuta con --apply para aplicar.')
+        return 0
+
+    print("[2/3] Aplicando cambios en FCM...")
+    sub_ok, sub_failed, dead, not_subscribed = apply_topic_changes(subscribe, 'subscribe')
+    unsub_ok, unsub_failed, _, not_unsubscribed = apply_topic_changes(unsubscribe, 'unsubscribe')
+    print(f"✅ Suscritos: {sub_ok} (fallidos: {sub_failed}), "
+          f"desuscritos: {unsub_ok} (fallidos: {unsub_failed})")
+    if dead:
+        print(f"⚠️  {len(dead)} token(s) inválidos: no se registran sus topics")
+    print()
+
+    print("[3/3] Registrando topics en los usuarios...")
+    writer = bulk_writer(db)
+    retry_old = {user_id for user_id in replaced if not_unsubscribed.get(user_id)}
+    if retry_old:
+        print(f"⚠️  {len(retry_old)} token(s) viejos no se pudieron desuscribir: "
+              "se mantiene su registro para reintentar")
+    for user_id, (token, topics) in user_states.items():
+        if user_id in retry_old:
+            continue
+        if user_id in dead:
+            token, topics = None, set()
+        else:
+            # Se registra solo lo que quedó aplicado: lo fallido se reintenta
+            # en la próxima corrida
+            topics = (topics - not_subscribed.get(user_id, set())) | not_unsubscribed.get(user_id, set())
+        writer.update(db.collection('users').document(user_id), {
+            'fcmTopics': sorted(topics),
+            'fcmTopicsToken': token,
+            'fcmTopicsUpdatedAt': firestore.SERVER_TIMESTAMP,
+        })
+    writer.close()
+    print(f"✅ {len(user_states) - len(retry_old) - len(writer.failures)} usuarios actualizados")
+    if writer.failures:
+        print(f"❌ {len(writer.failures)} escrituras fallidas")
+        return 1
+    return 0
+
+
+def send(topic, title, body, data=None):
+    """Un único envío FCM a todos los suscritos al topic."""
+    message = messaging.Message(
+        topic=topic,
+        notification=messaging.Notification(title=title, body=body),
+        data={k: str(v) for k, v in (data or {}).items()},
+        android=messaging.AndroidConfig(
+            priority='high',
+            notification=messaging.AndroidNotification(sound='default', channel_id='default'),
+        ),
+        apns=messaging.APNSConfig(payload=messaging.APNSPayload(aps=messaging.Aps(sound='default'))),
+    )
+    return messaging.send(message)
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+
+    parser = argparse.ArgumentParser(description='Topics FCM y broadcast')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = sub.add_parser('sync', parents=[common], help='Sincroniza suscripciones')
+    sync_parser.add_argument('--apply', action='store_true', help='Aplica los cambios (default: dry-run)')
+
+    send_parser = sub.add_parser('send', parents=[common], help='Envía un broadcast a un topic')
+    send_parser.add_argument('--topic', required=True)
+    send_parser.add_argument('--title', required=True)
+    send_parser.add_argument('--body', required=True)
+    send_parser.add_argument('--type', default='broadcast', help='Valor de data.type')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("TOPICS FCM")
+    print("=" * 60 + "\n")
+    db = init_firestore(args.service_account)
+
+    if args.command == 'sync':
+        sys.exit(sync(db, args.apply))
+
+    message_id = send(args.topic, args.title, args.body, {'type': args.type})
+    print(f"✅ Broadcast enviado a '{args.topic}': {message_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilidades compartidas por los scripts de mantenimiento de Firestore.
+
+Centraliza lo que cada script repetía a mano:
+  - Resolución del service account (argumento → FIREBASE_SERVICE_ACCOUNT → default)
+  - Inicialización de Firebase Admin
+  - Lectura paginada por ID de documento (sin un único cursor gigante)
+  - Escritura masiva con BulkWriter (paralelo, con reintentos y un limitador
+    de velocidad adaptativo)
+  - Marca de agua de los syncs incrementales (config/{id}.lastSyncAt)
+
+Uso desde otro script:
+  from firebase_common import init_firestore, bulk_writer, iter_pages
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from datetime import timedelta, timezone
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions, SendMode
+from google.cloud.firestore_v1.field_path import FieldPath
+
+DEFAULT_SERVICE_ACCOUNT = 'scripts/firebase-service-account.json'
+
+# Límite de operaciones por batch/commit de Firestore
+MAX_BATCH_SIZE = 500
+
+# Máximo de valores por filtro `in` en Firestore
+IN_QUERY_LIMIT = 30
+
+# Marcas de agua de los syncs incrementales: config/{id}.lastSyncAt.
+# Al leer desde la marca se resta WATERMARK_OVERLAP (relojes y escrituras en vuelo).
+WATERMARK_COLLECTION = 'config'
+WATERMARK_OVERLAP = timedelta(minutes=2)
+
+# Códigos gRPC transitorios que vale la pena reintentar
+# (ABORTED, UNAVAILABLE, RESOURCE_EXHAUSTED, DEADLINE_EXCEEDED)
+RETRYABLE_CODES = {10, 14, 8, 4}
+
+# Códigos de contención/cuota: el limitador baja la velocidad al verlos
+# (ABORTED, RESOURCE_EXHAUSTED)
+CONTENTION_CODES = {10, 8}
+
+# Regla 500/50/5: partir en 500 ops/s y subir 50% cada 5 minutos
+INITIAL_OPS_PER_SECOND = 500
+MAX_OPS_PER_SECOND = 10000
+MIN_OPS_PER_SECOND = 20
+RAMP_INTERVAL_SECONDS = 5 * 60
+RAMP_FACTOR = 1.5
+
+# Zona horaria del gimnasio: classDate se guarda como medianoche local
+try:
+    from zoneinfo import ZoneInfo
+    LOCAL_TZ = ZoneInfo('America/Santiago')
+except Exception:  # Windows sin tzdata
+    LOCAL_TZ = timezone(timedelta(hours=-3))
+
+
+def fix_windows_encoding():
+    """Fuerza UTF-8 en stdout para que los emojis no rompan en Windows."""
+    # Idempotente: varios módulos importados lo llaman al cargarse
+    if sys.platform == 'win32' and (sys.stdout.encoding or '').lower() != 'utf-8':
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+
+def resolve_service_account(path=None):
+    """Devuelve la ruta del service account o termina el script si no existe."""
+    if path:
+        print(f'Usando service account desde argumento: {path}')
+    elif 'FIREBASE_SERVICE_ACCOUNT' in os.environ:
+        path = os.environ['FIREBASE_SERVICE_ACCOUNT']
+        print(f'Usando service account desde variable de entorno: {path}')
+    else:
+        path = DEFAULT_SERVICE_ACCOUNT
+        print(f'Usando service account por defecto: {path}')
+
+    if not os.path.exists(path):
+        print(f'\n❌ ERROR: No se encontró el archivo: {path}')
+        print('  Pasa la ruta como argumento o configura FIREBASE_SERVICE_ACCOUNT')
+        sys.exit(1)
+    return path
+
+
+def init_firestore(service_account_path=None):
+    """Inicializa Firebase Admin (una sola vez) y devuelve el cliente de Firestore."""
+    path = resolve_service_account(service_account_path)
+    try:
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(path))
+        print("✅ Firebase inicializado correctamente\n")
+    except Exception as e:
+        print(f"❌ ERROR al inicializar Firebase: {e}")
+        sys.exit(1)
+    return firestore.client()
+
+
+def local_date(timestamp):
+    """Fecha local (America/Santiago) de un Timestamp de Firestore."""
+    return timestamp.astimezone(LOCAL_TZ).date()
+
+
+def chunked(items, size):
+    """Agrupa un iterable en listas de a lo más `size` elementos."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_pages(query, page_size=1000, start_after_id=None):
+    """
+    Recorre una query en páginas ordenadas por ID de documento.
+
+    Cada página es una consulta corta e independiente, así un scan largo no
+    depende de un único stream (que expira) y se puede retomar desde el
+    último ID procesado con `start_after_id`.
+    """
+    query = query.order_by(FieldPath.document_id()).limit(page_size)
+    cursor = {'__name__': start_after_id} if start_after_id else None
+
+    while True:
+        page_query = query.start_after(cursor) if cursor else query
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        yield docs
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1]
+
+
+def iter_docs(query, page_size=1000, start_after_id=None):
+    """Igual que `iter_pages` pero documento a documento."""
+    for page in iter_pages(query, page_size, start_after_id):
+        yield from page
+
+
+def read_watermark(db, watermark_id):
+    """lastSyncAt guardado en config/{watermark_id}, o None si nunca corrió."""
+    doc = db.collection(WATERMARK_COLLECTION).document(watermark_id).get()
+    return (doc.to_dict() or {}).get('lastSyncAt') if doc.exists else None
+
+
+def write_watermark(db, watermark_id, value):
+    db.collection(WATERMARK_COLLECTION).document(watermark_id).set(
+        {'lastSyncAt': value, 'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket con la rampa 500/50/5 que además retrocede ante contención.
+
+    - Parte en INITIAL_OPS_PER_SECOND y sube RAMP_FACTOR cada
+      RAMP_INTERVAL_SECONDS mientras haya tráfico y ningún error de
+      contención (regla 500/50/5, evita hotspots en colecciones nuevas o con
+      IDs secuenciales como capacity_tracking/{YYYY-MM-DD}).
+    - Ante ABORTED/RESOURCE_EXHAUSTED reduce la velocidad a la mitad (a lo más
+      una vez por segundo, para no desplomarse por una sola ráfaga) y recuerda
+      el 90% de la velocidad que falló como techo. Si falla un tanteo sobre el
+      techo, solo vuelve al techo.
+    - Bajo el techo recupera rápido (RAMP_FACTOR por intervalo corto); sobre el
+      techo solo tantea +10% por intervalo completo. Así converge a la mayor
+      velocidad sostenible en vez de oscilar o quedarse lento.
+
+    Implementa la interfaz que BulkWriter usa de su RateLimiter interno
+    (`take_tokens` y `_maximum_tokens`).
+    """
+
+    RECOVERY_INTERVAL_SECONDS = 30
+    PROBE_FACTOR = 1.1
+    BACKOFF_FACTOR = 0.5
+    BACKOFF_COOLDOWN_SECONDS = 1
+
+    def __init__(self, initial=INITIAL_OPS_PER_SECOND, maximum=MAX_OPS_PER_SECOND,
+                 minimum=MIN_OPS_PER_SECOND, verbose=True):
+        self._lock = threading.Lock()
+        self.rate = initial
+        self.maximum = maximum
+        self.minimum = minimum
+        self.ceiling = None
+        self.verbose = verbose
+        self.backoffs = 0
+        self._available = float(initial)
+        self._last_refill = time.monotonic()
+        self._phase_start = self._last_refill
+        self._ops_this_phase = 0
+        self._last_backoff = 0.0
+
+    @property
+    def _maximum_tokens(self):
+        # BulkWriter limita las escrituras en vuelo a este valor
+        return int(self.rate)
+
+    def take_tokens(self, num=1, allow_less=False):
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_ramp(now)
+            self._available = min(self.rate, self._available + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            wanted = 1 if allow_less else num
+            if self._available < wanted:
+                return 0
+            taken = min(int(self._available), num)
+            self._available -= taken
+            self._ops_this_phase += taken
+            return taken
+
+    def _maybe_ramp(self, now):
+        below_ceiling = self.ceiling is not None and self.rate < self.ceiling
+        interval = self.RECOVERY_INTERVAL_SECONDS if below_ceiling else RAMP_INTERVAL_SECONDS
+        if now - self._phase_start < interval:
+            return
+        if self._ops_this_phase:
+            if below_ceiling:
+                new_rate = min(self.ceiling, self.rate * RAMP_FACTOR)
+            elif self.ceiling is not None:
+                # Un intervalo completo sin contención: esta velocidad es sostenible
+                self.ceiling = self.rate
+                new_rate = self.rate * self.PROBE_FACTOR
+            else:
+                new_rate = self.rate * RAMP_FACTOR
+            self.rate = min(self.maximum, round(new_rate))
+        self._phase_start = now
+        self._ops_this_phase = 0
+
+    def backoff(self):
+        """Registra un error de contención y baja la velocidad."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_backoff < self.BACKOFF_COOLDOWN_SECONDS:
+                return
+            self._last_backoff = now
+            self.backoffs += 1
+            if self.ceiling is not None and self.rate > self.ceiling:
+                # Falló el tanteo sobre el techo: se vuelve al techo conocido
+                self.rate = self.ceiling
+            else:
+                self.ceiling = max(self.minimum, round(self.rate * 0.9))
+                self.rate = max(self.minimum, round(self.rate * self.BACKOFF_FACTOR))
+            self._available = min(self._available, self.rate)
+            self._phase_start = now
+            self._ops_this_phase = 0
+            if self.verbose:
+                print(f"  ⚠️  Contención en Firestore: bajando a {self.rate} ops/s")
+
+
+def bulk_writer(db, max_attempts=5):
+    """
+    Crea un BulkWriter en modo paralelo que reintenta errores transitorios.
+
+    La velocidad la controla un AdaptiveRateLimiter (en `writer.limiter`) en
+    vez del limitador fijo de BulkWriter, que no pasa de 500 ops/s ni
+    retrocede ante contención. Los errores definitivos quedan en
+    `writer.failures` para que el script los reporte al final en vez de
+    abortar a mitad de camino.
+    """
+    writer = db.bulk_writer(options=BulkWriterOptions(
+        mode=SendMode.parallel,
+        initial_ops_per_second=INITIAL_OPS_PER_SECOND,
+        max_ops_per_second=MAX_OPS_PER_SECOND,
+    ))
+    writer.limiter = AdaptiveRateLimiter()
+    writer._rate_limiter = writer.limiter
+    writer.failures = []
+
+    def on_error(failure, _writer):
+        if failure.code in CONTENTION_CODES:
+            writer.limiter.backoff()
+        if failure.code in RETRYABLE_CODES and failure.attempts < max_attempts:
+            return True
+        writer.failures.append(failure)
+        return False
+
+    writer.on_write_error(on_error)
+    return writer
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Diferencias entre snapshots de Firestore (o snapshot vs datos en vivo).
+
+Después de una migración como restructure_evening_schedules.py no había
+forma rápida de verificar qué docs cambiaron exactamente. Este script
+compara dos snapshots de firestore_snapshot.py, o un snapshot contra la
+base en vivo (--live), y reporta docs agregados, eliminados y modificados,
+con el detalle campo a campo de los modificados.
+
+Nada se carga completo en memoria:
+  - Ambos lados están ordenados por path (el snapshot se escribe en el
+    orden de __name__ y la lectura en vivo usa el mismo orden), así que se
+    recorren en paralelo como un merge de listas ordenadas.
+  - Se comparan las huellas por documento (archivos .hashes del snapshot;
+    en vivo se calculan al vuelo) y solo se decodifica el contenido de los
+    docs cuya huella difiere, para el diff por campo.
+
+Código de salida 1 si hay diferencias (como diff), 0 si no.
+
+Uso:
+  python scripts/firestore_diff.py snapshots/antes snapshots/despues
+  python scripts/firestore_diff.py snapshots/antes --live
+  python scripts/firestore_diff.py snapshots/antes --live --collections bookings \\
+      --report diff.ndjson
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+from firebase_common import fix_windows_encoding, init_firestore, iter_docs
+from firestore_snapshot import (encode_value, fingerprint, iter_snapshot_file,
+                                open_snapshot_file, snapshot_entries)
+
+fix_windows_encoding()
+
+_MISSING = object()
+
+
+# ---------------------------------------------------------------------------
+# Fuentes: iteradores de (path, huella, cargador_del_contenido) ordenados
+# ---------------------------------------------------------------------------
+
+def iter_snapshot(directory, entry):
+    data_path = os.path.join(directory, entry['file'])
+    hashes_path = os.path.join(directory, entry['hashes']) if entry.get('hashes') else None
+
+    if not hashes_path or not os.path.exists(hashes_path):
+        # Snapshot sin huellas: se calculan al leer
+        for record in iter_snapshot_file(data_path):
+            data = record['data']
+            yield record['path'], fingerprint(data), (lambda d=data: d)
+        return
+
+    with open_snapshot_file(data_path, 'r') as data_file, \
+            open(hashes_path, encoding='utf-8') as hashes_file:
+        for line, hash_line in zip(data_file, hashes_file):
+            path, digest = hash_line.rstrip('\n').split('\t')
+            yield path, digest, (lambda raw=line: json.loads(raw)['data'])
+
+
+def iter_live(db, entry):
+    name = entry['name']
+    query = db.collection_group(name) if entry.get('group') else db.collection(name)
+    for doc in iter_docs(query):
+        data = encode_value(doc.to_dict() or {})
+        yield doc.reference.path, fingerprint(data), (lambda d=data: d)
+
+
+def path_key(path):
+    """Orden de __name__ en Firestore: segmento a segmento."""
+    return tuple(path.split('/'))
+
+
+def merge(left, right):
+    """Recorre dos fuentes ordenadas y emite (tipo, path, cargador_izq, cargador_der)."""
+    left, right = iter(left), iter(right)
+    a, b = next(left, None), next(right, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and path_key(a[0]) < path_key(b[0])):
+            yield 'removed', a[0], a[2], None
+            a = next(left, None)
+        elif a is None or path_key(b[0]) < path_key(a[0]):
+            yield 'added', b[0], None, b[2]
+            b = next(right, None)
+        else:
+            if a[1] != b[1]:
+                yield 'changed', a[0], a[2], b[2]
+            a, b = next(left, None), next(right, None)
+
+
+# ---------------------------------------------------------------------------
+# Diff por campo
+# ---------------------------------------------------------------------------
+
+def flatten(value, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}; listas y valores tipados quedan como hoja."""
+    if isinstance(value, dict) and value and not any(k.startswith('$') for k in value):
+        flat = {}
+        for key, inner in value.items():
+            flat.update(flatten(inner, f'{prefix}{key}.'))
+        return flat
+    return {prefix[:-1]: value} if prefix else {'': value}
+
+
+def field_diff(old, new):
+    old_flat, new_flat = flatten(old), flatten(new)
+    changes = []
+    for field in sorted(set(old_flat) | set(new_flat)):
+        before, after = old_flat.get(field, _MISSING), new_flat.get(field, _MISSING)
+        if before == after:
+            continue
+        changes.append({
+            'field': field,
+            'old': None if before is _MISSING else before,
+            'new': None if after is _MISSING else after,
+            'op': 'added' if before is _MISSING else 'removed' if after is _MISSING else 'changed',
+        })
+    return changes
+
+
+def short(value, limit=60):
+    text = json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Diff entre snapshots de Firestore')
+    parser.add_argument('before', help='Snapshot base')
+    parser.add_argument('after', nargs='?', help='Snapshot a comparar (o usar --live)')
+    parser.add_argument('--live', action='store_true', help='Comparar contra la base en vivo')
+    parser.add_argument('--collections', help='Limitar a estas colecciones/grupos')
+    parser.add_argument('--show', type=int, default=20,
+                        help='Docs modificados a mostrar por colección (default 20)')
+    parser.add_argument('--report', help='Guardar todas las diferencias en NDJSON')
+    parser.add_argument('--service-account', help='Ruta al service account JSON')
+    args = parser.parse_args()
+
+    if bool(args.after) == args.live:
+        parser.error('indica un segundo snapshot o --live (no ambos)')
+
+    print("=" * 60)
+    print(f"DIFF: {args.before} → {'EN VIVO' if args.live else args.after}")
+    print("=" * 60 + "\n")
+
+    only = set(c for c in (args.collections or '').split(',') if c)
+    entries = [e for e in snapshot_entries(args.before) if not only or e['name'] in only]
+    db = init_firestore(args.service_account) if args.live else None
+    after_entries = {} if args.live else {e['name']: e for e in snapshot_entries(args.after)}
+
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    totals = Counter()
+    try:
+        for entry in entries:
+            left = iter_snapshot(args.before, entry)
+            if args.live:
+                right = iter_live(db, entry)
+            elif entry['name'] in after_entries:
+                right = iter_snapshot(args.after, after_entries[entry['name']])
+            else:
+                print(f"⚠️  {entry['name']}: no está en {args.after}, se omite\n")
+                continue
+
+            counts = Counter()
+            shown = 0
+            print(f"[{entry['name']}]")
+            for kind, path, load_old, load_new in merge(left, right):
+                counts[kind] += 1
+                # Solo se decodifica el contenido si el detalle se va a usar
+                needs_detail = kind == 'changed' and (report or shown < args.show)
+                changes = field_diff(load_old(), load_new()) if needs_detail else None
+                if report:
+                    report.write(json.dumps({'collection': entry['name'], 'kind': kind,
+                                             'path': path, 'fields': changes},
+                                            ensure_ascii=False) + '\n')
+                if shown < args.show:
+                    shown += 1
+                    symbol = {'added': '+', 'removed': '-', 'changed': '~'}[kind]
+                    print(f"  {symbol} {path}")
+                    for change in changes or []:
+                        print(f"      {change['field']}: {short(change['old'])} → {short(change['new'])}")
+
+            print(f"  Agregados: {counts['added']}  Eliminados: {counts['removed']}  "
+                  f"Modificados: {counts['changed']}\n")
+            totals.update(counts)
+    finally:
+        if report:
+            report.close()
+
+    print("=" * 60)
+    print(f"TOTAL  Agregados: {totals['added']}  Eliminados: {totals['removed']}  "
+          f"Modificados: {totals['changed']}")
+    if args.report:
+        print(f"📄 Detalle completo en {args.report}")
+    sys.exit(1 if sum(totals.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
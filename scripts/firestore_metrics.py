@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contabilidad de operaciones y latencias de Firestore, Auth y Messaging.
+
+Ningún script reportaba cuántas lecturas, escrituras, borrados o bytes le
+costaban ni en qué se iba el tiempo. Este módulo envuelve los clientes
+(a nivel de clase, así cubre cualquier query, referencia, batch,
+transacción o BulkWriter que cree el script) y registra:
+
+  - Por colección: lecturas, escrituras, borrados y bytes. Los bytes leídos
+    se estiman con las reglas de tamaño de almacenamiento de Firestore; los
+    escritos son el tamaño real de cada Write enviado.
+  - Por tipo de llamada (firestore.query, firestore.doc.get,
+    firestore.batch.commit, auth.get_user, messaging.send_each, ...):
+    cantidad, errores e histograma de latencias con p50/p90/p99.
+  - Opcionalmente por etapa: cada print que empieza con "[n/m]" (la
+    convención de los scripts) abre una etapa nueva.
+
+Al terminar el script se escribe un resumen JSON (en metrics/ por defecto,
+con fecha en el nombre para poder comparar corridas).
+
+Uso:
+  python scripts/firestore_metrics.py scripts/usage_counters.py rebuild
+  python scripts/firestore_metrics.py -o metrics/rebuild.json --no-stages \\
+      scripts/export_collection.py bookings -o bookings.ndjson
+
+Desde un script:
+  from firestore_metrics import install
+  install('metrics/')
+"""
+
+import argparse
+import atexit
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from firebase_admin import auth, messaging
+from google.cloud.firestore_v1 import (DocumentReference, GeoPoint, aggregation, batch, bulk_batch,
+                                       client, document, query, transaction)
+
+import stage_hooks
+
+# Límites superiores (ms) de los buckets del histograma de latencias
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+AUTH_CALLS = [
+    'get_user', 'get_user_by_email', 'get_user_by_phone_number', 'get_users', 'list_users',
+    'create_user', 'update_user', 'delete_user', 'delete_users', 'import_users',
+    'set_custom_user_claims', 'revoke_refresh_tokens', 'create_custom_token', 'verify_id_token',
+]
+MESSAGING_CALLS = [
+    'send', 'send_all', 'send_each', 'send_each_for_multicast', 'send_multicast',
+    'subscribe_to_topic', 'unsubscribe_from_topic',
+]
+
+_lock = threading.Lock()
+_metrics = None
+
+
+# ---------------------------------------------------------------------------
+# Tamaños (reglas de almacenamiento de Firestore)
+# ---------------------------------------------------------------------------
+
+def value_size(value):
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, GeoPoint):
+        return 16
+    if isinstance(value, DocumentReference):
+        return path_size(value.path)
+    if isinstance(value, dict):
+        return sum(len(k.encode('utf-8')) + 1 + value_size(v) for k, v in value.items())
+    if isinstance(value, list):
+        return sum(value_size(v) for v in value)
+    return 8
+
+
+def path_size(path):
+    return sum(len(segment.encode('utf-8')) + 1 for segment in path.split('/')) + 16
+
+
+def snapshot_size(snapshot):
+    return path_size(snapshot.reference.path) + 32 + value_size(snapshot.to_dict() or {})
+
+
+def collection_of_path(path):
+    """'users/abc/usage/2026-10' -> 'usage'."""
+    segments = path.split('/')
+    return segments[-2] if len(segments) % 2 == 0 else segments[-1]
+
+
+def collection_of_write(write_pb):
+    name = write_pb.delete or write_pb.update.name or write_pb.transform.document
+    return collection_of_path(name.split('/documents/', 1)[-1])
+
+
+# ---------------------------------------------------------------------------
+# Acumuladores
+# ---------------------------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.collections = defaultdict(lambda: defaultdict(int))
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def count(self, collection, **amounts):
+        for key, amount in amounts.items():
+            self.collections[collection][key] += amount
+
+    def summary(self):
+        totals = defaultdict(int)
+        for counters in self.collections.values():
+            for key, amount in counters.items():
+                totals[key] += amount
+        return {
+            'totals': dict(totals),
+            'collections': {name: dict(c) for name, c in sorted(self.collections.items())},
+            'calls': {name: latency_summary(self.durations[name], self.errors[name])
+                      for name in sorted(set(self.durations) | set(self.errors))},
+        }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
+
+
+def latency_summary(durations, errors):
+    values = sorted(durations)
+    histogram = {}
+    for bound in LATENCY_BUCKETS_MS:
+        histogram[f'<={bound}ms'] = 0
+    histogram[f'>{LATENCY_BUCKETS_MS[-1]}ms'] = 0
+    for ms in values:
+        bound = next((b for b in LATENCY_BUCKETS_MS if ms <= b), None)
+        histogram[f'<={bound}ms' if bound else f'>{LATENCY_BUCKETS_MS[-1]}ms'] += 1
+    return {
+        'count': len(values),
+        'errors': errors,
+        'totalMs': round(sum(values), 1),
+        'p50Ms': percentile(values, 50),
+        'p90Ms': percentile(values, 90),
+        'p99Ms': percentile(values, 99),
+        'maxMs': round(values[-1], 2) if values else None,
+        'histogram': {k: v for k, v in histogram.items() if v},
+    }
+
+
+class Metrics:
+    def __init__(self, script, output, by_stage=True):
+        self.script = script
+        self.output = output
+        self.by_stage = by_stage
+        self.started = time.monotonic()
+        self.started_at = datetime.now(timezone.utc)
+        self.total = Stats()
+        self.stages = []  # [label, Stats, inicio, fin]
+        self.current = None
+
+    def start_stage(self, label):
+        now = time.monotonic()
+        with _lock:
+            if self.stages:
+                self.stages[-1][3] = now
+            self.current = Stats()
+            self.stages.append([label, self.current, now, None])
+
+    def count(self, collection, **amounts):
+        with _lock:
+            self.total.count(collection, **amounts)
+            if self.current is not None:
+                self.current.count(collection, **amounts)
+
+    def timing(self, call, ms, failed=False):
+        with _lock:
+            for stats in (self.total, self.current):
+                if stats is None:
+                    continue
+                if failed:
+                    stats.errors[call] += 1
+                else:
+                    stats.durations[call].append(ms)
+
+    def summary(self):
+        end = time.monotonic()
+        data = {
+            'script': self.script,
+            'startedAt': self.started_at.isoformat(),
+            'elapsedSeconds': round(end - self.started, 2),
+            **self.total.summary(),
+        }
+        if self.by_stage and self.stages:
+            data['stages'] = [
+                {'stage': label, 'elapsedSeconds': round((stop or end) - begin, 2), **stats.summary()}
+                for label, stats, begin, stop in self.stages
+            ]
+        return data
+
+    def write(self):
+        path = self.output
+        if path.endswith(os.sep) or path.endswith('/') or os.path.isdir(path):
+            name = os.path.splitext(os.path.basename(self.script))[0]
+            path = os.path.join(path, f"{name}-{self.started_at:%Y%m%d-%H%M%S}.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        totals = data['totals']
+        sys.stderr.write(
+            f"📊 Lecturas: {totals.get('reads', 0)}  Escrituras: {totals.get('writes', 0)}  "
+            f"Borrados: {totals.get('deletes', 0)} → {path}\n")
+
+
+# ---------------------------------------------------------------------------
+# Envolturas
+# ---------------------------------------------------------------------------
+
+class _CountedStream:
+    """Proxy de un stream de snapshots: cuenta docs y mide solo el tiempo de RPC."""
+
+    def __init__(self, stream, call, collection):
+        self._stream = stream
+        self._call = call
+        self._collection = collection
+        self._elapsed = 0.0
+        self._docs = 0
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            snapshot = next(self._stream)
+        except StopIteration:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+            raise
+        except Exception:
+            self._elapsed += time.perf_counter() - started
+            self._finish(failed=True)
+            raise
+        self._elapsed += time.perf_counter() - started
+        self._docs += 1
+        collection = self._collection or collection_of_path(snapshot.reference.path)
+        _metrics.count(collection, reads=1, readBytes=snapshot_size(snapshot) if snapshot.exists else 0)
+        return snapshot
+
+    def _finish(self, failed=False):
+        if self._done:
+            return
+        self._done = True
+        if not self._docs:
+            # Una query sin resultados igual se cobra como una lectura
+            _metrics.count(self._collection or '(sin colección)', reads=1)
+        _metrics.timing(self._call, self._elapsed * 1000, failed)
+
+    def __del__(self):
+        if _metrics is not None:
+            self._finish()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _timed(call, func):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            _metrics.timing(call, (time.perf_counter() - started) * 1000, failed=True)
+            raise
+        _metrics.timing(call, (time.perf_counter() - started) * 1000)
+        return result
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _patch_firestore():
+    original_stream = query.Query.stream
+
+    def stream(self, *args, **kwargs):
+        return _CountedStream(original_stream(self, *args, **kwargs), 'firestore.query', self._parent.id)
+
+    query.Query.stream = stream
+
+    original_get_all = client.Client.get_all
+
+    def get_all(self, references, *args, **kwargs):
+        return _CountedStream(original_get_all(self, references, *args, **kwargs),
+                              'firestore.get_all', None)
+
+    client.Client.get_all = get_all
+
+    original_doc_get = document.DocumentReference.get
+
+    def doc_get(self, *args, **kwargs):
+        snapshot = _timed('firestore.doc.get', original_doc_get)(self, *args, **kwargs)
+        _metrics.count(self.parent.id, reads=1,
+                       readBytes=snapshot_size(snapshot) if snapshot.exists else 0)
+        return snapshot
+
+    document.DocumentReference.get = doc_get
+
+    original_aggregation_get = aggregation.AggregationQuery.get
+
+    def aggregation_get(self, *args, **kwargs):
+        # count()/sum()/avg() se cobran como lecturas de índice; se registra el mínimo
+        _metrics.count(self._nested_query._parent.id, reads=1)
+        return _timed('firestore.aggregation', original_aggregation_get)(self, *args, **kwargs)
+
+    aggregation.AggregationQuery.get = aggregation_get
+
+    def counting_commit(call, original):
+        def commit(self, *args, **kwargs):
+            for write_pb in self._write_pbs:
+                kind = 'deletes' if write_pb.delete else 'writes'
+                _metrics.count(collection_of_write(write_pb), **{kind: 1, 'writeBytes': write_pb._pb.ByteSize()})
+            return _timed(call, original)(self, *args, **kwargs)
+        return commit
+
+    batch.WriteBatch.commit = counting_commit('firestore.batch.commit', batch.WriteBatch.commit)
+    transaction.Transaction._commit = counting_commit('firestore.transaction.commit',
+                                                      transaction.Transaction._commit)
+    bulk_batch.BulkWriteBatch.commit = counting_commit('firestore.bulk_writer.batch',
+                                                       bulk_batch.BulkWriteBatch.commit)
+
+
+def _patch_module(module, prefix, names):
+    for name in names:
+        func = getattr(module, name, None)
+        if func is not None and not hasattr(func, '__wrapped__'):
+            setattr(module, name, _timed(f'{prefix}.{name}', func))
+
+
+def install(output='metrics/', script=None, by_stage=True):
+    """Activa la instrumentación y registra el resumen para la salida del proceso."""
+    global _metrics
+    if _metrics is not None:
+        return _metrics
+    _metrics = Metrics(script or sys.argv[0], output, by_stage)
+    _patch_firestore()
+    _patch_module(auth, 'auth', AUTH_CALLS)
+    _patch_module(messaging, 'messaging', MESSAGING_CALLS)
+    if by_stage:
+        stage_hooks.subscribe(_metrics.start_stage)
+    atexit.register(_metrics.write)
+    return _metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Ejecuta un script midiendo sus operaciones de Firebase')
+    parser.add_argument('-o', '--output', default='metrics/',
+                        help='Archivo JSON o directorio (default: metrics/)')
+    parser.add_argument('--no-stages', action='store_true', help='Sin desglose por etapa [n/m]')
+    parser.add_argument('script', help='Script a ejecutar')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Argumentos del script')
+    args = parser.parse_args()
+
+    install(args.output, args.script, by_stage=not args.no_stages)
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshots rápidos de Firestore (respaldo y restauración).
+
+Scripts destructivos como recreate_schedules.py,
+delete_all_users_except_admin.py o clean_corrupt_payment.py corren sin
+respaldo previo, y un export administrado es lento y demasiado grueso para
+una red de seguridad rápida. Este script:
+
+  backup   Vuelca colecciones raíz (--collections) y subcolecciones por
+           collection group (--groups, p.ej. capacity_tracking) a NDJSON
+           comprimido con zstd, un archivo por colección, leídas en paralelo.
+           Cada línea es {"path": "users/abc", "data": {...}} y los tipos de
+           Firestore se conservan (Timestamp con nanosegundos, referencias,
+           GeoPoint, bytes). Los docs quedan ordenados por path.
+  restore  Reescribe los docs del snapshot con un BulkWriter paralelo
+           (set completo: el doc queda igual que en el snapshot).
+
+Estructura del snapshot:
+  <dir>/manifest.json
+  <dir>/<colección>.ndjson.zst
+  <dir>/group.<subcolección>.ndjson.zst
+  <dir>/<archivo>.hashes        "path<TAB>hash" por doc, mismo orden
+                                (huella del contenido, ver firestore_diff.py)
+
+Requiere: pip install zstandard
+
+Uso:
+  python scripts/firestore_snapshot.py backup snapshots/antes-recreate \\
+      --collections class_schedules,bookings --groups capacity_tracking
+  python scripts/firestore_snapshot.py restore snapshots/antes-recreate           # dry-run
+  python scripts/firestore_snapshot.py restore snapshots/antes-recreate --apply
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1 import DocumentReference, GeoPoint
+
+from firebase_common import bulk_writer, fix_windows_encoding, init_firestore, iter_docs
+
+MANIFEST = 'manifest.json'
+EXTENSION = '.ndjson.zst'
+HASHES_EXTENSION = '.hashes'
+GROUP_PREFIX = 'group.'
+
+fix_windows_encoding()
+
+
+# ---------------------------------------------------------------------------
+# Codificación con tipos: {"$ts": ...}, {"$ref": ...}, {"$geo": [...]},
+# {"$bytes": ...}; los mapas con claves que empiezan con '$' van en {"$map"}.
+# ---------------------------------------------------------------------------
+
+def encode_value(value):
+    if isinstance(value, DatetimeWithNanoseconds):
+        return {'$ts': value.rfc3339()}
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {'$ts': value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+    if isinstance(value, DocumentReference):
+        return {'$ref': value.path}
+    if isinstance(value, GeoPoint):
+        return {'$geo': [value.latitude, value.longitude]}
+    if isinstance(value, bytes):
+        return {'$bytes': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        encoded = {k: encode_value(v) for k, v in value.items()}
+        if any(k.startswith('$') for k in value):
+            return {'$map': encoded}
+        return encoded
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    return value
+
+
+def decode_value(value, db=None):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (tag, inner), = value.items()
+            if tag == '$ts':
+                return DatetimeWithNanoseconds.from_rfc3339(inner)
+            if tag == '$ref':
+                return db.document(inner) if db is not None else inner
+            if tag == '$geo':
+                return GeoPoint(*inner)
+            if tag == '$bytes':
+                return base64.b64decode(inner)
+            if tag == '$map':
+                return {k: decode_value(v, db) for k, v in inner.items()}
+        return {k: decode_value(v, db) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v, db) for v in value]
+    return value
+
+
+def canonical_json(data):
+    """JSON canónico (claves ordenadas) de los datos ya codificados."""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def fingerprint(encoded_data):
+    """Huella del contenido de un doc: blake2b-128 de su JSON canónico."""
+    return hashlib.blake2b(canonical_json(encoded_data).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def encode_doc(doc):
+    """Devuelve (línea NDJSON, huella) de un DocumentSnapshot."""
+    data = encode_value(doc.to_dict() or {})
+    line = canonical_json({'path': doc.reference.path, 'data': data})
+    return line, fingerprint(data)
+
+
+# ---------------------------------------------------------------------------
+# Archivos
+# ---------------------------------------------------------------------------
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        print("❌ Falta la dependencia zstandard: pip install zstandard")
+        sys.exit(1)
+    return zstandard
+
+
+def open_snapshot_file(path, mode):
+    return _zstd().open(path, mode + 't', encoding='utf-8')
+
+
+def iter_snapshot_file(path):
+    """Registros {'path', 'data'} (sin decodificar) de un archivo del snapshot."""
+    with open_snapshot_file(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def snapshot_entries(directory):
+    """Entradas del manifest del snapshot."""
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)['files']
+
+
+def dump(db, directory, name, is_group):
+    query = db.collection_group(name) if is_group else db.collection(name)
+    base = f"{GROUP_PREFIX if is_group else ''}{name}"
+    filename, hashes_file = base + EXTENSION, base + HASHES_EXTENSION
+    count = 0
+    with open_snapshot_file(os.path.join(directory, filename), 'w') as f, \
+            open(os.path.join(directory, hashes_file), 'w', encoding='utf-8') as h:
+        for doc in iter_docs(query):
+            line, digest = encode_doc(doc)
+            f.write(line + '\n')
+            h.write(f"{doc.reference.path}\t{digest}\n")
+            count += 1
+    return {'name': name, 'group': is_group, 'file': filename, 'hashes': hashes_file, 'count': count}
+
+
+# ---------------------------------------------------------------------------
+# Comandos
+# ---------------------------------------------------------------------------
+
+def backup(db, args):
+    collections = [c for c in (args.collections or '').split(',') if c]
+    groups = [g for g in (args.groups or '').split(',') if g]
+    if not collections and not groups:
+        print("❌ Indica --collections y/o --groups")
+        sys.exit(1)
+
+    os.makedirs(args.directory, exist_ok=True)
+    started = time.monotonic()
+    print(f"[1/2] Volcando {len(collections)} colección(es) y {len(groups)} grupo(s) "
+          f"con {args.workers} hilos...")
+
+    jobs = [(name, False) for name in collections] + [(name, True) for name in groups]
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        entries = list(pool.map(lambda job: dump(db, args.directory, *job), jobs))
+
+    for entry in entries:
+        kind = 'grupo' if entry['group'] else 'colección'
+        print(f"  ✅ {entry['name']} ({kind}): {entry['count']} docs → {entry['file']}")
+
+    print("\n[2/2] Escribiendo manifest...")
+    manifest = {
+        'createdAt': datetime.now(timezone.utc).isoformat(),
+        'project': db.project,
+        'files': entries,
+    }
+    with open(os.path.join(args.directory, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    total = sum(e['count'] for e in entries)
+    print(f"✅ Snapshot completo: {total} docs en {time.monotonic() - started:.1f}s → {args.directory}")
+
+
+def restore(db, args):
+    only = set(c for c in (args.collections or '').split(',') if c)
+    files = [(e['name'], os.path.join(args.directory, e['file']))
+             for e in snapshot_entries(args.directory) if not only or e['name'] in only]
+
+    mode = 'APLICANDO' if args.apply else 'DRY-RUN (sin cambios)'
+    print(f"=== {mode} ===\n")
+    print(f"[1/1] Restaurando {len(files)} archivo(s) desde {args.directory}...")
+
+    started = time.monotonic()
+    writer = bulk_writer(db) if args.apply else None
+    total = 0
+    for name, path in files:
+        count = 0
+        for record in iter_snapshot_file(path):
+            count += 1
+            if writer:
+                writer.set(db.document(record['path']), decode_value(record['data'], db))
+        total += count
+        print(f"  {'✅' if writer else '•'} {name}: {count} docs")
+
+    if not writer:
+        print('\nDry-run terminado. Ejecuta con --apply para restaurar.')
+        return
+
+    writer.close()
+    elapsed = time.monotonic() - started
+    print(f"\n✅ {total - len(writer.failures)} docs restaurados en {elapsed:.1f}s")
+    if writer.failures:
+        for failure in writer.failures[:20]:
+            print(f"  ❌ {failure.operation.reference.path}: {failure.message}")
+        sys.exit(1)
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('directory', help='Directorio del snapshot')
+    common.add_argument('--service-account', help='Ruta al service account JSON')
+
+    parser = argparse.ArgumentParser(description='Snapshots de Firestore')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    backup_parser = sub.add_parser('backup', parents=[common], help='Crear snapshot')
+    backup_parser.add_argument('--collections', help='Colecciones raíz, separadas por coma')
+    backup_parser.add_argument('--groups', help='Subcolecciones (collection group), separadas por coma')
+    backup_parser.add_argument('--workers', type=int, default=8)
+
+    restore_parser = sub.add_parser('restore', parents=[common], help='Restaurar snapshot')
+    restore_parser.add_argument('--collections', help='Restaurar solo estas colecciones/grupos')
+    restore_parser.add_argument('--apply', action='store_true', help='Aplica (default: dry-run)')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"SNAPSHOT DE FIRESTORE ({args.command.upper()})")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+    if args.command == 'backup':
+        backup(db, args)
+    else:
+        restore(db, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,11 +19,38 @@ from firebase_admin import credentials, firestore
 from datetime import datetime
 from collections import defaultdict
 
+from async_firestore import AsyncPool, async_client, run
+import stage_profiler
+from firebase_common import bulk_writer
+
 # Fix encoding for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+DEFAULT_CAPACITY = 15
+
+
+async def fetch_capacities(schedule_ids):
+    """Lee los horarios en paralelo (AsyncPool) y devuelve {scheduleId: capacidad}."""
+    adb = async_client()
+    pool = AsyncPool()
+
+    async def capacity_of(schedule_id):
+        try:
+            schedule_doc = await pool.get(adb.collection('class_schedules').document(schedule_id))
+            if schedule_doc.exists:
+                return schedule_doc.to_dict().get('capacity', DEFAULT_CAPACITY)
+            print(f"⚠️  Schedule {schedule_id} no encontrado, usando capacidad por defecto: {DEFAULT_CAPACITY}")
+        except Exception as e:
+            print(f"⚠️  Error obteniendo schedule {schedule_id}: {e}")
+        return DEFAULT_CAPACITY
+
+    capacities = await pool.gather(capacity_of(s) for s in schedule_ids)
+    return dict(zip(schedule_ids, capacities))
+
+
 def main():
+    stage_profiler.enable_from_argv()
     print("=" * 60)
     print("INICIALIZACIÓN DE CONTADORES DE CAPACIDAD")
     print("=" * 60)
@@ -106,34 +133,23 @@ def main():
 
     # 3. Obtener capacidades máximas de los schedules
     print("[3/4] Obteniendo capacidades máximas...")
-    schedules_capacity = {}
-
-    for counter_info in counters.values():
-        schedule_id = counter_info['scheduleId']
-        if schedule_id not in schedules_capacity:
-            try:
-                schedule_doc = db.collection('class_schedules').document(schedule_id).get()
-                if schedule_doc.exists:
-                    schedules_capacity[schedule_id] = schedule_doc.to_dict().get('capacity', 15)
-                else:
-                    schedules_capacity[schedule_id] = 15  # Default
-                    print(f"⚠️  Schedule {schedule_id} no encontrado, usando capacidad por defecto: 15")
-            except Exception as e:
-                print(f"⚠️  Error obteniendo schedule {schedule_id}: {e}")
-                schedules_capacity[schedule_id] = 15
+    # Un get() por horario: con AsyncClient se solapan en vez de ir de a uno
+    schedule_ids = list(dict.fromkeys(info['scheduleId'] for info in counters.values()))
+    schedules_capacity = run(fetch_capacities(schedule_ids))
 
     print(f"✅ Capacidades obtenidas para {len(schedules_capacity)} horarios\n")
 
     # 4. Crear documentos de capacity_tracking
     print("[4/4] Creando documentos de capacity_tracking...")
-    batch = db.batch()
-    count = 0
+    # BulkWriter con limitador adaptativo: los IDs por fecha son secuenciales
+    # y escribir todo de golpe provoca hotspots
+    writer = bulk_writer(db)
     total_processed = 0
 
     for key, info in counters.items():
         schedule_id = info['scheduleId']
         date_key = info['dateKey']
-        max_capacity = schedules_capacity.get(schedule_id, 15)
+        max_capacity = schedules_capacity.get(schedule_id, DEFAULT_CAPACITY)
 
         # Crear documento de tracking
         capacity_ref = (db.collection('class_schedules')
@@ -141,36 +157,21 @@ def main():
                         .collection('capacity_tracking')
                         .document(date_key))
 
-        batch.set(capacity_ref, {
+        writer.set(capacity_ref, {
             'currentBookings': info['count'],
             'maxCapacity': max_capacity,
             'lastUpdated': firestore.SERVER_TIMESTAMP,
             'scheduleId': schedule_id,
             'classDate': info['classDate'],
         })
-
-        count += 1
         total_processed += 1
 
-        # Firestore batch límite: 500 operaciones
-        if count >= 500:
-            try:
-                batch.commit()
-                print(f"  ✅ Procesados {total_processed} documentos (batch de 500)")
-                batch = db.batch()
-                count = 0
-            except Exception as e:
-                print(f"  ❌ Error en batch commit: {e}")
-                sys.exit(1)
-
-    # Commit final
-    if count > 0:
-        try:
-            batch.commit()
-            print(f"  ✅ Procesados últimos {count} documentos")
-        except Exception as e:
-            print(f"  ❌ Error en batch commit final: {e}")
-            sys.exit(1)
+    writer.close()
+    for failure in writer.failures:
+        print(f"  ❌ Error escribiendo {failure.operation.reference.path}: {failure.message}")
+    if writer.failures:
+        sys.exit(1)
+    print(f"  ✅ Procesados {total_processed} documentos")
 
     # Resumen
     print("\n" + "=" * 60)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chequeo de integridad nocturno: una sola pasada por colección.
+
+check_users_status.py, check_user.py, fix_user_classespermonth.py y los
+scripts de capacidad leían `users`, `bookings` y `payments` cada uno por su
+cuenta. Aquí cada colección se recorre UNA vez (por páginas y con la
+proyección unión de los campos que piden los validadores) y cada documento
+se reparte a los validadores que la consumen. Todos los hallazgos van a un
+único reporte.
+
+Validadores:
+  membership    pagos vs membershipStatus (mismas reglas que
+                reconcile_memberships.py)
+  plans         planId/planName/classesPerMonth del usuario vs `plans`
+  capacity      capacity_tracking.currentBookings vs bookings no cancelados,
+                desde hoy en adelante
+  legacy_fields usuarios con el campo viejo `classLimit`
+  search_key    searchKey/searchTokens ausentes o desactualizados
+
+Agregar un chequeo = una subclase de `Validator` en VALIDATORS: declara en
+`fields` qué campos lee de cada colección, recibe los docs en `visit()` y
+reporta al final en `finish()`. Las colecciones se recorren en el orden de
+SCAN_ORDER (los planes antes que los usuarios, etc.).
+
+Código de salida 1 si hay hallazgos.
+
+Uso:
+  python scripts/integrity_check.py
+  python scripts/integrity_check.py --only capacity,plans --report salud.json
+  python scripts/integrity_check.py --skip-free-access
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from add_searchkey_to_users import build_search_tokens
+from firebase_common import LOCAL_TZ, fix_windows_encoding, init_firestore, iter_docs, local_date
+from reconcile_memberships import PAYMENT_FIELDS, USER_FIELDS, reconcile
+
+fix_windows_encoding()
+
+# Colección (o collection group) -> se recorre como grupo
+SCAN_ORDER = [
+    ('plans', False),
+    ('users', False),
+    ('payments', False),
+    ('bookings', False),
+    ('capacity_tracking', True),
+]
+
+# Estados que ya liberaron su cupo (la app solo decrementa al cancelar)
+RELEASED_STATUSES = {'cancelled'}
+
+
+class Report:
+    """Hallazgos de todos los validadores."""
+
+    def __init__(self):
+        self.findings = []
+        self.scanned = Counter()
+
+    def add(self, validator, kind, path, **detail):
+        self.findings.append({'validator': validator, 'kind': kind, 'path': path, **detail})
+
+    def by_kind(self):
+        grouped = defaultdict(list)
+        for finding in self.findings:
+            grouped[(finding['validator'], finding['kind'])].append(finding)
+        return grouped
+
+
+class Validator:
+    name = ''
+    # colección -> campos que lee (se unen en una sola proyección por colección)
+    fields = {}
+    # kind -> script que lo corrige
+    fixes = {}
+
+    def __init__(self, args, now):
+        self.args = args
+        self.now = now
+
+    def visit(self, collection, doc, data, report):
+        pass
+
+    def finish(self, report):
+        pass
+
+
+class MembershipValidator(Validator):
+    name = 'membership'
+    fields = {'users': USER_FIELDS, 'payments': PAYMENT_FIELDS}
+    fixes = {'APPROVED_NOT_ACTIVE': 'reconcile_memberships.py --apply',
+             'DUPLICATE_PENDING': 'reconcile_memberships.py --apply'}
+
+    def __init__(self, args, now):
+        super().__init__(args, now)
+        self.users = {}
+        self.payments_by_user = defaultdict(list)
+
+    def visit(self, collection, doc, data, report):
+        if collection == 'users':
+            self.users[doc.id] = data
+        else:
+            self.payments_by_user[data.get('userId')].append({**data, 'id': doc.id})
+
+    def finish(self, report):
+        findings = reconcile(self.users, self.payments_by_user, self.now,
+                             timedelta(days=self.args.coverage_days), self.args.skip_free_access)
+        for finding in findings:
+            kind = finding.pop('kind')
+            path = f"payments/{finding['paymentId']}" if kind == 'ORPHAN_PAYMENT' \
+                else f"users/{finding['userId']}"
+            report.add(self.name, kind, path, **finding)
+
+
+class PlanFieldsValidator(Validator):
+    name = 'plans'
+    fields = {'plans': ['name', 'active', 'classesPerMonth'],
+              'users': ['role', 'planId', 'planName', 'classesPerMonth']}
+    fixes = {'CLASSES_PER_MONTH_MISMATCH': 'update_user_plan.py',
+             'PLAN_NAME_MISMATCH': 'update_user_plan.py'}
+
+    def __init__(self, args, now):
+        super().__init__(args, now)
+        self.plans = {}
+        self.plan_ids_by_name = {}
+
+    def visit(self, collection, doc, data, report):
+        if collection == 'plans':
+            self.plans[doc.id] = data
+            if data.get('active'):
+                self.plan_ids_by_name[data.get('name')] = doc.id
+            return
+
+        if data.get('role') == 'admin' or not (data.get('planId') or data.get('planName')):
+            return
+        path = f'users/{doc.id}'
+        plan_id = data.get('planId') or self.plan_ids_by_name.get(data.get('planName'))
+        plan = self.plans.get(plan_id)
+        if plan is None:
+            report.add(self.name, 'UNKNOWN_PLAN', path,
+                       planId=data.get('planId'), planName=data.get('planName'))
+            return
+        if not plan.get('active'):
+            report.add(self.name, 'INACTIVE_PLAN', path, planId=plan_id, planName=plan.get('name'))
+        if data.get('planName') != plan.get('name'):
+            report.add(self.name, 'PLAN_NAME_MISMATCH', path, planId=plan_id,
+                       planName=data.get('planName'), expected=plan.get('name'))
+        # Plan ilimitado: classesPerMonth None en el plan y ausente en el usuario
+        if data.get('classesPerMonth') != plan.get('classesPerMonth'):
+            report.add(self.name, 'CLASSES_PER_MONTH_MISMATCH', path, planId=plan_id,
+                       classesPerMonth=data.get('classesPerMonth'),
+                       expected=plan.get('classesPerMonth'))
+
+
+class CapacityValidator(Validator):
+    name = 'capacity'
+    fields = {'bookings': ['scheduleId', 'classDate', 'status'],
+              'capacity_tracking': ['currentBookings']}
+    fixes = {'CAPACITY_MISMATCH': 'initialize_capacity_counters.py',
+             'CAPACITY_MISSING': 'initialize_capacity_counters.py'}
+
+    def __init__(self, args, now):
+        super().__init__(args, now)
+        self.today = now.astimezone(LOCAL_TZ).date().isoformat()
+        self.expected = Counter()
+        self.stored = {}
+
+    def visit(self, collection, doc, data, report):
+        if collection == 'bookings':
+            if data.get('status') in RELEASED_STATUSES or not data.get('scheduleId') \
+                    or not data.get('classDate'):
+                return
+            date_key = local_date(data['classDate']).isoformat()
+            if date_key >= self.today:
+                self.expected[(data['scheduleId'], date_key)] += 1
+        elif doc.id >= self.today:
+            schedule_id = doc.reference.parent.parent.id
+            self.stored[(schedule_id, doc.id)] = data.get('currentBookings', 0)
+
+    def finish(self, report):
+        for key in sorted(set(self.expected) | set(self.stored)):
+            expected, stored = self.expected.get(key, 0), self.stored.get(key)
+            path = f'class_schedules/{key[0]}/capacity_tracking/{key[1]}'
+            if stored is None:
+                report.add(self.name, 'CAPACITY_MISSING', path, expected=expected)
+            elif stored != expected:
+                report.add(self.name, 'CAPACITY_MISMATCH', path,
+                           currentBookings=stored, expected=expected)
+
+
+class LegacyFieldsValidator(Validator):
+    name = 'legacy_fields'
+    fields = {'users': ['classLimit', 'classesPerMonth']}
+    fixes = {'LEGACY_CLASS_LIMIT': 'fix_user_classespermonth.py'}
+
+    def visit(self, collection, doc, data, report):
+        if 'classLimit' in data:
+            report.add(self.name, 'LEGACY_CLASS_LIMIT', f'users/{doc.id}',
+                       classLimit=data['classLimit'],
+                       hasClassesPerMonth='classesPerMonth' in data)
+
+
+class SearchKeyValidator(Validator):
+    name = 'search_key'
+    fields = {'users': ['email', 'name', 'searchKey', 'searchTokens']}
+    fixes = {'MISSING_SEARCH_KEY': 'add_searchkey_to_users.py',
+             'STALE_SEARCH_KEY': 'add_searchkey_to_users.py',
+             'STALE_SEARCH_TOKENS': 'add_searchkey_to_users.py'}
+
+    def visit(self, collection, doc, data, report):
+        email = data.get('email', '')
+        if not email:
+            return
+        path = f'users/{doc.id}'
+        if not data.get('searchKey'):
+            report.add(self.name, 'MISSING_SEARCH_KEY', path, email=email)
+        elif data['searchKey'] != email.lower():
+            report.add(self.name, 'STALE_SEARCH_KEY', path, email=email, searchKey=data['searchKey'])
+        elif data.get('searchTokens') != build_search_tokens(data.get('name', ''), email):
+            report.add(self.name, 'STALE_SEARCH_TOKENS', path, email=email)
+
+
+VALIDATORS = [MembershipValidator, PlanFieldsValidator, CapacityValidator,
+              LegacyFieldsValidator, SearchKeyValidator]
+
+
+def run_pipeline(db, validators, report, page_size=1000):
+    """Recorre cada colección necesaria una sola vez y reparte los docs."""
+    plan = []
+    for collection, group in SCAN_ORDER:
+        consumers = [v for v in validators if collection in v.fields]
+        if consumers:
+            fields = sorted({f for v in consumers for f in v.fields[collection]})
+            plan.append((collection, group, consumers, fields))
+
+    for step, (collection, group, consumers, fields) in enumerate(plan, start=1):
+        names = ', '.join(v.name for v in consumers)
+        print(f"[{step}/{len(plan) + 1}] Recorriendo {collection} → {names}...")
+        source = db.collection_group(collection) if group else db.collection(collection)
+        for doc in iter_docs(source.select(fields), page_size=page_size):
+            data = doc.to_dict() or {}
+            for validator in consumers:
+                validator.visit(collection, doc, data, report)
+            report.scanned[collection] += 1
+        print(f"  ✅ {report.scanned[collection]} docs\n")
+
+    print(f"[{len(plan) + 1}/{len(plan) + 1}] Cerrando validadores...")
+    for validator in validators:
+        validator.finish(report)
+    print(f"  ✅ {len(report.findings)} hallazgos\n")
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chequeo de integridad en una pasada por colección')
+    names = [v.name for v in VALIDATORS]
+    parser.add_argument('--only', help=f"Validadores a correr, separados por coma ({', '.join(names)})")
+    parser.add_argument('--coverage-days', type=int, default=30,
+                        help='Días que cubre un pago aprobado (default 30)')
+    parser.add_argument('--skip-free-access', action='store_true',
+                        help='No reportar alumnos activos sin pago (fase de acceso libre)')
+    parser.add_argument('--show', type=int, default=10, help='Ejemplos a mostrar por tipo (default 10)')
+    parser.add_argument('--report', help='Guardar el reporte completo en JSON')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--service-account', help='Ruta al service account JSON')
+    args = parser.parse_args()
+
+    selected = set((args.only or ','.join(names)).split(','))
+    unknown = selected - set(names)
+    if unknown:
+        parser.error(f"validadores desconocidos: {', '.join(sorted(unknown))}")
+
+    print("=" * 60)
+    print("CHEQUEO DE INTEGRIDAD")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+    now = datetime.now(timezone.utc)
+    validators = [cls(args, now) for cls in VALIDATORS if cls.name in selected]
+    report = Report()
+    run_pipeline(db, validators, report, args.page_size)
+
+    fixes = {v.name: v.fixes for v in validators}
+    for (validator, kind), items in sorted(report.by_kind().items()):
+        hint = fixes[validator].get(kind)
+        print(f"[{validator}/{kind}] {len(items)}" + (f"  → corregir con {hint}" if hint else ''))
+        for finding in items[:args.show]:
+            detail = {k: v for k, v in finding.items() if k not in ('validator', 'kind', 'path')}
+            print(f"   - {finding['path']} {json.dumps(detail, default=json_default, ensure_ascii=False)}")
+        if len(items) > args.show:
+            print(f"   ... y {len(items) - args.show} más")
+        print()
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'generatedAt': now, 'validators': [v.name for v in validators],
+                       'scanned': report.scanned, 'findings': report.findings},
+                      f, default=json_default, ensure_ascii=False, indent=2)
+        print(f"📄 Reporte guardado en {args.report}\n")
+
+    print("=" * 60)
+    scanned = ', '.join(f'{c}: {n}' for c, n in report.scanned.items())
+    print(f"Docs leídos (una vez cada uno): {scanned}")
+    print(f"Hallazgos: {len(report.findings)}")
+    sys.exit(1 if report.findings else 0)
+
+
+if __name__ == '__main__':
+    main()
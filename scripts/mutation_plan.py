@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flujo plan/apply compartido por los scripts de mutación.
+
+Antes, el dry-run de cada script imprimía una lista y `--apply` volvía a
+leer todo desde cero para recalcular lo mismo. Con este módulo:
+
+  dry-run  El script lee lo necesario y arma un plan con las escrituras
+           exactas (create/update/delete con sus datos). Cada update/delete
+           guarda el `update_time` del doc leído. El plan se escribe a un
+           archivo JSON compacto junto con una estimación de lecturas,
+           escrituras, lotes, costo y duración.
+  --apply  Ejecuta el archivo de plan tal cual, sin volver a escanear.
+           Cada escritura lleva precondición:
+             update/delete  el doc no cambió desde el plan (update_time)
+             create         el doc todavía no existe
+           Lo que cambió entre medio falla con FAILED_PRECONDITION y se
+           reporta; basta con volver a generar el plan.
+
+Un plan es independiente (default) o atómico:
+
+  independiente  Cada escritura vale por sí sola (p.ej. cerrar reservas una
+                 por una): se aplica con un BulkWriter paralelo y las que
+                 fallan se saltan sin afectar al resto.
+  atomic=True    Las escrituras solo tienen sentido juntas (p.ej. mover
+                 reservas y sus contadores): se aplican en un único WriteBatch
+                 con las mismas precondiciones. Si una falla no se aplica
+                 ninguna. El plan no puede pasar de MAX_ATOMIC_WRITES.
+
+Uso desde un script:
+  from mutation_plan import add_plan_arguments, run_plan_workflow
+
+  def build_plan(db, plan):
+      for doc in plan.read_docs(query.get()):
+          plan.update(doc, {'status': 'noShow', 'updatedAt': firestore.SERVER_TIMESTAMP})
+
+  parser = argparse.ArgumentParser(...)
+  add_plan_arguments(parser, 'close_unresolved_bookings')
+  run_plan_workflow(parser.parse_args(), 'close_unresolved_bookings', build_plan)
+  run_plan_workflow(args, 'restructure_evening_schedules', build_plan, atomic=True)
+"""
+
+import json
+import math
+import os
+import sys
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+from google.api_core import exceptions
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.cloud.firestore_v1.bulk_writer import BulkWriter
+
+from firebase_common import (INITIAL_OPS_PER_SECOND, MAX_OPS_PER_SECOND, RAMP_FACTOR,
+                             RAMP_INTERVAL_SECONDS, bulk_writer, init_firestore)
+from firestore_snapshot import decode_value, encode_value
+
+PLAN_VERSION = 1
+
+# Precios de referencia (USD por 100.000 operaciones, multi-región)
+PRICE_PER_100K_READS = 0.06
+PRICE_PER_100K_WRITES = 0.18
+
+# Códigos gRPC de precondición fallida
+FAILED_PRECONDITION = 9
+NOT_FOUND = 5
+ALREADY_EXISTS = 6
+
+# Máximo de escrituras de un commit (límite de Firestore por WriteBatch)
+MAX_ATOMIC_WRITES = 500
+
+_SENTINELS = {
+    '$serverTimestamp': firestore.SERVER_TIMESTAMP,
+    '$deleteField': firestore.DELETE_FIELD,
+}
+
+
+def encode_fields(data):
+    """Codifica los campos de una escritura, incluidos los sentinels."""
+    encoded = {}
+    for field, value in data.items():
+        tag = next((t for t, s in _SENTINELS.items() if value is s), None)
+        encoded[field] = {tag: True} if tag else encode_value(value)
+    return encoded
+
+
+def decode_fields(data, db):
+    decoded = {}
+    for field, value in data.items():
+        if isinstance(value, dict) and len(value) == 1 and next(iter(value)) in _SENTINELS:
+            decoded[field] = _SENTINELS[next(iter(value))]
+        else:
+            decoded[field] = decode_value(value, db)
+    return decoded
+
+
+def estimate_seconds(writes):
+    """Duración de `writes` escrituras con la rampa 500/50/5 sin contención."""
+    rate = INITIAL_OPS_PER_SECOND
+    seconds = 0.0
+    remaining = writes
+    while remaining > 0:
+        window = rate * RAMP_INTERVAL_SECONDS
+        if remaining <= window:
+            return seconds + remaining / rate
+        seconds += RAMP_INTERVAL_SECONDS
+        remaining -= window
+        rate = min(round(rate * RAMP_FACTOR), MAX_OPS_PER_SECOND)
+    return seconds
+
+
+class MutationPlan:
+    """Escrituras exactas a aplicar, con las lecturas que costó calcularlas."""
+
+    def __init__(self, script, atomic=False):
+        self.script = script
+        self.atomic = atomic
+        self.reads = 0
+        self.operations = []
+        self._paths = set()
+
+    def read_docs(self, docs):
+        """Registra como lecturas los docs de una query y los devuelve."""
+        docs = list(docs)
+        self.reads += max(len(docs), 1)  # una query vacía igual cobra 1 lectura
+        return docs
+
+    def read_doc(self, ref):
+        """Lee un doc puntual registrando la lectura."""
+        self.reads += 1
+        return ref.get()
+
+    def _add(self, op, path, data=None, update_time=None):
+        if path in self._paths:
+            # Con precondición por update_time, una segunda escritura al mismo
+            # doc fallaría siempre: el script debe combinarlas antes.
+            raise ValueError(f'El plan ya tiene una escritura para {path}')
+        self._paths.add(path)
+        entry = {'op': op, 'path': path}
+        if data is not None:
+            entry['data'] = encode_fields(data)
+        if update_time is not None:
+            entry['updateTime'] = update_time.rfc3339()
+        self.operations.append(entry)
+
+    def create(self, ref, data):
+        self._add('create', ref.path, data)
+
+    def update(self, snapshot, data):
+        self._add('update', snapshot.reference.path, data, snapshot.update_time)
+
+    def delete(self, snapshot):
+        self._add('delete', snapshot.reference.path, update_time=snapshot.update_time)
+
+    def estimate(self):
+        writes = len(self.operations)
+        cost = (self.reads * PRICE_PER_100K_READS + writes * PRICE_PER_100K_WRITES) / 100000
+        return {
+            'reads': self.reads,
+            'writes': writes,
+            'batches': 1 if self.atomic else math.ceil(writes / BulkWriter.batch_size),
+            'seconds': round(estimate_seconds(writes), 1),
+            'costUsd': round(cost, 4),
+        }
+
+    def save(self, path, project):
+        plan = {
+            'version': PLAN_VERSION,
+            'script': self.script,
+            'project': project,
+            'atomic': self.atomic,
+            'createdAt': datetime.now(timezone.utc).isoformat(),
+            'estimate': self.estimate(),
+            'operations': self.operations,
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_plan(path, script, project):
+    if not os.path.exists(path):
+        print(f"❌ No existe el plan {path}: ejecuta primero el dry-run")
+        sys.exit(1)
+    with open(path, encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get('version') != PLAN_VERSION or plan.get('script') != script:
+        print(f"❌ {path} no es un plan de {script}")
+        sys.exit(1)
+    if plan.get('project') != project:
+        print(f"❌ El plan es del proyecto {plan.get('project')}, no de {project}")
+        sys.exit(1)
+    return plan
+
+
+def print_estimate(estimate):
+    print(f"  Lecturas (ya hechas en el plan): {estimate['reads']}")
+    print(f"  Escrituras: {estimate['writes']} en ~{estimate['batches']} lotes")
+    print(f"  Duración estimada del --apply: ~{estimate['seconds']}s")
+    print(f"  Costo estimado: ~US${estimate['costUsd']}")
+
+
+def _queue_operations(db, plan, writer):
+    """Encola las operaciones del plan (con sus precondiciones) en un BulkWriter o WriteBatch."""
+    for entry in plan['operations']:
+        ref = db.document(entry['path'])
+        option = None
+        if 'updateTime' in entry:
+            update_time = DatetimeWithNanoseconds.from_rfc3339(entry['updateTime'])
+            option = db.write_option(last_update_time=update_time.timestamp_pb())
+
+        if entry['op'] == 'create':
+            writer.create(ref, decode_fields(entry['data'], db))
+        elif entry['op'] == 'update':
+            writer.update(ref, decode_fields(entry['data'], db), option=option)
+        elif entry['op'] == 'delete':
+            writer.delete(ref, option=option)
+        else:
+            raise ValueError(f"Operación desconocida en el plan: {entry['op']}")
+
+
+def apply_plan(db, plan):
+    """Ejecuta las operaciones de un plan independiente; devuelve las fallas definitivas."""
+    writer = bulk_writer(db)
+    _queue_operations(db, plan, writer)
+    writer.close()
+    return writer.failures
+
+
+def apply_plan_atomic(db, plan):
+    """
+    Ejecuta un plan atómico en un solo commit. Si alguna precondición falla
+    se propaga la excepción (FailedPrecondition, NotFound, AlreadyExists) y
+    no se aplica nada.
+    """
+    if len(plan['operations']) > MAX_ATOMIC_WRITES:
+        raise ValueError(f"Un plan atómico admite hasta {MAX_ATOMIC_WRITES} escrituras "
+                         f"(tiene {len(plan['operations'])})")
+    batch = db.batch()
+    _queue_operations(db, plan, batch)
+    batch.commit()
+
+
+def add_plan_arguments(parser, script):
+    parser.add_argument('--plan', default=f'plans/{script}.plan.json',
+                        help='Archivo de plan (default: %(default)s)')
+    parser.add_argument('--apply', action='store_true',
+                        help='Ejecuta el plan guardado (default: dry-run que lo genera)')
+    parser.add_argument('--service-account', help='Ruta al service account JSON')
+
+
+def run_plan_workflow(args, script, build_plan, atomic=False):
+    """
+    dry-run: `build_plan(db, plan)` llena el plan (e imprime su detalle) y se
+    guarda en args.plan. --apply: ejecuta args.plan sin volver a leer, en un
+    solo commit si `atomic`.
+    """
+    db = init_firestore(args.service_account)
+
+    if not args.apply:
+        print("=== DRY-RUN (sin cambios) ===\n")
+        plan = MutationPlan(script, atomic)
+        build_plan(db, plan)
+        if not plan.operations:
+            print('\nNada que hacer.')
+            return
+        if atomic and len(plan.operations) > MAX_ATOMIC_WRITES:
+            print(f"\n❌ El plan tiene {len(plan.operations)} escrituras y debe aplicarse en un solo "
+                  f"commit (máximo {MAX_ATOMIC_WRITES}); no se guarda.")
+            sys.exit(1)
+        plan.save(args.plan, db.project)
+        print(f"\n📄 Plan guardado en {args.plan} ({len(plan.operations)} escrituras)")
+        print_estimate(plan.estimate())
+        print('\nDry-run terminado. Ejecuta con --apply para aplicar este plan.')
+        return
+
+    plan = load_plan(args.plan, script, db.project)
+    print(f"=== APLICANDO plan {args.plan} (creado {plan['createdAt']}) ===\n")
+    print_estimate(plan['estimate'])
+    if plan.get('atomic'):
+        try:
+            apply_plan_atomic(db, plan)
+        except (exceptions.FailedPrecondition, exceptions.NotFound, exceptions.AlreadyExists) as e:
+            print(f"  ❌ {e.message}")
+            print("⚠️  Un doc cambió desde el plan: no se aplicó NINGUNA escritura, "
+                  "vuelve a generar el plan")
+            sys.exit(1)
+        print(f"\n✅ {len(plan['operations'])} escrituras aplicadas en un solo commit")
+        return
+
+    failures = apply_plan(db, plan)
+
+    stale = [f for f in failures if f.code in (FAILED_PRECONDITION, NOT_FOUND, ALREADY_EXISTS)]
+    for failure in failures[:20]:
+        print(f"  ❌ {failure.operation.reference.path}: {failure.message}")
+    print(f"\n✅ {len(plan['operations']) - len(failures)} escrituras aplicadas")
+    if stale:
+        print(f"⚠️  {len(stale)} docs cambiaron desde el plan y no se tocaron: "
+              "vuelve a generar el plan")
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reporte de latencia de entrega de notificaciones.
+
+Mide cuánto espera cada doc antes de que la Cloud Function le ponga sentAt:
+  - notifications:           sentAt - createdAt
+  - scheduled_notifications: sentAt - scheduledFor
+
+Para cada colección y tipo (data.type) reporta cantidad, enviadas, fallidas
+(campo error), pendientes, p50/p90/p99 del lag y los recordatorios "perdidos"
+(vencidos hace más de 5 minutos sin enviar: processScheduledNotifications
+solo mira los últimos 5 minutos, así que ya no se enviarán).
+
+Las lecturas usan proyección (solo los campos de tiempo/estado) y el rango se
+recorre en ventanas de un día para no depender de un único stream largo.
+
+Uso:
+  python scripts/notifications_latency.py                      # últimos 7 días
+  python scripts/notifications_latency.py --since 2026-10-01 --until 2026-10-15
+  python scripts/notifications_latency.py --live --window 30 --interval 60
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from firebase_common import fix_windows_encoding, init_firestore
+
+# (colección, campo de referencia para el lag y el filtro de rango)
+SOURCES = (
+    ('notifications', 'createdAt'),
+    ('scheduled_notifications', 'scheduledFor'),
+)
+
+PROJECTION = ['sent', 'sentAt', 'createdAt', 'scheduledFor', 'error', 'data.type']
+
+# Ventana de processScheduledNotifications (functions/src/functions/notifications.ts)
+SCHEDULER_WINDOW = timedelta(minutes=5)
+
+fix_windows_encoding()
+
+
+def percentile(sorted_values, p):
+    """Percentil con interpolación lineal sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def iter_windows(start, end, step=timedelta(days=1)):
+    while start < end:
+        yield start, min(start + step, end)
+        start += step
+
+
+def scan(db, collection, ref_field, start, end):
+    """Lee los docs con ref_field en [start, end) usando proyección."""
+    for lo, hi in iter_windows(start, end):
+        query = (db.collection(collection)
+                 .where(ref_field, '>=', lo)
+                 .where(ref_field, '<', hi)
+                 .select(PROJECTION))
+        for doc in query.stream():
+            yield doc.to_dict() or {}
+
+
+def collect(db, start, end, now):
+    """Agrupa lags y contadores por (colección, tipo)."""
+    groups = defaultdict(lambda: {'count': 0, 'sent': 0, 'failed': 0,
+                                  'pending': 0, 'missed': 0, 'lags': []})
+    for collection, ref_field in SOURCES:
+        for data in scan(db, collection, ref_field, start, end):
+            notif_type = (data.get('data') or {}).get('type', 'sin_tipo')
+            group = groups[(collection, notif_type)]
+            group['count'] += 1
+
+            reference = data.get(ref_field)
+            sent_at = data.get('sentAt')
+            if data.get('sent') and sent_at and reference:
+                group['sent'] += 1
+                group['lags'].append(max(0.0, (sent_at - reference).total_seconds()))
+            elif data.get('error'):
+                group['failed'] += 1
+            else:
+                group['pending'] += 1
+                if (collection == 'scheduled_notifications' and reference
+                        and reference + SCHEDULER_WINDOW < now):
+                    group['missed'] += 1
+    return groups
+
+
+def format_seconds(value):
+    if value is None:
+        return '-'
+    if value < 60:
+        return f'{value:.1f}s'
+    return f'{value / 60:.1f}m'
+
+
+def print_report(groups):
+    header = (f"{'Colección':<24} {'Tipo':<18} {'Total':>6} {'Env':>6} {'Fall':>5} "
+              f"{'%Fall':>6} {'Pend':>5} {'Perd':>5} {'p50':>7} {'p90':>7} {'p99':>7}")
+    print(header)
+    print("-" * len(header))
+    for (collection, notif_type), g in sorted(groups.items()):
+        lags = sorted(g['lags'])
+        failure_rate = 100 * g['failed'] / g['count'] if g['count'] else 0
+        print(f"{collection:<24} {notif_type[:18]:<18} {g['count']:>6} {g['sent']:>6} "
+              f"{g['failed']:>5} {failure_rate:>5.1f}% {g['pending']:>5} {g['missed']:>5} "
+              f"{format_seconds(percentile(lags, 50)):>7} "
+              f"{format_seconds(percentile(lags, 90)):>7} "
+              f"{format_seconds(percentile(lags, 99)):>7}")
+    if not groups:
+        print("  (sin notificaciones en el rango)")
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latencia de entrega de notificaciones')
+    parser.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+    parser.add_argument('--since', type=parse_date, help='Desde (YYYY-MM-DD, default: hace 7 días)')
+    parser.add_argument('--until', type=parse_date, help='Hasta (YYYY-MM-DD, default: ahora)')
+    parser.add_argument('--live', action='store_true',
+                        help='Muestrea continuamente los docs recientes')
+    parser.add_argument('--window', type=int, default=30,
+                        help='Modo live: minutos hacia atrás a considerar (default 30)')
+    parser.add_argument('--interval', type=int, default=60,
+                        help='Modo live: segundos entre muestras (default 60)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("LATENCIA DE ENTREGA DE NOTIFICACIONES")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+
+    if not args.live:
+        now = datetime.now(timezone.utc)
+        end = args.until or now
+        start = args.since or end - timedelta(days=7)
+        print(f"Rango: {start:%Y-%m-%d %H:%M} → {end:%Y-%m-%d %H:%M} (UTC)\n")
+        print_report(collect(db, start, end, now))
+        return
+
+    print(f"Modo live: ventana de {args.window} min, muestra cada {args.interval}s "
+          f"(Ctrl+C para salir)\n")
+    try:
+        while True:
+            now = datetime.now(timezone.utc)
+            print(f"--- {now:%H:%M:%S} UTC ---")
+            print_report(collect(db, now - timedelta(minutes=args.window), now, now))
+            print()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nDetenido.")
+
+
+if __name__ == '__main__':
+    main()
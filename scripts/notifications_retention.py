@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retención de notificaciones basada en TTL.
+
+cleanupOldNotifications (Cloud Function) borra como máximo 500 docs por
+colección y por día, así que en periodos de alto volumen el backlog crece.
+Este script deja ambas colecciones listas para una política TTL de Firestore:
+
+  1. Agrega `expireAt` a los docs de `notifications` y
+     `scheduled_notifications` que no lo tienen:
+       - enviados:    sentAt (o createdAt) + --days       (default 30)
+       - no enviados: scheduledFor/createdAt + --pending-days (default 90)
+  2. Los docs cuyo expireAt ya pasó (el backlog) se pueden borrar de
+     inmediato con --purge delete, o respaldar en NDJSON comprimido y luego
+     borrar con --purge archive. Sin --purge solo reciben expireAt y el TTL
+     los borra en las siguientes 24 h.
+
+Todas las escrituras van por BulkWriter (paralelo, con reintentos).
+
+La política TTL sobre expireAt (sin índices) está declarada en
+firestore.indexes.json → `firebase deploy --only firestore:indexes`.
+Equivalente manual:
+  gcloud firestore fields ttls update expireAt \\
+      --collection-group=notifications --enable-ttl
+  gcloud firestore fields ttls update expireAt \\
+      --collection-group=scheduled_notifications --enable-ttl
+
+Uso:
+  python scripts/notifications_retention.py                        # dry-run
+  python scripts/notifications_retention.py --apply
+  python scripts/notifications_retention.py --purge archive --archive-dir backups/ --apply
+  python scripts/notifications_retention.py [ruta_al_service_account.json] --apply
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from firebase_common import bulk_writer, fix_windows_encoding, init_firestore, iter_docs
+
+COLLECTIONS = ('notifications', 'scheduled_notifications')
+
+# Campos necesarios para calcular expireAt (proyección: no se baja el payload)
+PROJECTION = ['sent', 'sentAt', 'createdAt', 'scheduledFor', 'expireAt']
+
+fix_windows_encoding()
+
+
+def compute_expire_at(data, days, pending_days):
+    """Calcula expireAt según el estado del doc; None si no hay fecha base."""
+    if data.get('sent'):
+        base = data.get('sentAt') or data.get('createdAt')
+        return base + timedelta(days=days) if base else None
+    base = data.get('scheduledFor') or data.get('createdAt')
+    return base + timedelta(days=pending_days) if base else None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def process_collection(db, name, args, now, archive_path=None):
+    """Recorre una colección y encola expireAt/borrados. Devuelve los contadores."""
+    stats = {'scanned': 0, 'stamped': 0, 'purged': 0, 'already': 0, 'no_date': 0}
+    query = db.collection(name)
+    if archive_path is None:
+        query = query.select(PROJECTION)
+
+    writer = bulk_writer(db) if args.apply else None
+    archive = gzip.open(archive_path, 'wt', encoding='utf-8') if archive_path else None
+    to_delete = []
+
+    try:
+        for doc in iter_docs(query, page_size=args.page_size):
+            stats['scanned'] += 1
+            data = doc.to_dict() or {}
+
+            if data.get('expireAt') is not None:
+                stats['already'] += 1
+                continue
+
+            expire_at = compute_expire_at(data, args.days, args.pending_days)
+            if expire_at is None:
+                stats['no_date'] += 1
+                continue
+
+            if expire_at <= now and args.purge != 'none':
+                stats['purged'] += 1
+                if archive is not None:
+                    archive.write(json.dumps({'id': doc.id, 'data': data},
+                                             default=_json_default, ensure_ascii=False) + '\n')
+                to_delete.append(doc.reference)
+                continue
+
+            stats['stamped'] += 1
+            if writer:
+                writer.update(doc.reference, {'expireAt': expire_at})
+    finally:
+        # El respaldo queda cerrado en disco antes de encolar cualquier borrado
+        if archive is not None:
+            archive.close()
+
+    if writer:
+        for ref in to_delete:
+            writer.delete(ref)
+        writer.close()
+        stats['failed'] = len(writer.failures)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Retención TTL de notificaciones')
+    parser.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+    parser.add_argument('--days', type=int, default=30,
+                        help='Días de retención de notificaciones enviadas (default 30)')
+    parser.add_argument('--pending-days', type=int, default=90,
+                        help='Días de retención de notificaciones no enviadas (default 90)')
+    parser.add_argument('--purge', choices=('none', 'delete', 'archive'), default='none',
+                        help='Qué hacer con el backlog ya vencido (default: solo expireAt)')
+    parser.add_argument('--archive-dir', default='notifications_archive',
+                        help='Directorio para los respaldos de --purge archive')
+    parser.add_argument('--collection', action='append', choices=COLLECTIONS,
+                        help='Limitar a una colección (repetible)')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--apply', action='store_true', help='Aplica los cambios (default: dry-run)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("RETENCIÓN TTL DE NOTIFICACIONES")
+    print("=" * 60)
+    mode = 'APLICANDO' if args.apply else 'DRY-RUN (sin cambios)'
+    print(f"\n=== {mode} ===  (retención: {args.days} días enviadas, "
+          f"{args.pending_days} días pendientes, purge: {args.purge})\n")
+
+    db = init_firestore(args.service_account)
+    now = datetime.now(timezone.utc)
+    collections = args.collection or COLLECTIONS
+    totals = {}
+
+    for i, name in enumerate(collections, start=1):
+        print(f"[{i}/{len(collections)}] Procesando {name}...")
+        archive_path = None
+        if args.purge == 'archive' and args.apply:
+            os.makedirs(args.archive_dir, exist_ok=True)
+            archive_path = os.path.join(args.archive_dir, f"{name}-{now:%Y%m%d-%H%M%S}.ndjson.gz")
+            print(f"  📦 Respaldo: {archive_path}")
+        stats = process_collection(db, name, args, now, archive_path)
+
+        totals[name] = stats
+        print(f"  Documentos revisados: {stats['scanned']}")
+        print(f"  Ya tenían expireAt:   {stats['already']}")
+        print(f"  expireAt agregado:    {stats['stamped']}")
+        print(f"  Backlog purgado:      {stats['purged']}")
+        if stats['no_date']:
+            print(f"  ⚠️  Sin fecha base (omitidos): {stats['no_date']}")
+        if stats.get('failed'):
+            print(f"  ❌ Escrituras fallidas: {stats['failed']}")
+        print()
+
+    print("=" * 60)
+    print("✅ RETENCIÓN COMPLETADA" if args.apply else "Dry-run terminado. Ejecuta con --apply para aplicar.")
+    print("=" * 60)
+
+    if any(s.get('failed') for s in totals.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Propagación de campos denormalizados a las reservas futuras.
+
+Cada booking guarda copias de datos del usuario y del horario para que la
+app no tenga que leerlos al listar:
+
+  userName      <- users/{userId}.name
+  scheduleTime  <- class_schedules/{scheduleId}.time
+  scheduleType  <- class_schedules/{scheduleId}.type
+  instructor    <- class_schedules/{scheduleId}.instructor
+
+Un cambio de nombre o de instructor deja esas copias desactualizadas
+(restructure_evening_schedules.py las corrigió a mano para su caso). Este
+job:
+
+  1. Busca usuarios y horarios con updatedAt desde la marca de agua
+     (config/denormalized_propagation, con un solape de 2 minutos).
+  2. Para esos IDs consulta solo las reservas futuras (classDate desde hoy),
+     con queries `in` de a 30 IDs + rango de fecha y proyección de las
+     copias (usa los índices userId+classDate y scheduleId+classDate).
+  3. Escribe con BulkWriter únicamente las reservas cuya copia difiere
+     (una sola escritura por reserva aunque cambien usuario y horario).
+  4. Avanza la marca de agua si no hubo fallas.
+
+La primera vez (o con --full) se consideran cambiados todos los usuarios y
+horarios.
+
+Uso:
+  python scripts/propagate_denormalized.py            # p.ej. cada 15 min por cron
+  python scripts/propagate_denormalized.py --dry-run
+  python scripts/propagate_denormalized.py --full
+"""
+
+import argparse
+import sys
+from datetime import datetime, timezone
+
+from firebase_common import (IN_QUERY_LIMIT, LOCAL_TZ, WATERMARK_OVERLAP, bulk_writer, chunked,
+                             fix_windows_encoding, init_firestore, iter_docs, read_watermark,
+                             write_watermark)
+
+WATERMARK_ID = 'denormalized_propagation'
+
+# Colección fuente -> (campo de bookings que la referencia, {copia en bookings: campo en la fuente})
+SOURCES = {
+    'users': ('userId', {'userName': 'name'}),
+    'class_schedules': ('scheduleId', {'scheduleTime': 'time',
+                                       'scheduleType': 'type',
+                                       'instructor': 'instructor'}),
+}
+
+fix_windows_encoding()
+
+
+def changed_sources(db, collection, since):
+    """ID -> campos fuente de los docs de `collection` modificados desde `since` (todos si es None)."""
+    fields = sorted(SOURCES[collection][1].values())
+    if since is None:
+        docs = iter_docs(db.collection(collection).select(fields))
+    else:
+        docs = db.collection(collection).where('updatedAt', '>=', since).select(fields).stream()
+    return {doc.id: doc.to_dict() or {} for doc in docs}
+
+
+def stale_copies(booking, source, mapping):
+    """Copias de la reserva que no coinciden con la fuente (las vacías en la fuente no se propagan)."""
+    return {copy: source[field] for copy, field in mapping.items()
+            if source.get(field) and booking.get(copy) != source[field]}
+
+
+def stale_bookings(db, collection, changed, since_date, pending):
+    """
+    Acumula en `pending` (path -> (ref, update)) las reservas futuras con
+    copias desactualizadas de los docs cambiados; devuelve cuántas revisó.
+    """
+    ref_field, mapping = SOURCES[collection]
+    checked = 0
+    for ids in chunked(sorted(changed), IN_QUERY_LIMIT):
+        query = (db.collection('bookings')
+                 .where(ref_field, 'in', ids)
+                 .where('classDate', '>=', since_date)
+                 .select([ref_field] + sorted(mapping)))
+        for doc in query.stream():
+            booking = doc.to_dict() or {}
+            checked += 1
+            update = stale_copies(booking, changed[booking[ref_field]], mapping)
+            if update:
+                # Una reserva puede cambiar por usuario y por horario: una sola escritura
+                pending.setdefault(doc.reference.path, (doc.reference, {}))[1].update(update)
+    return checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Propaga userName/scheduleTime/scheduleType/instructor a bookings')
+    parser.add_argument('--full', action='store_true',
+                        help='Considerar cambiados todos los usuarios y horarios (ignora la marca de agua)')
+    parser.add_argument('--dry-run', action='store_true', help='Solo contar, sin escribir')
+    parser.add_argument('--service-account', help='Ruta al service account JSON')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("PROPAGACIÓN DE CAMPOS DENORMALIZADOS A BOOKINGS")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+    started = datetime.now(timezone.utc)
+    today = datetime.now(LOCAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    watermark = None if args.full else read_watermark(db, WATERMARK_ID)
+    since = watermark - WATERMARK_OVERLAP if watermark else None
+    label = f"desde {since:%Y-%m-%d %H:%M:%S} UTC" if since else "(todos: sin marca de agua)"
+
+    print(f"[1/4] Usuarios y horarios cambiados {label}...")
+    changed = {collection: changed_sources(db, collection, since) for collection in SOURCES}
+    for collection, docs in changed.items():
+        print(f"  ✅ {collection}: {len(docs)}")
+
+    print(f"\n[2/4] Buscando reservas desde {today:%Y-%m-%d} con copias desactualizadas...")
+    pending = {}
+    for collection, docs in changed.items():
+        before = len(pending)
+        checked = stale_bookings(db, collection, docs, today, pending)
+        print(f"  ✅ {collection}: {checked} reservas revisadas, {len(pending) - before} nuevas a actualizar")
+
+    print("\n[3/4] Escribiendo...")
+    failures = []
+    if args.dry_run:
+        print(f"  Dry-run: {len(pending)} reservas se actualizarían")
+    else:
+        writer = bulk_writer(db)
+        for ref, update in pending.values():
+            # Sin updatedAt: la reserva en sí no cambió y así usage_counters
+            # sync no la vuelve a contar
+            writer.update(ref, update)
+        writer.close()
+        failures = writer.failures
+        for failure in failures[:20]:
+            print(f"  ❌ {failure.operation.reference.path}: {failure.message}")
+        print(f"  ✅ {len(pending) - len(failures)} reservas actualizadas")
+
+    print("\n[4/4] Guardando marca de agua...")
+    if args.dry_run:
+        print("  Dry-run: la marca de agua no avanza")
+    elif failures:
+        print("⚠️  Hubo escrituras fallidas: la marca de agua no avanza")
+        sys.exit(1)
+    else:
+        write_watermark(db, WATERMARK_ID, started)
+        print(f"  ✅ lastSyncAt = {started:%Y-%m-%d %H:%M:%S} UTC")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reconciliación de pagos y membresías en una sola pasada.
+
+check_users_status.py imprime los usuarios y después consulta `payments`
+usuario por usuario. Este script lee `users` y `payments` UNA vez cada uno
+(con proyección), los cruza en memoria por userId (hash join) y reporta:
+
+  APPROVED_NOT_ACTIVE      pago aprobado vigente pero el usuario no está 'active'
+  ACTIVE_NO_VALID_PAYMENT  alumno 'active' sin pago aprobado vigente
+  PENDING_NO_PAYMENT       usuario 'pending' sin ningún pago pendiente
+  DUPLICATE_PENDING        más de un pago pendiente del mismo tipo
+  ORPHAN_PAYMENT           pago cuyo userId no existe en users
+
+Un pago aprobado es "vigente" si su fecha (reviewedAt, o paymentDate si no
+fue revisado) + --coverage-days (default 30) todavía no pasó.
+
+Con --apply se corrigen en bloque (BulkWriter) los casos seguros:
+  - APPROVED_NOT_ACTIVE: membershipStatus -> 'active' y expirationDate al
+    fin de la cobertura del pago (si no tenía una futura).
+  - DUPLICATE_PENDING: se deja el pago más reciente y los demás se marcan
+    'rejected' con rejectionReason.
+El resto solo se reporta (en fase de acceso libre ACTIVE_NO_VALID_PAYMENT es
+esperable; usa --skip-free-access para omitirlo).
+
+Uso:
+  python scripts/reconcile_memberships.py                     # solo reporte
+  python scripts/reconcile_memberships.py --report reconciliacion.json
+  python scripts/reconcile_memberships.py --apply
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+
+from firebase_common import bulk_writer, fix_windows_encoding, init_firestore, iter_docs
+
+USER_FIELDS = ['email', 'role', 'membershipStatus', 'expirationDate']
+PAYMENT_FIELDS = ['userId', 'type', 'status', 'paymentDate', 'reviewedAt', 'createdAt']
+
+NOT_ACTIVE_STATUSES = {'none', 'pending', 'expired', 'inactive'}
+
+fix_windows_encoding()
+
+
+def payment_date(payment):
+    return payment.get('reviewedAt') or payment.get('paymentDate') or payment.get('createdAt')
+
+
+def load_users(db):
+    return {doc.id: doc.to_dict() or {}
+            for doc in iter_docs(db.collection('users').select(USER_FIELDS))}
+
+
+def load_payments_by_user(db):
+    by_user = defaultdict(list)
+    total = 0
+    for doc in iter_docs(db.collection('payments').select(PAYMENT_FIELDS)):
+        payment = doc.to_dict() or {}
+        payment['id'] = doc.id
+        by_user[payment.get('userId')].append(payment)
+        total += 1
+    return by_user, total
+
+
+def reconcile(users, payments_by_user, now, coverage, skip_free_access=False):
+    """Devuelve la lista de hallazgos (dicts con 'kind' y contexto)."""
+    findings = []
+
+    for user_id, payments in payments_by_user.items():
+        if user_id not in users:
+            for p in payments:
+                findings.append({'kind': 'ORPHAN_PAYMENT', 'paymentId': p['id'], 'userId': user_id})
+
+    for user_id, user in users.items():
+        if user.get('role') == 'admin':
+            continue
+        status = user.get('membershipStatus', 'none')
+        email = user.get('email', 'sin email')
+        payments = payments_by_user.get(user_id, [])
+
+        approved = [p for p in payments if p.get('status') == 'approved' and payment_date(p)]
+        latest_approved = max(approved, key=payment_date, default=None)
+        covered_until = payment_date(latest_approved) + coverage if latest_approved else None
+        has_valid_payment = covered_until is not None and covered_until >= now
+
+        pending = [p for p in payments if p.get('status') == 'pending']
+
+        if has_valid_payment and status in NOT_ACTIVE_STATUSES:
+            findings.append({'kind': 'APPROVED_NOT_ACTIVE', 'userId': user_id, 'email': email,
+                             'status': status, 'paymentId': latest_approved['id'],
+                             'coveredUntil': covered_until,
+                             'expirationDate': user.get('expirationDate')})
+        elif status == 'active' and not has_valid_payment and not skip_free_access:
+            findings.append({'kind': 'ACTIVE_NO_VALID_PAYMENT', 'userId': user_id, 'email': email,
+                             'lastApproved': latest_approved['id'] if latest_approved else None})
+
+        if status == 'pending' and not pending and not has_valid_payment:
+            findings.append({'kind': 'PENDING_NO_PAYMENT', 'userId': user_id, 'email': email})
+
+        pending_by_type = defaultdict(list)
+        for p in pending:
+            pending_by_type[p.get('type')].append(p)
+        for payment_type, group in pending_by_type.items():
+            if len(group) > 1:
+                group.sort(key=lambda p: p.get('createdAt') or now, reverse=True)
+                findings.append({'kind': 'DUPLICATE_PENDING', 'userId': user_id, 'email': email,
+                                 'type': payment_type, 'keep': group[0]['id'],
+                                 'duplicates': [p['id'] for p in group[1:]]})
+
+    return findings
+
+
+def apply_fixes(db, findings, now):
+    writer = bulk_writer(db)
+    fixed = 0
+    for f in findings:
+        if f['kind'] == 'APPROVED_NOT_ACTIVE':
+            update = {'membershipStatus': 'active', 'updatedAt': firestore.SERVER_TIMESTAMP}
+            expiration = f.get('expirationDate')
+            if not expiration or expiration < now:
+                update['expirationDate'] = f['coveredUntil']
+            writer.update(db.collection('users').document(f['userId']), update)
+            fixed += 1
+        elif f['kind'] == 'DUPLICATE_PENDING':
+            for payment_id in f['duplicates']:
+                writer.update(db.collection('payments').document(payment_id), {
+                    'status': 'rejected',
+                    'rejectionReason': 'Pago duplicado (reconciliación automática)',
+                    'reviewedBy': 'reconciliacion',
+                    'reviewedAt': firestore.SERVER_TIMESTAMP,
+                })
+                fixed += 1
+    writer.close()
+    return fixed, writer.failures
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconciliación de pagos y membresías')
+    parser.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+    parser.add_argument('--coverage-days', type=int, default=30,
+                        help='Días que cubre un pago aprobado (default 30)')
+    parser.add_argument('--skip-free-access', action='store_true',
+                        help='No reportar alumnos activos sin pago (fase de acceso libre)')
+    parser.add_argument('--report', help='Guardar los hallazgos en un archivo JSON')
+    parser.add_argument('--apply', action='store_true', help='Corrige los casos seguros')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("RECONCILIACIÓN DE PAGOS Y MEMBRESÍAS")
+    print("=" * 60)
+    mode = 'APLICANDO' if args.apply else 'SOLO REPORTE (sin cambios)'
+    print(f"\n=== {mode} ===\n")
+
+    db = init_firestore(args.service_account)
+    now = datetime.now(timezone.utc)
+
+    print("[1/3] Leyendo users (proyección)...")
+    users = load_users(db)
+    print(f"✅ {len(users)} usuarios\n")
+
+    print("[2/3] Leyendo payments (proyección) y cruzando por userId...")
+    payments_by_user, total_payments = load_payments_by_user(db)
+    findings = reconcile(users, payments_by_user, now,
+                         timedelta(days=args.coverage_days), args.skip_free_access)
+    print(f"✅ {total_payments} pagos, {len(findings)} hallazgos\n")
+
+    by_kind = defaultdict(list)
+    for f in findings:
+        by_kind[f['kind']].append(f)
+    for kind, items in sorted(by_kind.items()):
+        print(f"[{kind}] {len(items)}")
+        for f in items[:20]:
+            detail = {k: v for k, v in f.items() if k != 'kind'}
+            print(f"   - {json.dumps(detail, default=_json_default, ensure_ascii=False)}")
+        if len(items) > 20:
+            print(f"   ... y {len(items) - 20} más")
+        print()
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as fh:
+            json.dump(findings, fh, default=_json_default, ensure_ascii=False, indent=2)
+        print(f"📄 Reporte guardado en {args.report}\n")
+
+    if not args.apply:
+        print("Reporte terminado. Ejecuta con --apply para corregir los casos seguros.")
+        return
+
+    print("[3/3] Aplicando correcciones...")
+    fixed, failures = apply_fixes(db, findings, now)
+    print(f"✅ {fixed - len(failures)} escrituras aplicadas")
+    if failures:
+        print(f"❌ {len(failures)} escrituras fallidas")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Integridad referencial entre colecciones (hash join en memoria acotada).
+
+bookings referencian scheduleId y userId, payments referencian userId, y
+capacity_tracking/usage cuelgan de un horario/usuario. recreate_schedules.py
+y los scripts de borrado pueden dejar referencias colgando. Este script:
+
+  1. Arma el conjunto de claves de cada colección referida (users,
+     class_schedules) con un scan que solo trae los IDs (proyección
+     __name__). Hasta BLOOM_THRESHOLD claves es un set exacto; por encima,
+     o con --bloom, un filtro de Bloom (~2.4 MB por millón de claves con
+     tasa de falsos positivos 0.0001).
+  2. Recorre cada colección que referencia UNA vez (con proyección de los
+     campos de referencia) y la compara contra esos conjuntos.
+  3. Antes de contar un huérfano vuelve a leer (get_all, en lotes) las
+     referencias que no estaban en el conjunto: un usuario u horario creado
+     después del paso 1 no deja huérfanas a sus reservas nuevas.
+  4. Reporta los huérfanos por relación; con --fix borra en bloque
+     (BulkWriter) los de las relaciones cuya acción es 'delete'. Un doc sin
+     valor de referencia (p.ej. booking sin userId) solo se reporta. Si se
+     borraron bookings, recalcula los contadores users/{id}/usage de los
+     pares (usuario, mes) afectados (usage_counters.refresh): el sync
+     incremental no ve borrados.
+
+La memoria queda acotada por los conjuntos de claves: los huérfanos no se
+acumulan, van directo al --report (NDJSON) y al BulkWriter. Un filtro de
+Bloom solo puede dar falsos "existe", nunca falsos huérfanos: en el peor
+caso queda algún huérfano sin detectar, pero nunca se borra algo válido.
+
+Uso:
+  python scripts/referential_check.py
+  python scripts/referential_check.py --report huerfanos.ndjson
+  python scripts/referential_check.py --only capacity_tracking,dashboards --fix
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import sys
+from collections import Counter, defaultdict
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from firebase_common import bulk_writer, fix_windows_encoding, init_firestore, iter_docs
+from usage_counters import booking_pair, refresh
+
+fix_windows_encoding()
+
+# Origen de la clave cuando no es un campo
+DOC_ID = '__id__'        # el ID del propio doc (dashboards/{userId})
+PARENT = '__parent__'    # el doc padre (class_schedules/{id}/capacity_tracking/...)
+
+# (nombre, colección que referencia, es collection group, clave, colección referida, acción con --fix)
+RELATIONS = [
+    ('bookings.userId', 'bookings', False, 'userId', 'users', 'delete'),
+    # Historial de clases: un horario recreado con otro ID no borra las reservas
+    ('bookings.scheduleId', 'bookings', False, 'scheduleId', 'class_schedules', 'report'),
+    # Registros contables: se reportan, nunca se borran
+    ('payments.userId', 'payments', False, 'userId', 'users', 'report'),
+    ('dashboards', 'dashboards', False, DOC_ID, 'users', 'delete'),
+    ('users/usage', 'usage', True, PARENT, 'users', 'delete'),
+    ('capacity_tracking', 'capacity_tracking', True, PARENT, 'class_schedules', 'delete'),
+    ('schedule_overrides.scheduleId', 'schedule_overrides', False, 'scheduleId', 'class_schedules', 'delete'),
+]
+
+BLOOM_THRESHOLD = 1_000_000
+BLOOM_ERROR_RATE = 0.0001
+
+# Candidatos a huérfano que se re-verifican juntos con un get_all
+RECHECK_BATCH = 300
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre un bytearray (doble hashing con blake2b)."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+
+def build_key_set(db, collection, force_bloom=False, page_size=1000):
+    """IDs de `collection` desde un scan sin campos; set exacto o Bloom según el tamaño."""
+    expected = db.collection(collection).count().get()[0][0].value
+    keys = BloomFilter(expected) if force_bloom or expected > BLOOM_THRESHOLD else set()
+    query = db.collection(collection).select([FieldPath.document_id()])
+    for doc in iter_docs(query, page_size=page_size):
+        keys.add(doc.id)
+    return keys
+
+
+def reference_of(doc, data, key):
+    if key == DOC_ID:
+        return doc.id
+    if key == PARENT:
+        return doc.reference.parent.parent.id
+    return data.get(key)
+
+
+def is_document_id(value):
+    """Si `value` puede ser el ID de un doc (si no, la referencia solo se reporta)."""
+    return isinstance(value, str) and value != '' and '/' not in value
+
+
+def recheck_missing(db, key_sets, candidates):
+    """
+    Vuelve a leer las referencias (colección, ID) de `candidates` que no
+    estaban en los conjuntos del paso 1; las que ahora existen se agregan al
+    conjunto y se devuelven.
+    """
+    refs = {(target, value) for _, misses in candidates for _, target, _, value in misses
+            if is_document_id(value)}
+    if not refs:
+        return set()
+    found = set()
+    for snapshot in db.get_all([db.collection(target).document(value) for target, value in refs]):
+        if snapshot.exists:
+            found.add((snapshot.reference.parent.id, snapshot.id))
+            key_sets[snapshot.reference.parent.id].add(snapshot.id)
+    return found
+
+
+def describe(keys):
+    if isinstance(keys, BloomFilter):
+        return f"{len(keys)} claves (Bloom, {keys.memory_bytes() / 1024 / 1024:.1f} MB, {keys.hashes} hashes)"
+    return f"{len(keys)} claves (set exacto)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Integridad referencial entre colecciones')
+    names = [r[0] for r in RELATIONS]
+    parser.add_argument('--only', help=f"Relaciones a revisar, separadas por coma ({', '.join(names)})")
+    parser.add_argument('--bloom', action='store_true',
+                        help=f'Usar filtros de Bloom aunque haya menos de {BLOOM_THRESHOLD} claves')
+    parser.add_argument('--fix', action='store_true',
+                        help="Borrar los huérfanos de las relaciones con acción 'delete'")
+    parser.add_argument('--report', help='Guardar cada huérfano en un archivo NDJSON')
+    parser.add_argument('--show', type=int, default=10, help='Ejemplos a mostrar por relación (default 10)')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--service-account', help='Ruta al service account JSON')
+    args = parser.parse_args()
+
+    selected = set((args.only or ','.join(names)).split(','))
+    unknown = selected - set(names)
+    if unknown:
+        parser.error(f"relaciones desconocidas: {', '.join(sorted(unknown))}")
+    relations = [r for r in RELATIONS if r[0] in selected]
+
+    print("=" * 60)
+    print("INTEGRIDAD REFERENCIAL")
+    print("=" * 60)
+    print(f"\n=== {'CORRIGIENDO (--fix)' if args.fix else 'SOLO REPORTE (sin cambios)'} ===\n")
+
+    db = init_firestore(args.service_account)
+
+    print("[1/3] Armando conjuntos de claves (scan solo de IDs)...")
+    key_sets = {}
+    for target in dict.fromkeys(r[4] for r in relations):
+        key_sets[target] = build_key_set(db, target, args.bloom, args.page_size)
+        print(f"  ✅ {target}: {describe(key_sets[target])}")
+
+    # Cada colección que referencia se recorre una sola vez para todas sus relaciones
+    by_source = defaultdict(list)
+    for relation in relations:
+        by_source[(relation[1], relation[2])].append(relation)
+
+    print("\n[2/3] Recorriendo colecciones que referencian...")
+    writer = bulk_writer(db) if args.fix else None
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    orphans = Counter()
+    examples = defaultdict(list)
+    scanned = Counter()
+    deleted = 0
+    revived = 0
+    unreferenced = 0
+    candidates = []
+    usage_pairs = set()
+
+    def settle():
+        """Re-verifica los candidatos acumulados y reporta/borra los huérfanos confirmados."""
+        nonlocal deleted, revived, unreferenced
+        found = recheck_missing(db, key_sets, candidates)
+        for doc, misses in candidates:
+            delete = False
+            for name, target, action, value in misses:
+                if (target, value) in found:
+                    revived += 1
+                    continue
+                orphans[name] += 1
+                if len(examples[name]) < args.show:
+                    examples[name].append((doc.reference.path, value))
+                if report:
+                    report.write(json.dumps({'relation': name, 'path': doc.reference.path,
+                                             'target': target, 'value': value},
+                                            ensure_ascii=False, default=str) + '\n')
+                if not is_document_id(value):
+                    unreferenced += action == 'delete'
+                    continue
+                delete = delete or action == 'delete'
+            if delete and writer:
+                writer.delete(doc.reference)
+                deleted += 1
+                if doc.reference.parent.id == 'bookings':
+                    pair = booking_pair(doc.to_dict() or {})
+                    if pair:
+                        usage_pairs.add(pair)
+        candidates.clear()
+
+    try:
+        for (collection, group), source_relations in by_source.items():
+            fields = {r[3] for r in source_relations if r[3] not in (DOC_ID, PARENT)}
+            if args.fix and collection == 'bookings':
+                fields.add('classDate')  # para recalcular usage de lo borrado
+            fields = sorted(fields)
+            source = db.collection_group(collection) if group else db.collection(collection)
+            query = source.select(fields or [FieldPath.document_id()])
+            for doc in iter_docs(query, page_size=args.page_size):
+                scanned[collection] += 1
+                data = doc.to_dict() or {}
+                misses = []
+                for name, _, _, key, target, action in source_relations:
+                    value = reference_of(doc, data, key)
+                    if is_document_id(value) and value in key_sets[target]:
+                        continue
+                    misses.append((name, target, action, value))
+                if misses:
+                    candidates.append((doc, misses))
+                    if len(candidates) >= RECHECK_BATCH:
+                        settle()
+            settle()
+            print(f"  ✅ {collection}: {scanned[collection]} docs")
+        if writer:
+            writer.close()
+    finally:
+        if report:
+            report.close()
+
+    print("\n[3/3] Resumen")
+    print("=" * 60)
+    for name, _, _, _, target, action in relations:
+        print(f"[{name} → {target}] {orphans[name]} huérfanos (acción: {action})")
+        for path, value in examples[name]:
+            print(f"   - {path} ({value or 'sin referencia'})")
+        if orphans[name] > len(examples[name]):
+            print(f"   ... y {orphans[name] - len(examples[name])} más")
+    if revived:
+        print(f"\nℹ️  {revived} referencias aparecieron después del paso 1 (re-verificadas): no son huérfanos")
+    if unreferenced:
+        print(f"ℹ️  {unreferenced} docs sin valor de referencia válido: solo se reportan, no se borran")
+    if any(isinstance(k, BloomFilter) for k in key_sets.values()):
+        print(f"\nℹ️  Con Bloom puede quedar hasta ~{BLOOM_ERROR_RATE:.2%} de huérfanos sin detectar "
+              "(nunca se marca como huérfano algo válido)")
+    if args.report:
+        print(f"\n📄 Detalle en {args.report}")
+
+    if writer:
+        failures = list(writer.failures)
+        if usage_pairs:
+            failures += refresh(db, usage_pairs)
+        for failure in failures[:20]:
+            print(f"  ❌ {failure.operation.reference.path}: {failure.message}")
+        print(f"\n✅ {deleted - len(writer.failures)} docs huérfanos borrados")
+        if usage_pairs:
+            print(f"✅ {len(usage_pairs)} contadores de uso (usuario, mes) recalculados")
+        if failures:
+            sys.exit(1)
+    elif sum(orphans.values()):
+        print("\nReporte terminado. Ejecuta con --fix para borrar los huérfanos de acción 'delete'.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rol de cada usuario como custom claim de Firebase Auth.
+
+firestore.rules decide si alguien es admin leyendo users/{uid} en cada
+evaluación (`get(...).data.role == 'admin'`): una lectura facturada más y
+latencia extra en cada request. Con el rol en el token
+(`request.auth.token.role == 'admin'`) las reglas no necesitan leer nada.
+Este script deja los claims alineados con la colección `users`:
+
+  migrate  Todos los usuarios: lee users (proyección role), compara contra
+           los claims actuales con get_users (lotes de 100) y llama
+           set_custom_user_claims solo a los desalineados, en paralelo.
+  verify   Igual que migrate pero sin escribir: reporta los desalineados y
+           los usuarios sin cuenta en Auth. Código de salida 1 si hay.
+  sync     Lo mismo que migrate, para cron después de la migración. Guarda
+           la última alineación exitosa en config/role_claims.
+
+sync NO filtra por updatedAt: el rol se cambia a mano en la consola de
+Firebase (ADMIN_SETUP.md) y eso no toca updatedAt, y las escrituras de la
+app no tocan `role`. Un filtro incremental nunca vería esos cambios y un
+admin degradado conservaría el claim. Por eso cada corrida lee `role` de
+todos los usuarios (proyección: un doc chico por usuario) y lo compara con
+Auth en lotes de 100; solo se escriben los desalineados. Un cambio de rol
+tarda en llegar hasta la próxima corrida de sync más la renovación del ID
+token: con las reglas en token claims, degradar a un admin comprometido
+requiere además correr sync a mano (y revocar sus sesiones en Auth).
+
+Los demás claims de cada usuario se conservan; un usuario sin `role` en
+Firestore queda como 'student'. El claim nuevo llega al cliente cuando
+renueva su ID token (a lo más en una hora, o forzando getIdToken(true)).
+Recién cuando verify da 0 conviene cambiar las reglas a token claims.
+
+Uso:
+  python scripts/role_claims.py verify
+  python scripts/role_claims.py migrate
+  python scripts/role_claims.py sync             # p.ej. cada 5 minutos por cron
+"""
+
+import argparse
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+
+from firebase_admin import auth
+
+from async_firestore import AsyncPool, run
+from firebase_common import (chunked, fix_windows_encoding, init_firestore, iter_docs, read_watermark,
+                             write_watermark)
+
+WATERMARK_ID = 'role_claims'
+
+# Máximo de identificadores por llamada a auth.get_users
+GET_USERS_LIMIT = 100
+
+DEFAULT_ROLE = 'student'
+
+fix_windows_encoding()
+
+
+def load_roles(db):
+    """uid -> rol de todos los usuarios (un cambio de rol no deja rastro en updatedAt)."""
+    docs = iter_docs(db.collection('users').select(['role']))
+    return {doc.id: (doc.to_dict() or {}).get('role') or DEFAULT_ROLE for doc in docs}
+
+
+def desired_claims(current, role):
+    claims = dict(current or {})
+    claims['role'] = role
+    return claims
+
+
+async def diff_claims(pool, roles):
+    """
+    Compara el rol de Firestore con los claims de Auth (get_users en lotes,
+    en paralelo). Devuelve ({uid: (claims actuales, claims deseados)} de los
+    desalineados, [uids sin cuenta en Auth]).
+    """
+    async def lookup(uids):
+        return await pool.thread('auth', auth.get_users, [auth.UidIdentifier(uid) for uid in uids])
+
+    results = await pool.gather(lookup(uids) for uids in chunked(sorted(roles), GET_USERS_LIMIT))
+    changes, missing = {}, []
+    for result in results:
+        for user in result.users:
+            current = user.custom_claims or {}
+            if current.get('role') != roles[user.uid]:
+                changes[user.uid] = (current, desired_claims(current, roles[user.uid]))
+        missing.extend(identifier.uid for identifier in result.not_found)
+    return changes, missing
+
+
+async def push_claims(pool, changes):
+    """set_custom_user_claims en paralelo (tope 'auth' del pool); devuelve {uid: error}."""
+    async def push(uid, claims):
+        try:
+            await pool.thread('auth', auth.set_custom_user_claims, uid, claims)
+        except Exception as e:
+            return uid, e
+        return uid, None
+
+    results = await pool.gather(push(uid, desired) for uid, (_, desired) in changes.items())
+    return {uid: error for uid, error in results if error is not None}
+
+
+async def align(roles, apply):
+    pool = AsyncPool()
+    changes, missing = await diff_claims(pool, roles)
+    errors = await push_claims(pool, changes) if apply and changes else {}
+    return changes, missing, errors
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--service-account', help='Ruta al service account JSON')
+    common.add_argument('--show', type=int, default=20, help='Usuarios a mostrar (default 20)')
+
+    parser = argparse.ArgumentParser(description='Rol de users como custom claim de Auth')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('migrate', parents=[common], help='Alinea los claims de todos los usuarios')
+    sub.add_parser('verify', parents=[common], help='Solo reporta los claims desalineados')
+    sub.add_parser('sync', parents=[common], help='Igual que migrate, para cron (requiere migrate previo)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"CUSTOM CLAIMS DE ROL ({args.command.upper()})")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+    started = datetime.now(timezone.utc)
+
+    if args.command == 'sync':
+        watermark = read_watermark(db, WATERMARK_ID)
+        if watermark is None:
+            print("❌ No hay marca de agua: ejecuta primero 'migrate'")
+            sys.exit(1)
+        print(f"Última alineación: {watermark:%Y-%m-%d %H:%M:%S} UTC\n")
+
+    print("[1/3] Leyendo roles de todos los usuarios (proyección role)...")
+    roles = load_roles(db)
+    print(f"✅ {len(roles)} usuarios: "
+          + ', '.join(f'{role}: {n}' for role, n in Counter(roles.values()).most_common()) + "\n")
+
+    apply = args.command != 'verify'
+    print("[2/3] Comparando con Auth (get_users)" + (" y actualizando claims..." if apply else "..."))
+    changes, missing, errors = run(align(roles, apply))
+
+    transitions = Counter((current.get('role'), desired['role']) for current, desired in changes.values())
+    for (before, after), n in transitions.most_common():
+        print(f"  {before or '(sin claim)'} → {after}: {n}")
+    for uid, (current, desired) in list(changes.items())[:args.show]:
+        print(f"   - {uid}: {current.get('role') or '(sin claim)'} → {desired['role']}")
+    if len(changes) > args.show:
+        print(f"   ... y {len(changes) - args.show} más")
+    if missing:
+        print(f"  ⚠️  {len(missing)} usuarios de Firestore sin cuenta en Auth: "
+              f"{', '.join(missing[:args.show])}")
+    for uid, error in list(errors.items())[:20]:
+        print(f"  ❌ {uid}: {error}")
+    print()
+
+    print("[3/3] Resumen")
+    print(f"  Alineados: {len(roles) - len(changes) - len(missing)}")
+    if apply:
+        print(f"  Claims actualizados: {len(changes) - len(errors)}")
+        print(f"  Errores: {len(errors)}")
+    else:
+        print(f"  Desalineados: {len(changes)}")
+
+    if args.command == 'verify':
+        sys.exit(1 if changes else 0)
+    if errors:
+        print("⚠️  Hubo errores: la marca de agua no avanza")
+        sys.exit(1)
+    write_watermark(db, WATERMARK_ID, started)
+    print(f"  ✅ lastSyncAt = {started:%Y-%m-%d %H:%M:%S} UTC")
+    if changes:
+        print("\nℹ️  Los usuarios ven el claim nuevo al renovar su ID token (≤ 1 hora).")
+
+
+if __name__ == '__main__':
+    main()
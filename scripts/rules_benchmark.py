@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Costo de firestore.rules por operación, medido contra el emulador.
+
+Cada `get(/users/$(request.auth.uid))` de las reglas es una lectura
+facturada más en la request del cliente, y no sabíamos cuántas dispara
+cada operación de reservas, pagos u horarios. Este script:
+
+  1. Carga un archivo de reglas en el emulador de Firestore (default
+     firestore.rules) y siembra datos mínimos con la cuenta owner (que no
+     pasa por las reglas): un alumno, un admin, un horario y su contador.
+  2. Ejecuta operaciones representativas de la app como usuarios
+     autenticados (tokens de prueba sin firma, como los de
+     @firebase/rules-unit-testing), --iterations veces cada una.
+  3. Entre operación y operación lee el reporte de cobertura de reglas del
+     emulador (:ruleCoverage) y calcula por operación:
+       lecturas de reglas   evaluaciones de get()/exists() por request
+       evaluaciones         expresiones evaluadas por request
+       latencia             p50/p95 del lado cliente
+       denegadas            requests rechazadas (una regla que rompe la app)
+
+Con --output se guarda el resultado y con --baseline se compara contra una
+corrida anterior, para medir un cambio de reglas antes de desplegarlo.
+--role-claim agrega el rol como custom claim al token (ver role_claims.py).
+
+Requiere el emulador corriendo:
+  firebase emulators:start --only firestore
+
+Uso:
+  python scripts/rules_benchmark.py --output bench/actual.json
+  python scripts/rules_benchmark.py --rules firestore.rules.nuevo --role-claim \\
+      --baseline bench/actual.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+from google.api_core.exceptions import PermissionDenied
+from google.auth.credentials import AnonymousCredentials
+
+from firebase_common import LOCAL_TZ, fix_windows_encoding
+
+fix_windows_encoding()
+
+DEFAULT_EMULATOR_HOST = 'localhost:8080'
+DEFAULT_PROJECT = 'demo-ayutthaya'
+
+STUDENT = 'bench-student'
+ADMIN = 'bench-admin'
+SCHEDULE = 'BENCH1'
+
+RULE_READ_CALL = re.compile(r'(get|exists|getAfter|existsAfter)\s*\(')
+
+
+# ---------------------------------------------------------------------------
+# Emulador
+# ---------------------------------------------------------------------------
+
+def mock_id_token(project, uid, claims=None):
+    """ID token sin firma (alg none) que el emulador acepta como usuario autenticado."""
+    now = int(time.time())
+    payload = {
+        'iss': f'https://securetoken.google.com/{project}',
+        'aud': project,
+        'iat': now,
+        'exp': now + 3600,
+        'auth_time': now,
+        'sub': uid,
+        'user_id': uid,
+        'firebase': {'sign_in_provider': 'custom', 'identities': {}},
+        **(claims or {}),
+    }
+
+    def encode(part):
+        raw = json.dumps(part, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(payload)}."
+
+
+class UserCredentials(AnonymousCredentials):
+    """El cliente usa `id_token` como Bearer al hablar con el emulador."""
+
+    def __init__(self, id_token):
+        super().__init__()
+        self.id_token = id_token
+
+
+def emulator_request(host, method, path, body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(f'http://{host}{path}', data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        payload = response.read()
+    return json.loads(payload) if payload else None
+
+
+def load_rules(host, project, path):
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    emulator_request(host, 'PUT', f'/emulator/v1/projects/{project}:securityRules',
+                     {'rules': {'files': [{'name': os.path.basename(path), 'content': content}]}})
+    return content
+
+
+def clear_data(host, project):
+    emulator_request(host, 'DELETE', f'/emulator/v1/projects/{project}/databases/(default)/documents')
+
+
+def coverage_counts(host, project, source):
+    """
+    (lecturas de reglas, expresiones evaluadas) acumuladas según el reporte
+    de cobertura. Una llamada get(...) y las expresiones que la envuelven
+    (.data, ==) comparten posición de inicio: se cuenta una vez por posición.
+    """
+    report = emulator_request(host, 'GET', f'/emulator/v1/projects/{project}:ruleCoverage')
+    calls = {}
+    evaluations = 0
+    lines = source.splitlines(keepends=True)
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line))
+
+    stack = [report]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        position = node.get('sourcePosition')
+        if position is None or 'values' not in node:
+            continue
+        count = sum(int(v.get('count', 0)) for v in node['values'])
+        evaluations += count
+        if 'currentOffset' in position:
+            start = int(position['currentOffset'])
+        else:
+            start = line_starts[int(position.get('line', 1)) - 1] + int(position.get('column', 1)) - 1
+        if RULE_READ_CALL.match(source, start):
+            calls[start] = max(calls.get(start, 0), count)
+    return sum(calls.values()), evaluations
+
+
+# ---------------------------------------------------------------------------
+# Operaciones representativas de la app
+# ---------------------------------------------------------------------------
+
+def seed(owner, today):
+    """Datos mínimos (con la cuenta owner, sin reglas)."""
+    owner.collection('users').document(STUDENT).set(
+        {'email': 'alumno@bench.test', 'name': 'Alumno', 'role': 'student', 'membershipStatus': 'active'})
+    owner.collection('users').document(ADMIN).set(
+        {'email': 'admin@bench.test', 'name': 'Admin', 'role': 'admin'})
+    owner.collection('class_schedules').document(SCHEDULE).set(
+        {'time': '19:00', 'type': 'Muay Thai', 'instructor': 'Bench', 'capacity': 100000,
+         'daysOfWeek': [1, 2, 3, 4, 5, 6, 7], 'active': True})
+    owner.collection('class_schedules').document(SCHEDULE).collection('capacity_tracking') \
+        .document(today.strftime('%Y-%m-%d')).set({'currentBookings': 0, 'maxCapacity': 100000})
+
+
+def build_operations(firestore_module):
+    """Lista de (nombre, usuario, función(cliente, ctx))."""
+    transactional = firestore_module.transactional
+
+    def read_own_profile(db, ctx):
+        db.collection('users').document(STUDENT).get()
+
+    def list_schedules(db, ctx):
+        db.collection('class_schedules').where('active', '==', True).get()
+
+    def create_booking(db, ctx):
+        # Igual que BookingService: horario + contador + booking en una transacción
+        schedule_ref = db.collection('class_schedules').document(SCHEDULE)
+        capacity_ref = schedule_ref.collection('capacity_tracking').document(ctx['date_key'])
+        booking_ref = db.collection('bookings').document()
+
+        @transactional
+        def book(transaction):
+            schedule_ref.get(transaction=transaction)
+            current = (capacity_ref.get(transaction=transaction).to_dict() or {}).get('currentBookings', 0)
+            transaction.set(booking_ref, {'userId': STUDENT, 'scheduleId': SCHEDULE,
+                                          'classDate': ctx['today'], 'status': 'confirmed',
+                                          'userName': 'Alumno', 'scheduleTime': '19:00'})
+            transaction.set(capacity_ref, {'currentBookings': current + 1}, merge=True)
+
+        book(db.transaction())
+        ctx['bookings'].append(booking_ref.id)
+
+    def list_own_bookings(db, ctx):
+        (db.collection('bookings').where('userId', '==', STUDENT)
+         .where('classDate', '>=', ctx['today']).get())
+
+    def cancel_booking(db, ctx):
+        booking_id = ctx['bookings'].pop()
+        db.collection('bookings').document(booking_id).update({'status': 'cancelled'})
+
+    def create_payment(db, ctx):
+        _, ref = db.collection('payments').add({'userId': STUDENT, 'type': 'monthly',
+                                                'status': 'pending', 'amount': 30000})
+        ctx['payments'].append(ref.id)
+
+    def list_own_payments(db, ctx):
+        db.collection('payments').where('userId', '==', STUDENT).get()
+
+    def admin_read_student(db, ctx):
+        db.collection('users').document(STUDENT).get()
+
+    def admin_list_day_bookings(db, ctx):
+        db.collection('bookings').where('classDate', '==', ctx['today']).get()
+
+    def admin_list_pending_payments(db, ctx):
+        db.collection('payments').where('status', '==', 'pending').get()
+
+    def admin_approve_payment(db, ctx):
+        # Pago + membresía del alumno en un mismo batch, como la pantalla de aprobación
+        batch = db.batch()
+        batch.update(db.collection('payments').document(ctx['payments'].pop()), {'status': 'approved'})
+        batch.update(db.collection('users').document(STUDENT), {'membershipStatus': 'active'})
+        batch.commit()
+
+    def admin_update_schedule(db, ctx):
+        db.collection('class_schedules').document(SCHEDULE).update({'instructor': 'Bench'})
+
+    return [
+        ('alumno: leer perfil', STUDENT, read_own_profile),
+        ('alumno: listar horarios', STUDENT, list_schedules),
+        ('alumno: reservar (transacción)', STUDENT, create_booking),
+        ('alumno: listar sus reservas', STUDENT, list_own_bookings),
+        ('alumno: cancelar reserva', STUDENT, cancel_booking),
+        ('alumno: crear pago', STUDENT, create_payment),
+        ('alumno: listar sus pagos', STUDENT, list_own_payments),
+        ('admin: leer alumno', ADMIN, admin_read_student),
+        ('admin: reservas del día', ADMIN, admin_list_day_bookings),
+        ('admin: pagos pendientes', ADMIN, admin_list_pending_payments),
+        ('admin: aprobar pago', ADMIN, admin_approve_payment),
+        ('admin: editar horario', ADMIN, admin_update_schedule),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_benchmark(args, source):
+    from google.cloud import firestore as firestore_module
+
+    today = datetime.now(LOCAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    owner = firestore_module.Client(project=args.project)
+    seed(owner, today)
+
+    clients = {}
+    for uid, role in ((STUDENT, 'student'), (ADMIN, 'admin')):
+        claims = {'role': role} if args.role_claim else None
+        token = mock_id_token(args.project, uid, claims)
+        clients[uid] = firestore_module.Client(project=args.project, credentials=UserCredentials(token))
+
+    ctx = {'today': today, 'date_key': today.strftime('%Y-%m-%d'), 'bookings': [], 'payments': []}
+    results = []
+    for name, uid, operation in build_operations(firestore_module):
+        db = clients[uid]
+        # Las operaciones que consumen IDs (cancelar, aprobar) necesitan los
+        # de la operación que los crea; el calentamiento no los gasta
+        for _ in range(args.warmup):
+            if operation.__name__ not in ('cancel_booking', 'admin_approve_payment'):
+                try:
+                    operation(db, ctx)
+                except PermissionDenied:
+                    pass
+
+        reads_before, evals_before = coverage_counts(args.host, args.project, source)
+        latencies, denied = [], 0
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            try:
+                operation(db, ctx)
+            except PermissionDenied:
+                denied += 1
+            except IndexError:
+                break   # no quedan IDs creados por la operación anterior
+            latencies.append((time.perf_counter() - started) * 1000)
+        reads_after, evals_after = coverage_counts(args.host, args.project, source)
+
+        n = max(len(latencies), 1)
+        results.append({
+            'operation': name,
+            'user': uid,
+            'requests': len(latencies),
+            'ruleReadsPerOp': round((reads_after - reads_before) / n, 2),
+            'evaluationsPerOp': round((evals_after - evals_before) / n, 1),
+            'p50Ms': round(percentile(latencies, 0.5), 1) if latencies else None,
+            'p95Ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+            'meanMs': round(statistics.fmean(latencies), 1) if latencies else None,
+            'denied': denied,
+        })
+        print(f"  ✅ {name}")
+    return results
+
+
+def print_table(results, baseline=None):
+    previous = {r['operation']: r for r in (baseline or {}).get('operations', [])}
+    print(f"  {'Operación':<34} {'lect. reglas':>12} {'evaluac.':>9} {'p50 ms':>8} {'p95 ms':>8} {'deneg.':>7}")
+    for r in results:
+        reads = f"{r['ruleReadsPerOp']:.2f}"
+        if r['operation'] in previous:
+            delta = r['ruleReadsPerOp'] - previous[r['operation']]['ruleReadsPerOp']
+            reads += f" ({delta:+.2f})" if delta else ''
+        print(f"  {r['operation']:<34} {reads:>12} {r['evaluationsPerOp']:>9.1f} "
+              f"{r['p50Ms'] or 0:>8.1f} {r['p95Ms'] or 0:>8.1f} {r['denied']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Costo de las reglas por operación (emulador)')
+    parser.add_argument('--rules', default='firestore.rules', help='Archivo de reglas (default: %(default)s)')
+    parser.add_argument('--project', default=DEFAULT_PROJECT, help='Proyecto del emulador (default: %(default)s)')
+    parser.add_argument('--host', default=os.environ.get('FIRESTORE_EMULATOR_HOST', DEFAULT_EMULATOR_HOST),
+                        help='Host del emulador (default: FIRESTORE_EMULATOR_HOST o %(default)s)')
+    parser.add_argument('--iterations', type=int, default=20, help='Requests por operación (default 20)')
+    parser.add_argument('--warmup', type=int, default=2, help='Requests de calentamiento (default 2)')
+    parser.add_argument('--role-claim', action='store_true',
+                        help='Incluir el rol como custom claim en los tokens')
+    parser.add_argument('--output', help='Guardar el resultado en JSON')
+    parser.add_argument('--baseline', help='Comparar contra un resultado anterior (JSON de --output)')
+    args = parser.parse_args()
+
+    # El cliente de Firestore habla con el emulador solo si esta variable existe
+    os.environ['FIRESTORE_EMULATOR_HOST'] = args.host
+
+    print("=" * 60)
+    print("BENCHMARK DE REGLAS (EMULADOR)")
+    print("=" * 60 + "\n")
+
+    print(f"[1/3] Cargando {args.rules} en el emulador {args.host}...")
+    try:
+        source = load_rules(args.host, args.project, args.rules)
+        clear_data(args.host, args.project)
+    except OSError as e:
+        print(f"❌ No se pudo hablar con el emulador en {args.host}: {e}")
+        print("   Inícialo con: firebase emulators:start --only firestore")
+        sys.exit(1)
+    print("✅ Reglas cargadas y datos limpios\n")
+
+    print(f"[2/3] Ejecutando operaciones ({args.iterations} requests cada una)...")
+    results = run_benchmark(args, source)
+
+    print("\n[3/3] Resultado por operación")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"  (entre paréntesis: diferencia contra {args.baseline})")
+    print_table(results, baseline)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'rules': args.rules, 'roleClaim': args.role_claim,
+                       'iterations': args.iterations, 'createdAt': datetime.now().isoformat(),
+                       'operations': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Resultado guardado en {args.output}")
+
+    if any(r['denied'] for r in results):
+        print("\n⚠️  Hay operaciones denegadas: estas reglas rompen flujos de la app")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
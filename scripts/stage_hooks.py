@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Etapas "[n/m]" de los scripts, detectadas en un único lugar.
+
+Los scripts anuncian cada etapa con un print que empieza con "[1/4]",
+"[2/4]"... stage_profiler.py y firestore_metrics.py necesitan enterarse de
+cada cambio de etapa. Este módulo parchea builtins.print UNA sola vez y
+avisa a todos los suscriptores, así las dos herramientas pueden estar
+activas a la vez sin apilar parches ni discrepar sobre la etapa en curso.
+
+Uso:
+  import stage_hooks
+  stage_hooks.subscribe(lambda label: print_a_un_log(label))
+  stage_hooks.current_stage()      # '[2/4] Escribiendo...' o None
+"""
+
+import builtins
+import re
+import threading
+
+STAGE_PATTERN = re.compile(r'^\s*(\[\d+/\d+\].*)')
+
+# Largo máximo de la etiqueta de etapa que reciben los suscriptores
+MAX_LABEL = 80
+
+_lock = threading.Lock()
+_subscribers = []
+_original_print = None
+_current = None
+
+
+def stage_label(text):
+    """Etiqueta de etapa si `text` empieza con "[n/m]", o None."""
+    match = STAGE_PATTERN.match(text)
+    return match.group(1).strip()[:MAX_LABEL] if match else None
+
+
+def _print_with_stages(*args, **kwargs):
+    global _current
+    if args and isinstance(args[0], str):
+        label = stage_label(args[0])
+        if label:
+            with _lock:
+                _current = label
+                subscribers = list(_subscribers)
+            for callback in subscribers:
+                callback(label)
+    return _original_print(*args, **kwargs)
+
+
+def subscribe(callback):
+    """Llama `callback(etiqueta)` en cada etapa nueva; instala el parche de print la primera vez."""
+    global _original_print
+    with _lock:
+        if _original_print is None:
+            _original_print = builtins.print
+            builtins.print = _print_with_stages
+        _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    """Quita `callback`; sin suscriptores se restaura el print original."""
+    global _original_print, _current
+    with _lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+        if not _subscribers and _original_print is not None:
+            builtins.print = _original_print
+            _original_print = None
+            _current = None
+
+
+def current_stage():
+    return _current
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Perfil de CPU y memoria por etapa de un script ([1/4] ... [4/4]).
+
+Cuando un script como initialize_capacity_counters.py o
+delete_all_users_except_admin.py va lento no se sabe si el tiempo se va en
+esperas de red, conversión de timestamps o creación de dicts. Ejecutando
+el script a través de este módulo (o con `--profile` / `--profile=DIR` en
+los scripts que llaman a enable_from_argv() al inicio de su main()), cada
+etapa numerada queda envuelta en cProfile y tracemalloc:
+
+  DIR/NN-<etapa>.pstats      cProfile del hilo principal (snakeviz, pstats)
+  DIR/NN-<etapa>.collapsed   pilas muestreadas de todos los hilos cada 5 ms,
+                             formato "a;b;c N" para flamegraph.pl/speedscope
+                             (incluye las esperas de red de BulkWriter/gRPC)
+  DIR/NN-<etapa>.memory.txt  pico de memoria y los sitios que más asignaron
+  DIR/summary.json           tiempo, CPU y pico de memoria por etapa
+
+La etapa 00 es todo lo anterior al primer "[1/n]" (con el lanzador incluye
+imports; con --profile, lo que haya en main() antes de la primera etapa).
+
+Uso:
+  python scripts/initialize_capacity_counters.py --profile=profiles/capacity
+  python scripts/stage_profiler.py -o profiles/borrado \\
+      scripts/delete_all_users_except_admin.py --confirm
+"""
+
+import argparse
+import atexit
+import cProfile
+import json
+import os
+import re
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import stage_hooks
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 10
+
+_profiler = None
+
+
+def slugify(label):
+    slug = re.sub(r'[^0-9A-Za-z]+', '-', label.lower()).strip('-')
+    return slug[:40] or 'etapa'
+
+
+class StackSampler(threading.Thread):
+    """Muestrea las pilas de todos los hilos (formato collapsed de flamegraph)."""
+
+    def __init__(self):
+        super().__init__(name='stage-profiler-sampler', daemon=True)
+        self.samples = Counter()
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._halt.wait(SAMPLE_INTERVAL_SECONDS):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f'thread-{thread_id}'))
+                with self._lock:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def take(self):
+        """Devuelve y reinicia las muestras acumuladas."""
+        with self._lock:
+            samples, self.samples = self.samples, Counter()
+        return samples
+
+    def stop(self):
+        self._halt.set()
+
+
+class StageProfiler:
+    def __init__(self, directory):
+        self.directory = directory
+        self.stages = []
+        self.index = 0
+        self.label = '(inicio)'
+        self.sampler = StackSampler()
+        self._profile = None
+        self._started = None
+        self._cpu_started = None
+        self._snapshot = None
+        self._finished = False
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.sampler.start()
+        self._begin()
+
+    def _begin(self):
+        tracemalloc.reset_peak()
+        self._snapshot = tracemalloc.take_snapshot()
+        self.sampler.take()
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def _end(self):
+        self._profile.disable()
+        wall = time.perf_counter() - self._started
+        cpu = time.process_time() - self._cpu_started
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        samples = self.sampler.take()
+
+        base = os.path.join(self.directory, f'{self.index:02d}-{slugify(self.label)}')
+        self._profile.dump_stats(base + '.pstats')
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        self._write_memory(base + '.memory.txt', snapshot, peak)
+
+        self.stages.append({
+            'index': self.index,
+            'stage': self.label,
+            'wallSeconds': round(wall, 3),
+            'cpuSeconds': round(cpu, 3),
+            'peakMemoryMB': round(peak / 1024 / 1024, 2),
+            'samples': sum(samples.values()),
+            'files': os.path.basename(base) + '.*',
+        })
+
+    def _write_memory(self, path, snapshot, peak):
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, __file__)]
+        snapshot = snapshot.filter_traces(filters)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'Etapa: {self.label}\n')
+            f.write(f'Pico de memoria trazada: {peak / 1024 / 1024:.2f} MB\n\n')
+            f.write(f'Crecimiento neto por línea durante la etapa (top {TOP_ALLOCATIONS}):\n')
+            diff = snapshot.compare_to(self._snapshot.filter_traces(filters), 'lineno')
+            for stat in diff[:TOP_ALLOCATIONS]:
+                f.write(f'  {stat}\n')
+            f.write(f'\nMemoria viva al final, por pila (top {TOP_ALLOCATIONS}):\n')
+            for stat in snapshot.statistics('traceback')[:TOP_ALLOCATIONS]:
+                f.write(f'  {stat.size / 1024:.1f} KiB en {stat.count} bloques\n')
+                for line in stat.traceback.format(limit=TRACEMALLOC_FRAMES):
+                    f.write(f'    {line}\n')
+
+    def next_stage(self, label):
+        if self._finished:
+            return
+        self._end()
+        self.index += 1
+        self.label = label
+        self._begin()
+
+    def finish(self):
+        if self._finished:
+            return
+        self._end()
+        self._finished = True
+        self.sampler.stop()
+        tracemalloc.stop()
+        with open(os.path.join(self.directory, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump({'script': sys.argv[0], 'stages': self.stages}, f, indent=2, ensure_ascii=False)
+        sys.stderr.write(f"\n📈 Perfil por etapa en {self.directory}/\n")
+        for stage in self.stages:
+            sys.stderr.write(f"  {stage['index']:02d} {stage['stage'][:45]:<45} "
+                             f"{stage['wallSeconds']:>8.2f}s  CPU {stage['cpuSeconds']:>7.2f}s  "
+                             f"pico {stage['peakMemoryMB']:>7.1f} MB\n")
+
+
+def install(directory=None, script=None):
+    """Activa el perfil por etapa; los reportes se escriben al salir."""
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    if directory is None:
+        name = os.path.splitext(os.path.basename(script or sys.argv[0]))[0]
+        directory = os.path.join('profiles', f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+    _profiler = StageProfiler(directory)
+    stage_hooks.subscribe(_profiler.next_stage)
+    atexit.register(_profiler.finish)
+    _profiler.start()
+    return _profiler
+
+
+def enable_from_argv(argv=None):
+    """
+    Si el comando trae `--profile` o `--profile=DIR` lo quita de argv (para
+    que el parser del script no lo vea) y activa el perfil. El directorio
+    solo se acepta con '=': un `--profile` suelto nunca consume el
+    argumento siguiente (que puede ser la ruta al service account).
+    Se llama al inicio del main() del script, antes de leer argv.
+    """
+    argv = sys.argv if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg == '--profile':
+            del argv[i]
+            return install(None)
+        if arg.startswith('--profile='):
+            del argv[i]
+            return install(arg.split('=', 1)[1] or None)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perfil de CPU y memoria por etapa de un script')
+    parser.add_argument('-o', '--output', help='Directorio de reportes (default: profiles/<script>-<fecha>)')
+    parser.add_argument('script', help='Script a ejecutar')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Argumentos del script')
+    args = parser.parse_args()
+
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    install(args.output, args.script)
+    runpy.run_path(args.script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
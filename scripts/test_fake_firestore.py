@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de fake_firestore.py y de los helpers de firebase_common que lo usan.
+
+El fake sirve para probar scripts solo si se comporta como el cliente real:
+estas pruebas fijan el orden, los cursores, los filtros, las proyecciones,
+las precondiciones y los reintentos de transacciones.
+
+  python -m pytest scripts
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from firebase_admin import firestore
+from google.api_core import exceptions
+from google.cloud.firestore_v1.base_query import FieldFilter, Or
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from fake_firestore import FakeFirestore
+from firebase_common import bulk_writer, iter_docs, iter_pages
+
+T0 = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def ids(docs):
+    return [doc.id for doc in docs]
+
+
+@pytest.fixture
+def db():
+    db = FakeFirestore()
+    db.load({
+        'users/u1': {'name': 'Ana', 'age': 30, 'role': 'student', 'joined': T0},
+        'users/u2': {'name': 'Beto', 'age': 25, 'role': 'admin', 'joined': T0 + timedelta(days=1)},
+        'users/u3': {'name': 'Caro', 'age': 30, 'role': 'student', 'joined': T0 + timedelta(days=2)},
+        'users/u4': {'name': 'Dani', 'role': 'student'},
+    })
+    return db
+
+
+# --- Queries ----------------------------------------------------------------
+
+def test_default_order_is_document_id(db):
+    assert ids(db.collection('users').stream()) == ['u1', 'u2', 'u3', 'u4']
+
+
+def test_order_by_skips_docs_without_field_and_breaks_ties_by_id(db):
+    # Como en Firestore, el desempate por __name__ sigue la dirección del último order_by
+    assert ids(db.collection('users').order_by('age').stream()) == ['u2', 'u1', 'u3']
+    query = db.collection('users').order_by('age', direction='DESCENDING')
+    assert ids(query.stream()) == ['u3', 'u1', 'u2']
+
+
+def test_cursors_by_snapshot_and_by_values(db):
+    query = db.collection('users').order_by('age')
+    first = query.limit(1).get()[0]
+    assert ids(query.start_after(first).stream()) == ['u1', 'u3']
+    assert ids(query.start_at({'age': 30}).stream()) == ['u1', 'u3']
+    assert ids(query.end_before({'age': 30}).stream()) == ['u2']
+
+
+def test_cursor_by_document_id(db):
+    query = db.collection('users').order_by(FieldPath.document_id())
+    assert ids(query.start_after({'__name__': 'u2'}).stream()) == ['u3', 'u4']
+
+
+def test_in_and_range_filters(db):
+    users = db.collection('users')
+    assert ids(users.where('name', 'in', ['Ana', 'Caro', 'Zoe']).stream()) == ['u1', 'u3']
+    assert ids(users.where('role', 'not-in', ['admin']).stream()) == ['u1', 'u3', 'u4']
+    assert ids(users.where('joined', '>', T0).where('joined', '<=', T0 + timedelta(days=2))
+               .stream()) == ['u2', 'u3']
+    assert ids(users.where(filter=Or([FieldFilter('age', '==', 25),
+                                      FieldFilter('name', '==', 'Dani')])).stream()) == ['u2', 'u4']
+
+
+def test_select_projects_fields_and_empty_select_keeps_only_id(db):
+    doc = db.collection('users').select(['name']).get()[0]
+    assert doc.to_dict() == {'name': 'Ana'}
+    assert db.collection('users').select([]).get()[0].to_dict() == {}
+
+
+def test_count_and_limit_to_last(db):
+    assert db.collection('users').where('role', '==', 'student').count().get()[0][0].value == 3
+    assert ids(db.collection('users').order_by('age').limit_to_last(2).get()) == ['u1', 'u3']
+
+
+def test_collection_group_and_subcollections(db):
+    db.load({'users/u1/usage/2026-03': {'total': 2}, 'users/u2/usage/2026-03': {'total': 1}})
+    docs = db.collection_group('usage').stream()
+    assert [doc.reference.path for doc in docs] == ['users/u1/usage/2026-03', 'users/u2/usage/2026-03']
+    assert [c.id for c in db.document('users/u1').collections()] == ['usage']
+
+
+# --- Escrituras ---------------------------------------------------------------
+
+def test_transforms_and_merge(db):
+    ref = db.document('users/u1')
+    ref.update({'age': firestore.Increment(1), 'tags': firestore.ArrayUnion(['a', 'b']),
+                'updatedAt': firestore.SERVER_TIMESTAMP})
+    ref.set({'prefs': {'lang': 'es'}}, merge=True)
+    data = ref.get().to_dict()
+    assert data['age'] == 31 and data['tags'] == ['a', 'b'] and data['prefs'] == {'lang': 'es'}
+    assert data['name'] == 'Ana' and data['updatedAt'].tzinfo is not None
+
+
+def test_update_missing_doc_and_create_existing_doc_fail(db):
+    with pytest.raises(exceptions.NotFound):
+        db.document('users/nope').update({'age': 1})
+    with pytest.raises(exceptions.AlreadyExists):
+        db.document('users/u1').create({'name': 'otra'})
+
+
+def test_batch_is_atomic_and_checks_update_time(db):
+    snapshot = db.document('users/u1').get()
+    db.document('users/u1').update({'age': 31})
+    batch = db.batch()
+    batch.set(db.document('users/u9'), {'name': 'Nuevo'})
+    batch.update(snapshot.reference, {'age': 40},
+                 option=db.write_option(last_update_time=snapshot.update_time))
+    with pytest.raises(exceptions.FailedPrecondition):
+        batch.commit()
+    assert 'users/u9' not in db.dump()
+    assert db.document('users/u1').get().get('age') == 31
+
+
+def test_batch_write_limit(db):
+    batch = db.batch()
+    for i in range(501):
+        batch.set(db.document(f'bulk/{i}'), {'i': i})
+    with pytest.raises(exceptions.InvalidArgument):
+        batch.commit()
+
+
+# --- Transacciones --------------------------------------------------------------
+
+def test_transaction_retries_on_aborted(db):
+    attempts = []
+
+    @firestore.transactional
+    def bump(transaction, ref):
+        age = ref.get(transaction=transaction).get('age')
+        attempts.append(age)
+        if len(attempts) == 1:
+            ref.update({'age': 50})   # escritura concurrente entre lectura y commit
+        transaction.update(ref, {'age': age + 1})
+
+    bump(db.transaction(), db.document('users/u1'))
+    assert attempts == [30, 50]
+    assert db.document('users/u1').get().get('age') == 51
+
+
+def test_transaction_gives_up_after_max_attempts(db):
+    @firestore.transactional
+    def always_contended(transaction, ref):
+        ref.get(transaction=transaction)
+        ref.update({'age': firestore.Increment(1)})
+        transaction.update(ref, {'role': 'x'})
+
+    with pytest.raises(ValueError):
+        always_contended(db.transaction(max_attempts=3), db.document('users/u1'))
+    assert db.document('users/u1').get().get('role') == 'student'
+
+
+def test_transaction_rejects_reads_after_writes(db):
+    transaction = db.transaction()
+    transaction.update(db.document('users/u1'), {'age': 1})
+    with pytest.raises(ValueError):
+        transaction.get(db.document('users/u2'))
+
+
+# --- firebase_common --------------------------------------------------------------
+
+def test_iter_pages_splits_and_resumes(db):
+    pages = list(iter_pages(db.collection('users'), page_size=3))
+    assert [ids(page) for page in pages] == [['u1', 'u2', 'u3'], ['u4']]
+    assert ids(iter_docs(db.collection('users'), page_size=2, start_after_id='u2')) == ['u3', 'u4']
+    assert list(iter_pages(db.collection('empty'), page_size=2)) == []
+
+
+def test_iter_pages_exact_multiple_of_page_size(db):
+    pages = list(iter_pages(db.collection('users'), page_size=2))
+    assert [ids(page) for page in pages] == [['u1', 'u2'], ['u3', 'u4']]
+
+
+def test_bulk_writer_retries_transient_errors(db):
+    db.inject_error('users/u1', exceptions.Aborted('contention'), times=2)
+    writer = bulk_writer(db)
+    writer.update(db.document('users/u1'), {'age': 99})
+    writer.close()
+    assert writer.failures == []
+    assert db.document('users/u1').get().get('age') == 99
+
+
+def test_bulk_writer_collects_definitive_failures(db):
+    writer = bulk_writer(db)
+    writer.update(db.document('users/nope'), {'age': 1})
+    writer.set(db.document('users/u1'), {'name': 'Ana 2'})
+    writer.close()
+    assert [f.operation.reference.path for f in writer.failures] == ['users/nope']
+    assert db.document('users/u1').get().get('name') == 'Ana 2'
+
+
+def test_stats_count_reads_writes_and_deletes(db):
+    db.document('users/u1').get()
+    db.document('users/u2').delete()
+    db.document('users/u5').set({'name': 'Eva'})
+    assert (db.stats['reads'], db.stats['writes'], db.stats['deletes']) == (1, 1, 1)
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Scripts de mutación de punta a punta sobre FakeFirestore (main() con argv).
+
+  python -m pytest scripts
+"""
+
+import argparse
+import asyncio
+import csv
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions
+from firebase_admin import messaging
+from google.cloud import firestore as firestore_module
+
+import admission_service
+import expire_memberships
+import export_collection
+import fcm_topics
+import mutation_plan
+import referential_check
+import role_claims
+import usage_counters
+from fake_firestore import FakeFirestore, use_fake_firestore
+from firebase_common import LOCAL_TZ
+
+NOW = datetime.now(timezone.utc)
+MARCH = datetime(2026, 3, 10, 12, tzinfo=timezone.utc)
+
+
+def run_main(monkeypatch, db, module, *argv):
+    """Corre module.main() con `argv` contra `db`; devuelve el código de salida."""
+    monkeypatch.setattr(sys, 'argv', [module.__file__, *argv])
+    with use_fake_firestore(db):
+        try:
+            module.main()
+        except SystemExit as e:
+            return e.code or 0
+    return 0
+
+
+@pytest.fixture
+def members():
+    db = FakeFirestore()
+    db.load({
+        'users/vencido': {'email': 'a@x.cl', 'membershipStatus': 'active', 'role': 'student',
+                          'expirationDate': NOW - timedelta(days=1), 'fcmToken': 'tok-a'},
+        'users/sin_token': {'email': 'b@x.cl', 'membershipStatus': 'active', 'role': 'student',
+                            'expirationDate': NOW - timedelta(days=3)},
+        'users/vigente': {'email': 'c@x.cl', 'membershipStatus': 'active', 'role': 'student',
+                          'expirationDate': NOW + timedelta(days=10), 'fcmToken': 'tok-c'},
+        'users/admin': {'email': 'd@x.cl', 'membershipStatus': 'active', 'role': 'admin',
+                        'expirationDate': NOW - timedelta(days=1)},
+    })
+    return db
+
+
+def test_expire_memberships_dry_run_writes_nothing(monkeypatch, members):
+    before = members.dump()
+    assert run_main(monkeypatch, members, expire_memberships) == 0
+    assert members.dump() == before
+
+
+def test_expire_memberships_apply(monkeypatch, members):
+    assert run_main(monkeypatch, members, expire_memberships, '--apply', '--page-size', '1') == 0
+    status = {doc.id: doc.get('membershipStatus') for doc in members.collection('users').stream()}
+    assert status == {'admin': 'active', 'sin_token': 'expired', 'vencido': 'expired', 'vigente': 'active'}
+    notifications = [doc.to_dict() for doc in members.collection('notifications').stream()]
+    assert [(n['userId'], n['sent']) for n in notifications] == [('vencido', False)]
+
+
+def test_expire_memberships_reports_failures(monkeypatch, members):
+    members.inject_error('users/vencido', exceptions.PermissionDenied('denied'))
+    assert run_main(monkeypatch, members, expire_memberships, '--apply', '--no-notify') == 1
+    assert members.document('users/sin_token').get().get('membershipStatus') == 'expired'
+
+
+def build_rename_plan(db, plan):
+    for doc in plan.read_docs(db.collection('items').get()):
+        plan.update(doc, {'name': doc.get('name').upper()})
+    plan.create(db.collection('items').document('nuevo'), {'name': 'NUEVO'})
+
+
+@pytest.mark.parametrize('atomic', [False, True])
+def test_mutation_plan_applies_what_was_planned(tmp_path, atomic):
+    db = FakeFirestore()
+    db.load({'items/a': {'name': 'uno'}, 'items/b': {'name': 'dos'}})
+    args = argparse.Namespace(service_account=None, plan=str(tmp_path / 'plan.json'), apply=False)
+    with use_fake_firestore(db):
+        mutation_plan.run_plan_workflow(args, 'prueba', build_rename_plan, atomic)
+        assert db.document('items/a').get().get('name') == 'uno'
+        args.apply = True
+        mutation_plan.run_plan_workflow(args, 'prueba', build_rename_plan, atomic)
+    assert {path: data['name'] for path, data in db.dump().items()} == {
+        'items/a': 'UNO', 'items/b': 'DOS', 'items/nuevo': 'NUEVO'}
+
+
+@pytest.mark.parametrize('atomic', [False, True])
+def test_mutation_plan_skips_docs_changed_since_plan(tmp_path, atomic):
+    db = FakeFirestore()
+    db.load({'items/a': {'name': 'uno'}, 'items/b': {'name': 'dos'}})
+    args = argparse.Namespace(service_account=None, plan=str(tmp_path / 'plan.json'), apply=False)
+    with use_fake_firestore(db):
+        mutation_plan.run_plan_workflow(args, 'prueba', build_rename_plan, atomic)
+        db.document('items/b').update({'name': 'editado'})
+        args.apply = True
+        with pytest.raises(SystemExit):
+            mutation_plan.run_plan_workflow(args, 'prueba', build_rename_plan, atomic)
+    names = {path: data['name'] for path, data in db.dump().items()}
+    assert names['items/b'] == 'editado'
+    if atomic:
+        # Todo o nada: ni la otra actualización ni el create
+        assert names == {'items/a': 'uno', 'items/b': 'editado'}
+    else:
+        assert names == {'items/a': 'UNO', 'items/b': 'editado', 'items/nuevo': 'NUEVO'}
+
+
+def test_referential_check_fix_deletes_orphans_and_refreshes_usage(monkeypatch):
+    db = FakeFirestore()
+    db.load({
+        'users/u1': {'email': 'a@x.cl'},
+        'bookings/b1': {'userId': 'u1', 'classDate': MARCH, 'status': 'confirmed'},
+        'bookings/b2': {'userId': 'fantasma', 'classDate': MARCH, 'status': 'confirmed'},
+        'bookings/b3': {'classDate': MARCH, 'status': 'confirmed'},
+    })
+    usage_counters.rebuild(db)
+    assert db.document('users/fantasma/usage/2026-03').get().exists
+
+    assert run_main(monkeypatch, db, referential_check, '--only', 'bookings.userId', '--fix') == 0
+    bookings = sorted(path for path in db.dump() if path.startswith('bookings/'))
+    assert bookings == ['bookings/b1', 'bookings/b3']   # sin userId: solo se reporta
+    assert not db.document('users/fantasma/usage/2026-03').get().exists
+    assert db.document('users/u1/usage/2026-03').get().get('total') == 1
+
+
+def test_export_collection_csv_uses_union_of_fields(monkeypatch, tmp_path):
+    db = FakeFirestore()
+    db.load({'items/a': {'name': 'uno'}, 'items/b': {'name': 'dos', 'price': 10},
+             'items/c': {'tags': ['x'], 'price': 5}})
+    output = tmp_path / 'items.csv'
+    assert run_main(monkeypatch, db, export_collection, 'items', '-o', str(output),
+                    '--format', 'csv', '--partitions', '2', '--workers', '2') == 0
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = sorted(csv.DictReader(f), key=lambda r: r['__id__'])
+    assert list(rows[0]) == ['__id__', 'name', 'price', 'tags']
+    assert [(r['__id__'], r['name'], r['price'], r['tags']) for r in rows] == [
+        ('a', 'uno', '', ''), ('b', 'dos', '10', ''), ('c', '', '5', '["x"]')]
+    assert list(tmp_path.iterdir()) == [output]   # el temporal no queda
+
+
+def test_export_collection_parquet_widens_types_and_keeps_late_fields(monkeypatch, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    monkeypatch.setattr(export_collection, 'PARQUET_ROW_GROUP', 2)
+    db = FakeFirestore()
+    db.load({'items/a': {'qty': 1, 'flag': True, 'at': MARCH, 'mixed': 3},
+             'items/b': {'qty': 2, 'flag': False, 'at': MARCH, 'mixed': 'tres'},
+             'items/c': {'qty': 12.9, 'flag': 'si', 'at': None, 'mixed': {'n': 3}, 'late': 'x'}})
+    output = tmp_path / 'items.parquet'
+    assert run_main(monkeypatch, db, export_collection, 'items', '-o', str(output),
+                    '--format', 'parquet', '--partitions', '1', '--workers', '1') == 0
+    table = pq.read_table(output)
+    assert table.column_names == ['__id__', 'at', 'flag', 'late', 'mixed', 'qty']
+    assert str(table.schema.field('qty').type) == 'double'
+    assert str(table.schema.field('at').type) == 'timestamp[us, tz=UTC]'
+    rows = sorted(table.to_pylist(), key=lambda r: r['__id__'])
+    assert [r['qty'] for r in rows] == [1.0, 2.0, 12.9]
+    assert [r['flag'] for r in rows] == ['true', 'false', 'si']
+    assert [r['mixed'] for r in rows] == ['3', 'tres', '{"n": 3}']
+    assert [r['late'] for r in rows] == [None, None, 'x']
+    assert rows[0]['at'] == MARCH and rows[2]['at'] is None
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_export_collection_fails_instead_of_hanging_when_sink_fails(monkeypatch, tmp_path):
+    def broken_write(self, rows):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(export_collection, 'ROW_BATCH', 1)
+    monkeypatch.setattr(export_collection.NdjsonSink, 'write', broken_write)
+    db = FakeFirestore()
+    db.load({f'items/{i:03}': {'i': i} for i in range(50)})   # más lotes que la cola acotada
+    with pytest.raises(OSError, match='No space left'):
+        run_main(monkeypatch, db, export_collection, 'items', '-o', str(tmp_path / 'items.ndjson'),
+                 '--partitions', '1', '--workers', '1')
+
+
+class FakeTopics:
+    """Registro de suscripciones FCM en memoria (reemplaza subscribe/unsubscribe_from_topic)."""
+
+    def __init__(self, subscribed=(), failing=()):
+        self.subscribed = set(subscribed)    # (token, topic)
+        self.failing = set(failing)          # tokens cuya desuscripción falla
+
+    def _call(self, tokens, topic, subscribe):
+        results = []
+        for token in tokens:
+            if not subscribe and token in self.failing:
+                results.append({'error': 'INTERNAL'})
+                continue
+            if subscribe:
+                self.subscribed.add((token, topic))
+            else:
+                self.subscribed.discard((token, topic))
+            results.append({})
+        return messaging.TopicManagementResponse({'results': results})
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(messaging, 'subscribe_to_topic', lambda t, topic: self._call(t, topic, True))
+        monkeypatch.setattr(messaging, 'unsubscribe_from_topic', lambda t, topic: self._call(t, topic, False))
+
+
+def fcm_user(token, registered_token, topics, role='admin'):
+    return {'role': role, 'membershipStatus': 'active', 'fcmToken': token,
+            'fcmTopicsToken': registered_token, 'fcmTopics': topics}
+
+
+def test_fcm_topics_unsubscribes_replaced_and_cleared_tokens(monkeypatch):
+    topics = FakeTopics({('old-a', 'admins'), ('old-b', 'admins'), ('old-b', 'schedule_s1')})
+    topics.install(monkeypatch)
+    db = FakeFirestore()
+    db.load({'users/a': fcm_user('new-a', 'old-a', ['admins']),                      # cambió de equipo
+             'users/b': fcm_user(None, 'old-b', ['admins', 'schedule_s1'])})         # logout
+    assert fcm_topics.sync(db, apply_changes=True) == 0
+    assert topics.subscribed == {('new-a', 'admins')}
+    assert db.document('users/a').get().get('fcmTopicsToken') == 'new-a'
+    assert db.document('users/b').get().to_dict()['fcmTopics'] == []
+    assert db.document('users/b').get().get('fcmTopicsToken') is None
+
+
+def test_fcm_topics_keeps_registry_when_old_token_unsubscribe_fails(monkeypatch):
+    topics = FakeTopics({('old-a', 'admins')}, failing={'old-a'})
+    topics.install(monkeypatch)
+    db = FakeFirestore()
+    db.load({'users/a': fcm_user('new-a', 'old-a', ['admins'], role='student')})   # admin degradado
+    fcm_topics.sync(db, apply_changes=True)
+    assert db.document('users/a').get().get('fcmTopicsToken') == 'old-a'          # se reintenta
+
+    topics.failing.clear()
+    assert fcm_topics.sync(db, apply_changes=True) == 0
+    assert topics.subscribed == {('new-a', 'active_members')}
+    assert db.document('users/a').get().to_dict()['fcmTopics'] == ['active_members']
+
+
+class FakeAuth:
+    """custom claims de Auth en memoria (reemplaza get_users / set_custom_user_claims)."""
+
+    def __init__(self, claims):
+        self.claims = claims     # uid -> custom claims
+
+    def get_users(self, identifiers):
+        found = [SimpleNamespace(uid=i.uid, custom_claims=self.claims[i.uid])
+                 for i in identifiers if i.uid in self.claims]
+        return SimpleNamespace(users=found, not_found=[i for i in identifiers if i.uid not in self.claims])
+
+    def set_custom_user_claims(self, uid, claims):
+        self.claims[uid] = claims
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(role_claims.auth, 'get_users', self.get_users)
+        monkeypatch.setattr(role_claims.auth, 'set_custom_user_claims', self.set_custom_user_claims)
+
+
+def test_role_claims_sync_sees_role_edits_without_updated_at(monkeypatch):
+    fake_auth = FakeAuth({'jefe': {}, 'ana': {'plan': 'pro'}})
+    fake_auth.install(monkeypatch)
+    db = FakeFirestore()
+    db.load({'users/jefe': {'role': 'admin', 'updatedAt': MARCH}, 'users/ana': {}})
+    assert run_main(monkeypatch, db, role_claims, 'migrate') == 0
+    assert fake_auth.claims == {'jefe': {'role': 'admin'}, 'ana': {'plan': 'pro', 'role': 'student'}}
+
+    # Degradado a mano en la consola: updatedAt queda igual
+    db.document('users/jefe').update({'role': 'student'})
+    assert run_main(monkeypatch, db, role_claims, 'sync') == 0
+    assert fake_auth.claims['jefe'] == {'role': 'student'}
+
+
+def test_admission_service_caches_unavailable_and_evicts_idle_classes():
+    db = FakeFirestore()
+    db.load({'class_schedules/s1': {'capacity': 1, 'time': '19:00', 'type': 'muay thai'}})
+    day = datetime(2026, 3, 10, tzinfo=LOCAL_TZ)
+
+    async def scenario():
+        service = admission_service.AdmissionService(db, firestore_module, batch_ms=1, idle_ttl=0.05)
+        results = [await service.submit(user, schedule, day)
+                   for user, schedule in [('u1', 's1'), ('u2', 's1'), ('u1', 'nope'), ('u2', 'nope')]]
+        busy = service.stats()
+        await asyncio.sleep(0.2)
+        return results, busy, service.stats()
+
+    results, busy, idle = asyncio.run(scenario())
+    assert [r['status'] for r in results] == ['booked', 'full', 'unavailable', 'unavailable']
+    assert busy['batches'] == 2 and busy['fastRejected'] == 2 and busy['occurrences'] == 2
+    assert idle['occurrences'] == 0 and idle['evicted'] == 2
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas de stage_hooks.py (etapas "[n/m]" compartidas por stage_profiler y
+firestore_metrics).
+
+  python -m pytest scripts
+"""
+
+import builtins
+
+import stage_hooks
+
+
+def test_one_print_patch_feeds_every_subscriber(capsys):
+    original = builtins.print
+    seen_a, seen_b = [], []
+    stage_hooks.subscribe(seen_a.append)
+    patched = builtins.print
+    stage_hooks.subscribe(seen_b.append)
+    try:
+        assert builtins.print is patched          # el segundo no apila otro parche
+        print("[1/2] Leyendo users...")
+        print("  detalle [3/4] no es etapa")
+        print("[2/2] Escribiendo")
+        assert seen_a == seen_b == ['[1/2] Leyendo users...', '[2/2] Escribiendo']
+        assert stage_hooks.current_stage() == '[2/2] Escribiendo'
+    finally:
+        stage_hooks.unsubscribe(seen_a.append)
+        stage_hooks.unsubscribe(seen_b.append)
+    assert builtins.print is original
+    assert capsys.readouterr().out.count('\n') == 3
+
+
+def test_stage_label():
+    assert stage_hooks.stage_label('  [3/10] Etapa') == '[3/10] Etapa'
+    assert stage_hooks.stage_label('Sin etapa') is None
+    assert len(stage_hooks.stage_label('[1/1] ' + 'x' * 200)) == stage_hooks.MAX_LABEL
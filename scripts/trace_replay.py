@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Captura de la traza real de tráfico y su reproducción en el emulador.
+
+Las cargas sintéticas (booking_rush.py, rules_benchmark.py) no tienen la
+forma del tráfico real: ráfagas de reservas el lunes en la tarde, subidas
+de comprobantes a fin de mes. Este script tiene dos pasos:
+
+  capture  Deriva de los timestamps de producción una traza de operaciones
+           anonimizada (NDJSON):
+             bookings.createdAt        -> book
+             bookings.cancelledAt      -> cancel
+             bookings.updatedAt        -> attend (solo status attended)
+             payments.createdAt        -> payment_upload
+             payments.reviewedAt       -> payment_review
+             notifications.createdAt   -> notification
+           Usuarios, horarios, reservas y pagos se reemplazan por alias
+           (u1, s1, b1, p1) en orden de aparición; no se guardan nombres,
+           montos, tokens ni IDs. Cada evento lleva solo su instante
+           relativo al inicio de la ventana (t, en segundos) y, en las
+           reservas, el día de la clase relativo a ese inicio.
+
+  replay   Reproduce la traza contra el emulador respetando los tiempos
+           entre llegadas originales, comprimidos por --speed (1x-100x).
+           Cada alumno es un cliente autenticado con su propio token y las
+           reservas/cancelaciones usan la transacción de la app
+           (booking_rush.book_class / cancel_booking). Reporta por
+           operación resultados y latencias, el retraso del despachador
+           (si el emulador no da abasto, crece) y verifica el cupo de cada
+           clase tocada.
+
+Con --offset-hours/--duration-hours se reproduce solo un tramo (p.ej. el
+lunes de 18:00 a 21:00). --fake reproduce en memoria sobre FakeFirestore.
+
+Uso:
+  python scripts/trace_replay.py capture --days 28 --output traza.ndjson.gz
+  firebase emulators:start --only firestore
+  python scripts/trace_replay.py replay traza.ndjson.gz --speed 20
+  python scripts/trace_replay.py replay traza.ndjson.gz --speed 100 --offset-hours 162 --duration-hours 6
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from google.api_core.exceptions import PermissionDenied
+
+from booking_rush import RushStats, book_class, cancel_booking, verify
+from firebase_common import LOCAL_TZ, fix_windows_encoding, init_firestore, local_date
+from rules_benchmark import (DEFAULT_EMULATOR_HOST, DEFAULT_PROJECT, UserCredentials, clear_data,
+                             load_rules, mock_id_token, percentile)
+
+fix_windows_encoding()
+
+TRACE_FORMAT = 'ayutthaya-trace/1'
+
+# (colección, campo de tiempo, operación)
+SIGNALS = [
+    ('bookings', 'createdAt', 'book'),
+    ('bookings', 'cancelledAt', 'cancel'),
+    ('bookings', 'updatedAt', 'attend'),
+    ('payments', 'createdAt', 'payment_upload'),
+    # Los pagos no llevan updatedAt: la revisión del admin deja reviewedAt
+    ('payments', 'reviewedAt', 'payment_review'),
+    ('notifications', 'createdAt', 'notification'),
+]
+
+# Campos leídos por colección (proyección)
+FIELDS = {
+    'bookings': ['userId', 'scheduleId', 'classDate', 'status', 'createdAt', 'cancelledAt', 'updatedAt'],
+    'payments': ['userId', 'type', 'status', 'createdAt', 'reviewedAt'],
+    'notifications': ['userId', 'createdAt'],
+}
+
+# Prefijo del alias de cada tipo de identificador
+ALIAS_PREFIX = {'user': 'u', 'schedule': 's', 'booking': 'b', 'payment': 'p'}
+
+ADMIN = 'replay-admin'
+SPEED_RANGE = (1, 100)
+
+
+# ============================================
+# Captura
+# ============================================
+
+def signal_events(db, collection, field, op, since, until):
+    """Eventos crudos (con IDs reales) de una señal dentro de la ventana."""
+    query = (db.collection(collection)
+             .where(field, '>=', since).where(field, '<', until)
+             .select(FIELDS[collection]))
+    for doc in query.stream():
+        data = doc.to_dict() or {}
+        event = {'at': data[field], 'op': op, 'user': data.get('userId')}
+        if collection == 'bookings':
+            if op == 'attend' and data.get('status') != 'attended':
+                continue
+            if not data.get('classDate') or not data.get('scheduleId'):
+                continue
+            event.update(booking=doc.id, schedule=data['scheduleId'], classDate=data['classDate'])
+        elif collection == 'payments':
+            event.update(payment=doc.id, kind=data.get('type'))
+            if op == 'payment_review':
+                event['result'] = data.get('status')
+        yield event
+
+
+def anonymise(raw_events, since):
+    """Ordena los eventos y reemplaza IDs y fechas absolutas por alias y offsets."""
+    aliases = {kind: {} for kind in ALIAS_PREFIX}
+
+    def alias(kind, value):
+        if value is None:
+            return None
+        table = aliases[kind]
+        if value not in table:
+            table[value] = f'{ALIAS_PREFIX[kind]}{len(table) + 1}'
+        return table[value]
+
+    start_day = local_date(since)
+    events = []
+    for raw in sorted(raw_events, key=lambda e: e['at']):
+        event = {'t': round((raw['at'] - since).total_seconds(), 3), 'op': raw['op'],
+                 'user': alias('user', raw['user'])}
+        if 'booking' in raw:
+            event.update(ref=alias('booking', raw['booking']), schedule=alias('schedule', raw['schedule']),
+                         classDay=(local_date(raw['classDate']) - start_day).days)
+        if 'payment' in raw:
+            event.update(ref=alias('payment', raw['payment']), kind=raw['kind'])
+            if 'result' in raw:
+                event['result'] = raw['result']
+        events.append(event)
+    return events, aliases
+
+
+def capture(db, since, until):
+    """(cabecera, eventos) de la ventana [since, until)."""
+    raw = []
+    for collection, field, op in SIGNALS:
+        before = len(raw)
+        raw.extend(signal_events(db, collection, field, op, since, until))
+        print(f"  ✅ {collection}.{field} → {op}: {len(raw) - before}")
+    events, aliases = anonymise(raw, since)
+
+    # El cupo de cada horario sí se conserva: es lo que se quiere medir
+    schedule_refs = [db.collection('class_schedules').document(real) for real in aliases['schedule']]
+    capacities = {}
+    for doc in db.get_all(schedule_refs) if schedule_refs else []:
+        capacity = (doc.to_dict() or {}).get('capacity', 30) if doc.exists else 30
+        capacities[aliases['schedule'][doc.id]] = capacity
+
+    header = {
+        'format': TRACE_FORMAT,
+        'start': since.astimezone(LOCAL_TZ).isoformat(),
+        'duration': (until - since).total_seconds(),
+        'events': len(events),
+        'counts': dict(Counter(e['op'] for e in events)),
+        'users': len(aliases['user']),
+        'schedules': capacities,
+    }
+    return header, events
+
+
+def open_trace(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def write_trace(path, header, events):
+    with open_trace(path, 'w') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+def read_trace(path):
+    with open_trace(path, 'r') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != TRACE_FORMAT:
+            raise ValueError(f"{path} no es una traza {TRACE_FORMAT}")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def run_capture(args):
+    db = init_firestore(args.service_account)
+    if args.since:
+        since = datetime.strptime(args.since, '%Y-%m-%d').replace(tzinfo=LOCAL_TZ)
+        until = (datetime.strptime(args.until, '%Y-%m-%d').replace(tzinfo=LOCAL_TZ) if args.until
+                 else since + timedelta(days=args.days))
+    else:
+        until = datetime.now(LOCAL_TZ)
+        since = until - timedelta(days=args.days)
+
+    print(f"[1/2] Leyendo timestamps {since:%Y-%m-%d %H:%M} → {until:%Y-%m-%d %H:%M}...")
+    header, events = capture(db, since, until)
+
+    print(f"\n[2/2] Guardando traza anonimizada en {args.output}...")
+    write_trace(args.output, header, events)
+    print(f"✅ {header['events']} eventos, {header['users']} usuarios, {len(header['schedules'])} horarios")
+    for op, n in sorted(header['counts'].items()):
+        print(f"   {op}: {n}")
+
+
+# ============================================
+# Reproducción
+# ============================================
+
+class ClientPool:
+    """Un cliente de Firestore por usuario (cada uno con su token), creado al primer uso."""
+
+    def __init__(self, firestore_module, project, shared=None):
+        self._firestore = firestore_module
+        self._project = project
+        self._shared = shared
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        if self._shared is not None:
+            return self._shared
+        with self._lock:
+            if uid not in self._clients:
+                self._clients[uid] = self._firestore.Client(
+                    project=self._project, credentials=UserCredentials(mock_id_token(self._project, uid)))
+            return self._clients[uid]
+
+
+def select_window(events, offset, duration):
+    end = offset + duration if duration else float('inf')
+    return [e for e in events if offset <= e['t'] < end]
+
+
+def seed(owner, firestore_module, header, events, base_date):
+    """
+    Horarios, usuarios y las reservas/pagos anteriores al tramo que el tramo
+    cancela, marca o revisa. Devuelve {alias: DocumentReference} de estos
+    últimos.
+    """
+    batch = owner.batch()
+    for alias, capacity in header['schedules'].items():
+        batch.set(owner.collection('class_schedules').document(alias),
+                  {'time': '19:00', 'type': 'Replay', 'instructor': 'Replay', 'capacity': capacity,
+                   'daysOfWeek': [1, 2, 3, 4, 5, 6, 7], 'active': True})
+    users = {e['user'] for e in events if e.get('user')}
+    batch.set(owner.collection('users').document(ADMIN), {'name': ADMIN, 'role': 'admin'})
+    batch.commit()
+    for chunk_start in range(0, len(users), 400):
+        batch = owner.batch()
+        for uid in sorted(users)[chunk_start:chunk_start + 400]:
+            batch.set(owner.collection('users').document(uid),
+                      {'name': uid, 'role': 'student', 'membershipStatus': 'active'})
+        batch.commit()
+
+    created = {e['ref'] for e in events if e['op'] in ('book', 'payment_upload')}
+    refs = {}
+    counters = Counter()
+    for event in events:
+        ref = event.get('ref')
+        if not ref or ref in created or ref in refs:
+            continue
+        if event['op'] in ('cancel', 'attend'):
+            class_date = base_date + timedelta(days=event['classDay'])
+            doc = owner.collection('bookings').document(ref)
+            doc.set({'userId': event['user'], 'userName': event['user'], 'scheduleId': event['schedule'],
+                     'classDate': class_date, 'status': 'confirmed',
+                     'createdAt': firestore_module.SERVER_TIMESTAMP})
+            counters[(event['schedule'], class_date)] += 1
+            refs[ref] = doc
+        elif event['op'] == 'payment_review':
+            doc = owner.collection('payments').document(ref)
+            doc.set({'userId': event['user'], 'type': event.get('kind') or 'monthly', 'status': 'pending',
+                     'amount': 0, 'createdAt': firestore_module.SERVER_TIMESTAMP})
+            refs[ref] = doc
+    for (schedule, class_date), n in counters.items():
+        (owner.collection('class_schedules').document(schedule).collection('capacity_tracking')
+         .document(class_date.strftime('%Y-%m-%d'))
+         .set({'currentBookings': n, 'maxCapacity': header['schedules'].get(schedule, 30),
+               'scheduleId': schedule, 'classDate': class_date}))
+    return refs
+
+
+def build_handlers(firestore_module, clients, refs, base_date, max_attempts):
+    """op -> función(evento) que devuelve (outcome, intentos, asiento, error)."""
+    admin = clients.get(ADMIN)
+
+    def class_date_of(event):
+        return base_date + timedelta(days=event['classDay'])
+
+    def book(event):
+        result = book_class(clients.get(event['user']), firestore_module, event['user'],
+                            event['schedule'], class_date_of(event), max_attempts)
+        if result.ref is not None:
+            refs[event['ref']] = result.ref
+        return result.outcome, result.attempts, result.seat, result.error
+
+    def cancel(event):
+        ref = refs.get(event['ref'])
+        if ref is None:
+            return 'skipped', 0, 0, None    # la reserva no se pudo crear (o aún no termina)
+        db = clients.get(event['user'])
+        return cancel_booking(db, firestore_module, db.document(ref.path), 'replay', max_attempts), 0, 0, None
+
+    def attend(event):
+        ref = refs.get(event['ref'])
+        if ref is None:
+            return 'skipped', 0, 0, None
+        admin.document(ref.path).update({'status': 'attended', 'attendedAt': firestore_module.SERVER_TIMESTAMP,
+                                         'attendedBy': ADMIN, 'updatedAt': firestore_module.SERVER_TIMESTAMP})
+        return 'ok', 0, 0, None
+
+    def payment_upload(event):
+        _, ref = clients.get(event['user']).collection('payments').add({
+            'userId': event['user'], 'userName': event['user'], 'type': event.get('kind') or 'monthly',
+            'plan': 'Replay', 'amount': 0, 'status': 'pending',
+            'createdAt': firestore_module.SERVER_TIMESTAMP})
+        refs[event['ref']] = ref
+        return 'ok', 0, 0, None
+
+    def payment_review(event):
+        ref = refs.get(event['ref'])
+        if ref is None:
+            return 'skipped', 0, 0, None
+        admin.document(ref.path).update({'status': event.get('result') or 'approved', 'reviewedBy': ADMIN,
+                                         'reviewedAt': firestore_module.SERVER_TIMESTAMP})
+        return 'ok', 0, 0, None
+
+    def notification(event):
+        clients.get(event['user']).collection('notifications').add({
+            'userId': event['user'], 'fcmToken': 'replay', 'title': 'Replay', 'body': 'Replay', 'data': {},
+            'createdAt': firestore_module.SERVER_TIMESTAMP, 'sent': False})
+        return 'ok', 0, 0, None
+
+    return {'book': book, 'cancel': cancel, 'attend': attend, 'payment_upload': payment_upload,
+            'payment_review': payment_review, 'notification': notification}
+
+
+def replay(events, handlers, speed, offset, workers):
+    """
+    Despacha cada evento en su instante (t - offset) / speed. Devuelve
+    ({op: RushStats}, retrasos del despachador en segundos, duración).
+    """
+    stats = {op: RushStats() for op in {e['op'] for e in events}}
+    lags = []
+    lags_lock = threading.Lock()
+
+    def run(event, due):
+        started = time.perf_counter()
+        with lags_lock:
+            lags.append(started - due)
+        try:
+            outcome, attempts, seat, error = handlers[event['op']](event)
+        except PermissionDenied:
+            outcome, attempts, seat, error = 'denied', 0, 0, None
+        except Exception as e:
+            outcome, attempts, seat, error = 'error', 0, 0, type(e).__name__
+        stats[event['op']].record(outcome, time.perf_counter() - started, attempts, seat, error)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        t0 = time.perf_counter()
+        for event in events:
+            due = t0 + (event['t'] - offset) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, event, due)
+    return stats, lags, time.perf_counter() - t0
+
+
+def check_capacity(owner, header, events, base_date):
+    """[(horario, fecha, reservas, contador, cupo)] de las clases tocadas con algún problema."""
+    problems = []
+    occurrences = {(e['schedule'], e['classDay']) for e in events if e['op'] in ('book', 'cancel')}
+    for schedule, class_day in sorted(occurrences):
+        class_date = base_date + timedelta(days=class_day)
+        booked, counter = verify(owner, schedule, class_date)
+        capacity = header['schedules'].get(schedule, 30)
+        if booked > capacity or counter > capacity or booked != counter:
+            problems.append((schedule, class_date, booked, counter, capacity))
+    return problems, len(occurrences)
+
+
+def run_replay(args):
+    from google.cloud import firestore as firestore_module
+
+    if not SPEED_RANGE[0] <= args.speed <= SPEED_RANGE[1]:
+        print(f"❌ --speed debe estar entre {SPEED_RANGE[0]} y {SPEED_RANGE[1]}")
+        sys.exit(1)
+
+    header, events = read_trace(args.trace)
+    offset = args.offset_hours * 3600
+    events = select_window(events, offset, args.duration_hours * 3600 if args.duration_hours else None)
+    if not events:
+        print("❌ No hay eventos en el tramo pedido")
+        sys.exit(1)
+    span = events[-1]['t'] - offset
+
+    # Las fechas de clase se trasladan para que el tramo empiece hoy
+    start = datetime.fromisoformat(header['start'])
+    today = datetime.now(LOCAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    base_date = today - timedelta(days=((start + timedelta(seconds=offset)).date() - start.date()).days)
+
+    print(f"[1/4] Traza {args.trace}: {len(events)} eventos en {span / 3600:.1f} h "
+          f"desde {start + timedelta(seconds=offset):%a %Y-%m-%d %H:%M}")
+    for op, n in Counter(e['op'] for e in events).most_common():
+        print(f"   {op}: {n}")
+
+    print("\n[2/4] Preparando la base...")
+    if args.fake:
+        from fake_firestore import FakeFirestore
+        owner = FakeFirestore()
+        clients = ClientPool(firestore_module, args.project, shared=owner)
+        print("✅ FakeFirestore en memoria")
+    else:
+        os.environ['FIRESTORE_EMULATOR_HOST'] = args.host
+        try:
+            load_rules(args.host, args.project, args.rules)
+            clear_data(args.host, args.project)
+        except OSError as e:
+            print(f"❌ No se pudo hablar con el emulador en {args.host}: {e}")
+            print("   Inícialo con: firebase emulators:start --only firestore")
+            sys.exit(1)
+        owner = firestore_module.Client(project=args.project)
+        clients = ClientPool(firestore_module, args.project)
+        print(f"✅ Emulador {args.host} con {args.rules}")
+    refs = seed(owner, firestore_module, header, events, base_date)
+    print(f"✅ {len(header['schedules'])} horarios, {len({e['user'] for e in events})} usuarios, "
+          f"{len(refs)} reservas/pagos previos al tramo\n")
+
+    print(f"[3/4] Reproduciendo a {args.speed:g}x (~{span / args.speed:.0f}s)...")
+    handlers = build_handlers(firestore_module, clients, refs, base_date, args.max_attempts)
+    stats, lags, wall = replay(events, handlers, args.speed, offset, args.workers)
+    print(f"✅ Terminado en {wall:.1f}s\n")
+
+    print("[4/4] Resultado")
+    print(f"{'Operación':<16} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  Resultados")
+    result = {'trace': args.trace, 'speed': args.speed, 'offsetHours': args.offset_hours,
+              'events': len(events), 'wallSeconds': round(wall, 3), 'operations': {}}
+    for op, op_stats in sorted(stats.items()):
+        latencies_ms = [latency * 1000 for latency in op_stats.latencies]
+        aborts = sum((attempts - 1) * n for attempts, n in op_stats.attempts.items())
+        row = {'count': len(latencies_ms), 'outcomes': dict(op_stats.outcomes), 'aborts': aborts,
+               'p50': round(percentile(latencies_ms, 0.50), 1),
+               'p95': round(percentile(latencies_ms, 0.95), 1),
+               'p99': round(percentile(latencies_ms, 0.99), 1),
+               'errors': dict(op_stats.errors)}
+        result['operations'][op] = row
+        outcomes = ', '.join(f'{k}: {v}' for k, v in op_stats.outcomes.most_common())
+        print(f"{op:<16} {row['count']:>6} {row['p50']:>8} {row['p95']:>8} {row['p99']:>8}  {outcomes}"
+              + (f" (abortos: {aborts})" if aborts else ""))
+
+    lags_ms = [lag * 1000 for lag in lags]
+    result['dispatchLagMs'] = {'p50': round(percentile(lags_ms, 0.50), 1),
+                               'p99': round(percentile(lags_ms, 0.99), 1),
+                               'max': round(max(lags_ms), 1)}
+    result['scheduledRate'] = round(len(events) / (span / args.speed), 2) if span else None
+    result['achievedRate'] = round(len(events) / wall, 2) if wall else None
+    print(f"\n  Ritmo: {result['achievedRate']} ops/s (traza: {result['scheduledRate']} ops/s)")
+    print(f"  Retraso del despachador ms: p50 {result['dispatchLagMs']['p50']}  "
+          f"p99 {result['dispatchLagMs']['p99']}  máx {result['dispatchLagMs']['max']}")
+    if result['dispatchLagMs']['p99'] > 1000:
+        print("  ⚠️  El despachador se atrasa: sube --workers o baja --speed")
+
+    problems, checked = check_capacity(owner, header, events, base_date)
+    result['capacityProblems'] = [{'schedule': s, 'date': f'{d:%Y-%m-%d}', 'booked': b, 'counter': c,
+                                   'capacity': cap} for s, d, b, c, cap in problems]
+    for schedule, class_date, booked, counter, capacity in problems:
+        print(f"  ❌ {schedule} {class_date:%Y-%m-%d}: {booked} reservas, contador {counter}, cupo {capacity}")
+    if not problems:
+        print(f"  ✅ Cupo respetado y contadores consistentes en {checked} clases")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Resultado guardado en {args.output}")
+
+    if problems:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Captura y reproducción de la traza real de tráfico')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    cap = sub.add_parser('capture', help='Deriva una traza anonimizada de producción')
+    cap.add_argument('--days', type=int, default=28, help='Días hacia atrás (o desde --since) (default 28)')
+    cap.add_argument('--since', help='Inicio de la ventana YYYY-MM-DD (hora local)')
+    cap.add_argument('--until', help='Fin de la ventana YYYY-MM-DD (default: --since + --days)')
+    cap.add_argument('--output', default='traza.ndjson.gz', help='Archivo de la traza (default: %(default)s)')
+    cap.add_argument('--service-account', help='Ruta al service account JSON')
+
+    rep = sub.add_parser('replay', help='Reproduce una traza contra el emulador')
+    rep.add_argument('trace', help='Archivo de la traza (capture)')
+    rep.add_argument('--speed', type=float, default=10, help='Aceleración 1-100 (default 10)')
+    rep.add_argument('--offset-hours', type=float, default=0, help='Empezar en esta hora de la traza')
+    rep.add_argument('--duration-hours', type=float, help='Reproducir solo estas horas de la traza')
+    rep.add_argument('--workers', type=int, default=64, help='Operaciones en vuelo como máximo (default 64)')
+    rep.add_argument('--max-attempts', type=int, default=5, help='Intentos por transacción (default 5)')
+    rep.add_argument('--rules', default='firestore.rules', help='Reglas a cargar en el emulador')
+    rep.add_argument('--project', default=DEFAULT_PROJECT, help='Proyecto del emulador (default: %(default)s)')
+    rep.add_argument('--host', default=os.environ.get('FIRESTORE_EMULATOR_HOST', DEFAULT_EMULATOR_HOST),
+                     help='Host del emulador (default: FIRESTORE_EMULATOR_HOST o %(default)s)')
+    rep.add_argument('--fake', action='store_true', help='Reproducir en memoria (FakeFirestore)')
+    rep.add_argument('--output', help='Guardar el resultado en JSON')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"TRAZA DE TRÁFICO ({args.command.upper()})")
+    print("=" * 60 + "\n")
+
+    if args.command == 'capture':
+        run_capture(args)
+    else:
+        run_replay(args)
+
+
+if __name__ == '__main__':
+    main()
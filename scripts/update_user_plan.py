@@ -1,79 +1,85 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Script para actualizar el plan de un usuario
+Script para actualizar el plan de uno o muchos usuarios
+
+Modo individual: un usuario por ejecución.
+Modo masivo (--csv): un CSV con columnas `email,plan`. Los planes activos se
+cargan una sola vez en memoria, los usuarios se resuelven con queries `in`
+sobre email en lotes de 30 y todas las actualizaciones (incluido el
+DELETE_FIELD de classesPerMonth para planes ilimitados) van por BulkWriter.
 
 Uso:
   python scripts/update_user_plan.py [email] [plan_name]
+  python scripts/update_user_plan.py --csv planes.csv [--dry-run]
 
 Ejemplos:
   python scripts/update_user_plan.py usuario@example.com "Plan Iniciado"
   python scripts/update_user_plan.py usuario@example.com "Plan Peleador"
+  python scripts/update_user_plan.py --csv migracion_precios.csv
 """
 
+import argparse
+import csv
 import sys
-import io
-import os
-import firebase_admin
-from firebase_admin import credentials
+
 from firebase_admin import firestore
 
-# Fix encoding for Windows
-if sys.platform == 'win32':
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+from firebase_common import IN_QUERY_LIMIT, bulk_writer, chunked, fix_windows_encoding, init_firestore
 
-def main():
-    if len(sys.argv) < 3:
-        print("Uso: python scripts/update_user_plan.py [email] [plan_name]")
-        print("\nEjemplos:")
-        print('  python scripts/update_user_plan.py usuario@example.com "Plan Iniciado"')
-        print('  python scripts/update_user_plan.py usuario@example.com "Plan Peleador"')
-        sys.exit(1)
+fix_windows_encoding()
 
-    user_email = sys.argv[1]
-    plan_name = sys.argv[2]
 
-    print(f"Actualizando usuario: {user_email}")
-    print(f"Plan: {plan_name}\n")
+def load_plans(db):
+    """Nombre de plan -> (plan_id, classesPerMonth) de todos los planes activos."""
+    plans = {}
+    for plan_doc in db.collection('plans').where('active', '==', True).get():
+        plan_data = plan_doc.to_dict()
+        plans[plan_data.get('name')] = (plan_doc.id, plan_data.get('classesPerMonth'))
+    return plans
 
-    # Determinar ruta del service account
-    service_account_path = None
-    if 'FIREBASE_SERVICE_ACCOUNT' in os.environ:
-        service_account_path = os.environ['FIREBASE_SERVICE_ACCOUNT']
+
+def build_update(plan_id, plan_name, classes_per_month):
+    update_data = {
+        'planId': plan_id,
+        'planName': plan_name,
+        'membershipStatus': 'active',
+        'updatedAt': firestore.SERVER_TIMESTAMP,
+    }
+
+    if classes_per_month is not None:
+        update_data['classesPerMonth'] = classes_per_month
     else:
-        service_account_path = 'scripts/firebase-service-account.json'
+        # Plan ilimitado - eliminar el campo
+        update_data['classesPerMonth'] = firestore.DELETE_FIELD
+    return update_data
 
-    if not os.path.exists(service_account_path):
-        print(f'ERROR: No se encontró el archivo: {service_account_path}')
-        sys.exit(1)
 
-    # Inicializar Firebase
-    try:
-        cred = credentials.Certificate(service_account_path)
-        firebase_admin.initialize_app(cred)
-        print("✅ Firebase inicializado\n")
-    except Exception as e:
-        print(f"❌ Error al inicializar Firebase: {e}")
-        sys.exit(1)
+def resolve_users(db, emails):
+    """Email -> user_id usando queries `in` por lotes."""
+    found = {}
+    for batch in chunked(sorted(set(emails)), IN_QUERY_LIMIT):
+        for user_doc in db.collection('users').where('email', 'in', batch).select(['email']).get():
+            found[user_doc.get('email')] = user_doc.id
+    return found
 
-    db = firestore.client()
+
+def update_single(db, user_email, plan_name):
+    print(f"Actualizando usuario: {user_email}")
+    print(f"Plan: {plan_name}\n")
 
     # Buscar el plan
     print(f"Buscando plan '{plan_name}'...")
-    plans_query = db.collection('plans').where('name', '==', plan_name).where('active', '==', True).limit(1).get()
+    plans = load_plans(db)
 
-    if not plans_query:
+    if plan_name not in plans:
         print(f"❌ Plan '{plan_name}' no encontrado")
         print("\nPlanes disponibles:")
-        all_plans = db.collection('plans').where('active', '==', True).get()
-        for plan in all_plans:
-            print(f"  - {plan.get('name')}")
+        for name in sorted(plans):
+            print(f"  - {name}")
         sys.exit(1)
 
-    plan_doc = plans_query[0]
-    plan_data = plan_doc.to_dict()
-    plan_id = plan_doc.id
-    classes_per_month = plan_data.get('classesPerMonth')
+    plan_id, classes_per_month = plans[plan_name]
 
     print(f"✅ Plan encontrado:")
     print(f"   ID: {plan_id}")
@@ -95,21 +101,9 @@ def main():
     # Actualizar el usuario
     print(f"\nActualizando usuario...")
 
-    update_data = {
-        'planId': plan_id,
-        'planName': plan_name,
-        'membershipStatus': 'active',
-        'updatedAt': firestore.SERVER_TIMESTAMP,
-    }
-
-    if classes_per_month is not None:
-        update_data['classesPerMonth'] = classes_per_month
-    else:
-        # Plan ilimitado - eliminar el campo
-        update_data['classesPerMonth'] = firestore.DELETE_FIELD
-
     try:
-        db.collection('users').document(user_id).update(update_data)
+        db.collection('users').document(user_id).update(
+            build_update(plan_id, plan_name, classes_per_month))
         print(f"✅ Usuario actualizado exitosamente")
         print(f"\nResumen:")
         print(f"  Usuario: {user_email}")
@@ -120,5 +114,81 @@ def main():
         print(f"❌ Error al actualizar usuario: {e}")
         sys.exit(1)
 
+
+def update_from_csv(db, csv_path, dry_run):
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        rows = [(row['email'].strip(), row['plan'].strip())
+                for row in csv.DictReader(f) if row.get('email') and row.get('plan')]
+    print(f"[1/3] {len(rows)} filas leídas de {csv_path}")
+
+    plans = load_plans(db)
+    unknown_plans = sorted({plan for _, plan in rows if plan not in plans})
+    print(f"✅ {len(plans)} planes activos en caché")
+    if unknown_plans:
+        print(f"❌ Planes no encontrados: {', '.join(unknown_plans)}")
+        print("\nPlanes disponibles:")
+        for name in sorted(plans):
+            print(f"  - {name}")
+        sys.exit(1)
+
+    print(f"\n[2/3] Resolviendo usuarios por email (lotes de {IN_QUERY_LIMIT})...")
+    users = resolve_users(db, [email for email, _ in rows])
+    missing = [email for email, _ in rows if email not in users]
+    print(f"✅ {len(users)} usuarios encontrados")
+    for email in missing:
+        print(f"  ⚠️  No encontrado: {email}")
+
+    print(f"\n[3/3] {'Simulando' if dry_run else 'Aplicando'} actualizaciones...")
+    if dry_run:
+        for email, plan_name in rows:
+            if email in users:
+                classes = plans[plan_name][1]
+                print(f"  - {email} -> {plan_name} ({classes if classes else 'ilimitado'} clases/mes)")
+        print('\nDry-run terminado. Ejecuta sin --dry-run para aplicar.')
+        return
+
+    writer = bulk_writer(db)
+    updated = 0
+    for email, plan_name in rows:
+        if email not in users:
+            continue
+        plan_id, classes_per_month = plans[plan_name]
+        writer.update(db.collection('users').document(users[email]),
+                      build_update(plan_id, plan_name, classes_per_month))
+        updated += 1
+    writer.close()
+
+    for failure in writer.failures:
+        print(f"  ❌ Error actualizando {failure.operation.reference.id}: {failure.message}")
+    print(f"\n✅ Usuarios actualizados: {updated - len(writer.failures)}")
+    print(f"⚠️  No encontrados: {len(missing)}")
+    if writer.failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Actualizar el plan de usuarios')
+    parser.add_argument('email', nargs='?')
+    parser.add_argument('plan_name', nargs='?')
+    parser.add_argument('--csv', help='CSV con columnas email,plan (modo masivo)')
+    parser.add_argument('--dry-run', action='store_true', help='Modo masivo: solo mostrar')
+    args = parser.parse_args()
+
+    if not args.csv and not (args.email and args.plan_name):
+        print("Uso: python scripts/update_user_plan.py [email] [plan_name]")
+        print("     python scripts/update_user_plan.py --csv planes.csv [--dry-run]")
+        print("\nEjemplos:")
+        print('  python scripts/update_user_plan.py usuario@example.com "Plan Iniciado"')
+        print('  python scripts/update_user_plan.py usuario@example.com "Plan Peleador"')
+        sys.exit(1)
+
+    db = init_firestore()
+
+    if args.csv:
+        update_from_csv(db, args.csv, args.dry_run)
+    else:
+        update_single(db, args.email, args.plan_name)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contadores mensuales de uso de clases por usuario.
+
+fix_user_classespermonth.py y update_user_plan.py mantienen el límite
+(classesPerMonth), pero "clases usadas este mes" se recalcula desde
+`bookings` cada vez que se necesita. Este script mantiene:
+
+  users/{userId}/usage/{yyyy-mm}
+    counts:    {confirmed: n, attended: n, cancelled: n, noShow: n, ...}
+    total:     n
+    month:     'yyyy-mm'
+    userId:    ...
+    updatedAt: SERVER_TIMESTAMP
+
+counts.confirmed es el mismo número que getUserBookedClassesThisMonth
+(reservas 'confirmed' con classDate en el mes), así que la verificación de
+cupo pasa a ser la lectura de un solo doc chico.
+
+Comandos:
+  rebuild  Una pasada agrupada sobre bookings (proyección userId/classDate/
+           status) que reescribe todos los contadores y borra los que ya no
+           tienen reservas. Guarda la marca de agua en config/usage_counters.
+  sync     Incremental: busca bookings creadas/modificadas desde la marca de
+           agua y recalcula solo los pares (usuario, mes) afectados.
+
+sync NO ve las reservas borradas (no dejan timestamp). Los scripts de este
+directorio que borran bookings lo compensan: clean_non_admin_users.py y
+delete_all_users_except_admin.py borran también users/{id}/usage, y
+referential_check.py --fix llama a refresh() con los pares de las reservas
+que borró. Cualquier otro borrado (consola, scripts ad hoc) deja el
+contador alto hasta el próximo rebuild: programar sync cada pocos minutos Y
+rebuild periódico (p.ej. semanal).
+
+Uso:
+  python scripts/usage_counters.py rebuild       # p.ej. semanal por cron
+  python scripts/usage_counters.py sync          # p.ej. cada 5 minutos por cron
+"""
+
+import argparse
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+
+from firebase_common import (LOCAL_TZ, WATERMARK_OVERLAP, bulk_writer, fix_windows_encoding, init_firestore,
+                             iter_docs, local_date, read_watermark, write_watermark)
+
+WATERMARK_ID = 'usage_counters'
+
+fix_windows_encoding()
+
+
+def month_key(class_date):
+    return local_date(class_date).strftime('%Y-%m')
+
+
+def booking_pair(booking):
+    """(userId, mes) del contador al que aporta una reserva, o None."""
+    if booking.get('userId') and booking.get('classDate'):
+        return booking['userId'], month_key(booking['classDate'])
+    return None
+
+
+def month_range(key):
+    """[inicio, inicio del mes siguiente) en hora local."""
+    year, month = (int(x) for x in key.split('-'))
+    start = datetime(year, month, 1, tzinfo=LOCAL_TZ)
+    end = datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=LOCAL_TZ)
+    return start, end
+
+
+def usage_ref(db, user_id, key):
+    return db.collection('users').document(user_id).collection('usage').document(key)
+
+
+def counter_doc(user_id, key, counts):
+    return {
+        'userId': user_id,
+        'month': key,
+        'counts': dict(counts),
+        'total': sum(counts.values()),
+        'updatedAt': firestore.SERVER_TIMESTAMP,
+    }
+
+
+def rebuild(db):
+    started = datetime.now(timezone.utc)
+
+    print("[1/3] Agrupando bookings por (usuario, mes)...")
+    counters = defaultdict(Counter)
+    scanned = 0
+    query = db.collection('bookings').select(['userId', 'classDate', 'status'])
+    for doc in iter_docs(query):
+        b = doc.to_dict() or {}
+        scanned += 1
+        if not b.get('userId') or not b.get('classDate'):
+            continue
+        counters[(b['userId'], month_key(b['classDate']))][b.get('status', 'unknown')] += 1
+    print(f"✅ {scanned} bookings → {len(counters)} contadores\n")
+
+    print("[2/3] Escribiendo contadores...")
+    writer = bulk_writer(db)
+    for (user_id, key), counts in counters.items():
+        writer.set(usage_ref(db, user_id, key), counter_doc(user_id, key, counts))
+
+    # Contadores de meses que ya no tienen reservas (p.ej. usuarios purgados)
+    stale = 0
+    for doc in db.collection_group('usage').select([]).stream():
+        user_id = doc.reference.parent.parent.id
+        if (user_id, doc.id) not in counters:
+            writer.delete(doc.reference)
+            stale += 1
+    writer.close()
+    print(f"✅ {len(counters)} escritos, {stale} obsoletos eliminados\n")
+
+    print("[3/3] Guardando marca de agua...")
+    if writer.failures:
+        print("⚠️  Hubo escrituras fallidas: la marca de agua no avanza")
+    else:
+        write_watermark(db, WATERMARK_ID, started)
+        print(f"✅ lastSyncAt = {started:%Y-%m-%d %H:%M:%S} UTC\n")
+    return writer.failures
+
+
+def changed_pairs(db, since):
+    """Pares (userId, mes) con bookings creadas o modificadas desde `since`."""
+    pairs = set()
+    for field in ('createdAt', 'updatedAt'):
+        query = (db.collection('bookings')
+                 .where(field, '>=', since)
+                 .select(['userId', 'classDate']))
+        for doc in query.stream():
+            pair = booking_pair(doc.to_dict() or {})
+            if pair:
+                pairs.add(pair)
+    return pairs
+
+
+def recount(db, user_id, key):
+    start, end = month_range(key)
+    query = (db.collection('bookings')
+             .where('userId', '==', user_id)
+             .where('classDate', '>=', start)
+             .where('classDate', '<', end)
+             .select(['status']))
+    return Counter((doc.to_dict() or {}).get('status', 'unknown') for doc in query.stream())
+
+
+def refresh(db, pairs):
+    """
+    Recalcula (o borra, si quedaron sin reservas) los contadores de `pairs`.
+    Lo usan sync y los scripts que borran bookings. Devuelve las fallas.
+    """
+    writer = bulk_writer(db)
+    for user_id, key in sorted(pairs):
+        counts = recount(db, user_id, key)
+        if counts:
+            writer.set(usage_ref(db, user_id, key), counter_doc(user_id, key, counts))
+        else:
+            writer.delete(usage_ref(db, user_id, key))
+    writer.close()
+    return writer.failures
+
+
+def sync(db):
+    started = datetime.now(timezone.utc)
+    watermark = read_watermark(db, WATERMARK_ID)
+    if watermark is None:
+        print("❌ No hay marca de agua: ejecuta primero 'rebuild'")
+        sys.exit(1)
+
+    since = watermark - WATERMARK_OVERLAP
+    print(f"[1/3] Bookings cambiadas desde {since:%Y-%m-%d %H:%M:%S} UTC...")
+    pairs = changed_pairs(db, since)
+    print(f"✅ {len(pairs)} contadores afectados\n")
+
+    print("[2/3] Recalculando contadores afectados...")
+    failures = refresh(db, pairs)
+    print(f"✅ {len(pairs) - len(failures)} actualizados\n")
+
+    print("[3/3] Guardando marca de agua...")
+    if failures:
+        print("⚠️  Hubo escrituras fallidas: la marca de agua no avanza")
+    else:
+        write_watermark(db, WATERMARK_ID, started)
+        print(f"✅ lastSyncAt = {started:%Y-%m-%d %H:%M:%S} UTC\n")
+    return failures
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('service_account', nargs='?', help='Ruta al service account JSON')
+
+    parser = argparse.ArgumentParser(description='Contadores mensuales de uso de clases')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('rebuild', parents=[common], help='Reconstruye todos los contadores')
+    sub.add_parser('sync', parents=[common], help='Actualiza solo lo cambiado desde la marca de agua')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("CONTADORES MENSUALES DE USO")
+    print("=" * 60 + "\n")
+
+    db = init_firestore(args.service_account)
+    failures = rebuild(db) if args.command == 'rebuild' else sync(db)
+
+    for failure in failures:
+        print(f"  ❌ {failure.operation.reference.path}: {failure.message}")
+    if failures:
+        sys.exit(1)
+    print("✅ Listo")
+
+
+if __name__ == '__main__':
+    main()